@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmark showing the query plans and the timings of the hot queries
+# on a synthetic database with and without the secondary indexes.
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from datetime import timedelta
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks import models, orm
+from globaleaks.utils.utility import datetime_now, uuid4
+
+
+RECEIVERS = 10
+
+QUERIES = [
+    ('receiver tip list',
+     'SELECT id FROM receivertip WHERE receiver_id = :receiver_id'),
+    ('tip receiver tips',
+     'SELECT id FROM receivertip WHERE internaltip_id = :internaltip_id'),
+    ('tenant tips',
+     'SELECT count(*) FROM internaltip WHERE tid = :tid'),
+    ('expired tips',
+     'SELECT id FROM internaltip WHERE expiration_date < :date'),
+    ('tip files',
+     'SELECT id FROM internalfile WHERE internaltip_id = :internaltip_id'),
+    ('delivery new files',
+     'SELECT id FROM internalfile WHERE new = 1'),
+    ('receiver tip files',
+     'SELECT id FROM receiverfile WHERE receivertip_id = :receivertip_id'),
+    ('tip comments',
+     'SELECT id FROM comment WHERE internaltip_id = :internaltip_id'),
+    ('receiver tip messages',
+     'SELECT id FROM message WHERE receivertip_id = :receivertip_id'),
+    ('tip answers',
+     'SELECT id FROM fieldanswer WHERE internaltip_id = :internaltip_id'),
+    ('mail spool',
+     'SELECT id FROM mail WHERE next_attempt <= :date ORDER BY priority DESC, next_attempt LIMIT 100'),
+]
+
+
+def populate(engine, tips):
+    now = datetime_now()
+    receivers = [uuid4() for _ in range(RECEIVERS)]
+
+    itips, rtips, ifiles, rfiles, comments, messages, answers, mails = [], [], [], [], [], [], [], []
+
+    for i in range(tips):
+        itip_id, rtip_id, ifile_id = uuid4(), uuid4(), uuid4()
+
+        itips.append({'id': itip_id,
+                      'tid': 1 + i % 5,
+                      'context_id': u'context',
+                      'questionnaire_hash': u'hash',
+                      'preview': {},
+                      'expiration_date': now + timedelta(days=i % 365),
+                      'receipt_hash': u'receipt'})
+
+        rtips.append({'id': rtip_id, 'internaltip_id': itip_id, 'receiver_id': receivers[i % RECEIVERS]})
+
+        ifiles.append({'id': ifile_id,
+                       'internaltip_id': itip_id,
+                       'name': u'file',
+                       'file_path': u'path',
+                       'content_type': u'application/octet-stream',
+                       'size': 0,
+                       'new': i % 1000 == 0})
+
+        rfiles.append({'internalfile_id': ifile_id, 'receivertip_id': rtip_id, 'file_path': u'path', 'size': 0, 'status': u'reference'})
+        comments.append({'internaltip_id': itip_id, 'content': u'comment', 'type': u'receiver'})
+        messages.append({'receivertip_id': rtip_id, 'content': u'message', 'type': u'receiver'})
+        answers.append({'internaltip_id': itip_id, 'key': u'key', 'value': u'value'})
+        mails.append({'address': u'receiver@example.net',
+                      'subject': u'subject',
+                      'body': u'body',
+                      'priority': i % 3,
+                      'next_attempt': now if i % 100 == 0 else now + timedelta(days=30)})
+
+    for model, rows in [(models.InternalTip, itips),
+                        (models.ReceiverTip, rtips),
+                        (models.InternalFile, ifiles),
+                        (models.ReceiverFile, rfiles),
+                        (models.Comment, comments),
+                        (models.Message, messages),
+                        (models.FieldAnswer, answers),
+                        (models.Mail, mails)]:
+        engine.execute(model.__table__.insert(), rows)
+
+    return {
+        'receiver_id': receivers[0],
+        'internaltip_id': itips[tips // 2]['id'],
+        'receivertip_id': rtips[tips // 2]['id'],
+        'tid': 1,
+        'date': now + timedelta(days=7)
+    }
+
+
+def run(engine, params, repeat):
+    for name, query in QUERIES:
+        plan = ' | '.join(list(row)[-1] for row in engine.execute(text('EXPLAIN QUERY PLAN ' + query), **params))
+
+        start = time.time()
+        for _ in range(repeat):
+            engine.execute(text(query), **params).fetchall()
+        elapsed = (time.time() - start) * 1000 / repeat
+
+        print("  %-22s %9.3f ms  %s" % (name, elapsed, plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Secondary indexes benchmark")
+    parser.add_argument("-t", "--tips", type=int, default=100000)
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+
+    try:
+        engine = orm.get_engine(orm.make_db_uri(os.path.join(workdir, 'bench.db')), foreign_keys=False)
+        models.Base.metadata.create_all(engine)
+
+        print("Populating the database with %d tips..." % args.tips)
+        params = populate(engine, args.tips)
+
+        indexes = [index for table in models.Base.metadata.sorted_tables for index in table.indexes]
+
+        for index in indexes:
+            index.drop(engine)
+
+        engine.execute('ANALYZE')
+        print("Before (no secondary indexes):")
+        run(engine, params, args.repeat)
+
+        for index in indexes:
+            index.create(engine)
+
+        engine.execute('ANALYZE')
+        print("After (%d secondary indexes):" % len(indexes))
+        run(engine, params, args.repeat)
+
+        engine.dispose()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Micro-benchmark comparing the transactions/sec obtained by creating a new
+# engine for every transaction with the ones obtained using the shared engine.
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.orm import sessionmaker
+
+from globaleaks import models, orm
+
+
+def per_transaction_engine_session():
+    return sessionmaker(bind=orm.get_engine())()
+
+
+def shared_engine_session():
+    return orm.get_session()
+
+
+def run(get_session, count):
+    start = time.time()
+
+    for i in range(count):
+        session = get_session()
+        try:
+            session.query(models.Counter).filter(models.Counter.tid == 1).count()
+            session.commit()
+        finally:
+            session.close()
+
+    return count / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM engine micro-benchmark")
+    parser.add_argument("-n", "--transactions", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+
+    try:
+        orm.set_db_uri(orm.make_db_uri(os.path.join(workdir, 'bench.db')))
+        models.Base.metadata.create_all(orm.get_shared_engine())
+
+        for name, get_session in [('engine per transaction', per_transaction_engine_session),
+                                  ('shared engine', shared_engine_session)]:
+            print("%-24s %10.1f transactions/sec" % (name, run(get_session, args.transactions)))
+    finally:
+        orm.dispose_engines()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Micro-benchmark comparing the mails/sec and the MB/s of file encryption
+# obtained with the gnupg backend with the ones of the native backend.
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks.settings import Settings
+from globaleaks.utils.pgp import NativePGPBackend, PGPKeyring
+
+KEY_PATH = os.path.join(os.path.dirname(__file__), '..', 'globaleaks', 'tests', 'data', 'gpg', 'VALID_PGP_KEY1_PUB')
+
+
+def bench_mails(backend, key, count):
+    body = u'Mail body ' * 100
+
+    start = time.time()
+
+    for i in range(count):
+        backend.encrypt_message(key, body)
+
+    return count / (time.time() - start)
+
+
+def bench_file(backend, key, plaintext_path, workdir):
+    output_path = os.path.join(workdir, 'encrypted')
+
+    start = time.time()
+
+    with open(plaintext_path, 'rb') as f:
+        backend.encrypt_file(key, f, output_path)
+
+    elapsed = time.time() - start
+
+    os.remove(output_path)
+
+    return os.stat(plaintext_path).st_size / elapsed / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PGP backends micro-benchmark")
+    parser.add_argument("-n", "--mails", type=int, default=200)
+    parser.add_argument("-s", "--size", type=int, default=64, help="size in MB of the encrypted file")
+    args = parser.parse_args()
+
+    with open(KEY_PATH) as f:
+        key = f.read()
+
+    workdir = tempfile.mkdtemp()
+    Settings.tmp_path = workdir
+
+    try:
+        plaintext_path = os.path.join(workdir, 'plaintext')
+        with open(plaintext_path, 'wb') as f:
+            for i in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+
+        gnupg = PGPKeyring()
+
+        for name, backend in [('gnupg', gnupg),
+                              ('native', NativePGPBackend(gnupg))]:
+            print("%-8s %10.1f mails/sec %10.1f MB/s" % (name,
+                                                          bench_mails(backend, key, args.mails),
+                                                          bench_file(backend, key, plaintext_path, workdir)))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
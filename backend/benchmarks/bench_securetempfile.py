@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Micro-benchmark comparing the MB/s obtained decrypting a SecureTemporaryFile
+# to disk with 4096 bytes reads with the ones of the buffered pipeline.
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+
+
+def read_loop_copy(sf, destination):
+    with sf.open('r') as encrypted_file, open(destination, 'wb') as plaintext_file:
+        while True:
+            chunk = encrypted_file.read(4096)
+            if not chunk:
+                break
+
+            plaintext_file.write(chunk)
+
+
+def pipeline_copy(sf, destination):
+    with sf.open('r') as encrypted_file, open(destination, 'wb') as plaintext_file:
+        encrypted_file.copy_to(plaintext_file)
+
+
+def run(copy, sf, size, workdir):
+    destination = os.path.join(workdir, 'plaintext')
+
+    start = time.time()
+    copy(sf, destination)
+    elapsed = time.time() - start
+
+    os.remove(destination)
+
+    return size / elapsed / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SecureTemporaryFile decryption micro-benchmark")
+    parser.add_argument("-s", "--sizes", type=int, nargs='+', default=[1, 16, 256, 2048],
+                        help="sizes in MB of the benchmarked files")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+
+    try:
+        block = os.urandom(1024 * 1024)
+
+        for size in args.sizes:
+            sf = SecureTemporaryFile(workdir)
+            with sf.open('w') as f:
+                for i in range(size):
+                    f.write(block)
+
+                f.finalize_write()
+
+            for name, copy in [('4096 bytes reads', read_loop_copy),
+                               ('pipeline', pipeline_copy)]:
+                print("%6d MB %-18s %10.1f MB/s" % (size, name, run(copy, sf, size * 1024 * 1024, workdir)))
+
+            del sf
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Benchmark comparing the notifications rendered per second by the
+# replace based templating with the ones of the precompiled templates.
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks.utils.templating import Templating, supported_template_types
+from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601, uuid4
+
+APPDATA = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../client/app/data/appdata.json'))
+
+# tip template including the answers of the questionnaire as configured by many tenants
+DETAILED_TIP_TEMPLATE = u'''Dear {RecipientName},
+
+a new submission has been received on {NodeName} for the context {ContextName}.
+
+Submission date: {SubmissionDate}
+
+{QuestionnaireAnswers}
+
+The submission can be accessed:
+via Tor at: {TorUrl}
+via HTTPS at: {HTTPSUrl}
+
+Kind regards,
+{NodeName}'''
+
+
+def legacy_format_template(raw_template, data):
+    keyword_converter = supported_template_types[data['type']](data)
+    for _ in range(3):
+        count = 0
+
+        for kw in keyword_converter.keyword_list:
+            if raw_template.count(kw):
+                variable_content = getattr(keyword_converter, kw[1:-1])()
+                raw_template = raw_template.replace(kw, variable_content)
+
+                count += 1
+
+        raw_template = raw_template.replace('\n{Blank}\n', '\n')
+        raw_template = raw_template.replace('\n{Blank}', '')
+        raw_template = raw_template.rstrip()
+
+        if count == 0:
+            break
+
+    return raw_template
+
+
+def get_notification():
+    with open(APPDATA) as f:
+        templates = json.load(f)['templates']
+
+    notification = {key: value['en'] for key, value in templates.items()}
+    notification['tip_mail_template'] = DETAILED_TIP_TEMPLATE
+
+    return notification
+
+
+def get_events(count):
+    now = datetime_to_ISO8601(datetime_now())
+
+    node = {
+        'name': u'GlobaLeaks',
+        'onionservice': u'aaaaaaaaaaaaaaaa.onion',
+        'hostname': u'www.example.org',
+        'widget_comments_title': u'Comments',
+        'widget_messages_title': u'Messages'
+    }
+
+    context = {'name': u'Context'}
+
+    steps = []
+    answers = {}
+    for s in range(3):
+        fields = []
+        for i in range(10):
+            field_id = uuid4()
+            fields.append({'id': field_id, 'type': 'inputbox', 'label': u'Question %d' % i,
+                           'x': 0, 'y': i, 'options': [], 'children': []})
+            answers[field_id] = [{'value': u'Answer to the question %d of the step %d' % (i, s)}]
+
+        steps.append({'label': u'Step %d' % s, 'presentation_order': s, 'children': fields})
+
+    notification = get_notification()
+
+    events = []
+    for i in range(count):
+        tip = {
+            'id': uuid4(),
+            'sequence_number': u'%d' % i,
+            'label': u'Label' if i % 2 else u'',
+            'creation_date': now,
+            'questionnaire': steps,
+            'answers': answers
+        }
+
+        event = {
+            'type': ('tip', 'comment', 'file')[i % 3],
+            'node': node,
+            'context': context,
+            'notification': notification,
+            'user': {'name': u'Recipient'},
+            'tip': tip,
+            'comment': {'creation_date': now},
+            'file': {'name': u'document.pdf', 'creation_date': now, 'size': 1000000}
+        }
+
+        events.append(event)
+
+    return events
+
+
+def render(format_template, data):
+    prefix = '{TipNum} [{TipLabel}] ' if data['tip']['label'] else '{TipNum} '
+
+    return (format_template(prefix + data['notification'][data['type'] + '_mail_title'], data),
+            format_template(data['notification'][data['type'] + '_mail_template'], data))
+
+
+def run(name, format_template, events):
+    start = time.time()
+    for data in events:
+        render(format_template, data)
+
+    elapsed = time.time() - start
+
+    print("%-12s %8.0f mails/s" % (name, len(events) / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mail templating benchmark")
+    parser.add_argument("-n", "--notifications", type=int, default=30000)
+    args = parser.parse_args()
+
+    events = get_events(args.notifications)
+
+    for data in events[:3]:
+        assert render(legacy_format_template, data) == render(Templating().format_template, data)
+
+    run('replace', legacy_format_template, events)
+    run('precompiled', Templating().format_template, events)
+
+
+if __name__ == '__main__':
+    main()
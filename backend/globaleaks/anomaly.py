@@ -75,7 +75,7 @@ def generate_admin_alert_mail(session, tid, alert):
 
         subject, body = Templating().get_mail_subject_and_body(data)
 
-        db_schedule_email(session, tid, user_desc['mail_address'], subject, body)
+        db_schedule_email(session, tid, user_desc['mail_address'], subject, body, models.Mail.PRIORITY_ALERT)
 
 
 @transact
@@ -222,7 +222,7 @@ class Alarm(object):
                      old_accept_submissions, accept_submissions)
 
             # Must invalidate the cache here becuase accept_subs served in /public has changed
-            ApiCache.invalidate()
+            ApiCache.invalidate(resources=['/public'])
 
 
 @inlineCallbacks
@@ -15,11 +15,14 @@ import globaleaks.mocks.twisted_mocks # pylint: disable=W0611
 
 from globaleaks.db import create_db, init_db, update_db, \
     sync_refresh_memory_variables, sync_clean_untracked_files
+from globaleaks.handlers.staticfile import StaticFileIndex
 from globaleaks.rest.api import APIResourceWrapper
+from globaleaks.rest.apicache import schedule_warmup
 from globaleaks.settings import Settings
 from globaleaks.state import State
 from globaleaks.utils.process import disable_swap
 from globaleaks.utils.sock import listen_tcp_on_sock, reserve_port_for_ip
+from globaleaks.utils.upload import UploadRequest
 from globaleaks.utils.utility import fix_file_permissions, drop_privileges, log, timedLogFormatter, GLLogObserver
 from globaleaks.workers.supervisor import ProcessSupervisor
 
@@ -37,6 +40,7 @@ class Service(service.Service):
         self.state = State
         self.arw = APIResourceWrapper()
         self.api_factory = Site(self.arw, logFormatter=timedLogFormatter)
+        self.api_factory.requestFactory = UploadRequest
 
     def startService(self):
         mask = 0
@@ -79,6 +83,8 @@ class Service(service.Service):
     def shutdown(self):
         def _shutdown(_):
             self.state.orm_tp.stop()
+            self.state.orm_wtp.stop()
+            self.state.export_tp.stop()
 
         d = defer.Deferred()
         d.addBoth(_shutdown)
@@ -130,7 +136,18 @@ class Service(service.Service):
         sync_clean_untracked_files()
         sync_refresh_memory_variables()
 
+        StaticFileIndex.load(Settings.client_path)
+
         self.state.orm_tp.start()
+        self.state.orm_wtp.start()
+        self.state.export_tp.adjustPoolsize(0, Settings.export_concurrency)
+        self.state.export_tp.start()
+
+        if Settings.enable_api_cache and Settings.enable_api_cache_warmup:
+            schedule_warmup()
+
+        if Settings.enable_profiler:
+            self.state.enable_profiler()
 
         reactor.addSystemEventTrigger('before', 'shutdown', self.shutdown)
 
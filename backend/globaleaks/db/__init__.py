@@ -92,6 +92,20 @@ def db_get_tracked_files(session):
     return [ os.path.basename(files) for files in list(set(ifiles + rfiles + wbfiles)) ]
 
 
+def db_count_file_references(session, path):
+    """
+    Return the number of InternalFile, ReceiverFile and WhistleblowerFile referencing a file
+    """
+    return session.query(models.InternalFile).filter(models.InternalFile.file_path == path).count() + \
+           session.query(models.ReceiverFile).filter(models.ReceiverFile.file_path == path).count() + \
+           session.query(models.WhistleblowerFile).filter(models.WhistleblowerFile.file_path == path).count()
+
+
+@transact_sync
+def sync_count_file_references(session, path):
+    return db_count_file_references(session, path)
+
+
 @transact_sync
 def sync_clean_untracked_files(session):
     """
@@ -0,0 +1,421 @@
+# -*- coding: UTF-8
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import Model, get_auth_token
+from globaleaks.models.properties import *
+from globaleaks.utils.utility import datetime_now, datetime_null
+
+
+class Anomalies_v_39(Model):
+    __tablename__ = 'anomalies'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    date = Column(DateTime, nullable=False)
+    alarm = Column(Integer, nullable=False)
+    events = Column(JSON, nullable=False)
+
+
+class ArchivedSchema_v_39(Model):
+    __tablename__ = 'archivedschema'
+    hash = Column(Unicode(64), primary_key=True, nullable=False)
+    schema = Column(JSON, nullable=False)
+    preview = Column(JSON, nullable=False)
+
+
+class Comment_v_39(Model):
+    __tablename__ = 'comment'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    internaltip_id = Column(Unicode(36), nullable=False)
+    author_id = Column(Unicode(36))
+    content = Column(UnicodeText, nullable=False)
+    type = Column(UnicodeText, nullable=False)
+    new = Column(Integer, default=True, nullable=False)
+
+
+class Config_v_39(Model):
+    __tablename__ = 'config'
+    tid = Column(Integer, primary_key=True, default=1, nullable=False)
+    var_name = Column(Unicode(64), primary_key=True, nullable=False)
+    value = Column(JSON, nullable=False)
+    customized = Column(Boolean, default=False, nullable=False)
+
+
+class ConfigL10N_v_39(Model):
+    __tablename__ = 'config_l10n'
+    tid = Column(Integer, primary_key=True, default=1, nullable=False)
+    lang = Column(Unicode(5), primary_key=True)
+    var_name = Column(Unicode(64), primary_key=True)
+    value = Column(UnicodeText)
+    customized = Column(Boolean, default=False)
+
+
+class Context_v_39(Model):
+    __tablename__ = 'context'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    show_small_receiver_cards = Column(Boolean, default=False, nullable=False)
+    show_context = Column(Boolean, default=True, nullable=False)
+    show_recipients_details = Column(Boolean, default=False, nullable=False)
+    allow_recipients_selection = Column(Boolean, default=False, nullable=False)
+    maximum_selectable_receivers = Column(Integer, default=0, nullable=False)
+    select_all_receivers = Column(Boolean, default=True, nullable=False)
+    enable_comments = Column(Boolean, default=True, nullable=False)
+    enable_messages = Column(Boolean, default=False, nullable=False)
+    enable_two_way_comments = Column(Boolean, default=True, nullable=False)
+    enable_two_way_messages = Column(Boolean, default=True, nullable=False)
+    enable_attachments = Column(Boolean, default=True, nullable=False)
+    enable_rc_to_wb_files = Column(Boolean, default=False, nullable=False)
+    tip_timetolive = Column(Integer, default=15, nullable=False)
+    name = Column(JSON, default=dict, nullable=False)
+    description = Column(JSON, default=dict, nullable=False)
+    recipients_clarification = Column(JSON, default=dict, nullable=False)
+    status_page_message = Column(JSON, default=dict, nullable=False)
+    show_receivers_in_alphabetical_order = Column(Boolean, default=True, nullable=False)
+    presentation_order = Column(Integer, default=0, nullable=False)
+    questionnaire_id = Column(Unicode(36), default=u'default', nullable=False)
+
+
+class ContextImg_v_39(Model):
+    __tablename__ = 'contextimg'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    data = Column(UnicodeText, nullable=False)
+
+
+class Counter_v_39(Model):
+    __tablename__ = 'counter'
+    tid = Column(Integer, primary_key=True, default=1, nullable=False)
+    key = Column(Unicode(32), primary_key=True, nullable=False)
+    counter = Column(Integer, default=1, nullable=False)
+    update_date = Column(DateTime, default=datetime_now, nullable=False)
+
+
+class CustomTexts_v_39(Model):
+    __tablename__ = 'customtexts'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    lang = Column(Unicode(5), primary_key=True, nullable=False)
+    texts = Column(JSON, nullable=False)
+
+
+class EnabledLanguage_v_39(Model):
+    __tablename__ = 'enabledlanguage'
+    tid = Column(Integer, primary_key=True, default=1, nullable=False)
+    name = Column(Unicode(5), primary_key=True, nullable=False)
+
+
+class Field_v_39(Model):
+    __tablename__ = 'field'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    x = Column(Integer, default=0, nullable=False)
+    y = Column(Integer, default=0, nullable=False)
+    width = Column(Integer, default=0, nullable=False)
+    label = Column(JSON, nullable=False)
+    description = Column(JSON, nullable=False)
+    hint = Column(JSON, nullable=False)
+    required = Column(Boolean, default=False, nullable=False)
+    preview = Column(Boolean, default=False, nullable=False)
+    multi_entry = Column(Boolean, default=False, nullable=False)
+    multi_entry_hint = Column(JSON, nullable=False)
+    stats_enabled = Column(Boolean, default=False, nullable=False)
+    triggered_by_score = Column(Integer, default=0, nullable=False)
+    template_id = Column(Unicode(36))
+    fieldgroup_id = Column(Unicode(36))
+    step_id = Column(Unicode(36))
+    type = Column(UnicodeText, default=u'inputbox', nullable=False)
+    instance = Column(UnicodeText, default=u'instance', nullable=False)
+    editable = Column(Boolean, default=True, nullable=False)
+
+
+class FieldAnswer_v_39(Model):
+    __tablename__ = 'fieldanswer'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    internaltip_id = Column(Unicode(36), nullable=True)
+    fieldanswergroup_id = Column(Unicode(36), nullable=True)
+    key = Column(UnicodeText, default=u'', nullable=False)
+    is_leaf = Column(Boolean, default=True, nullable=False)
+    value = Column(UnicodeText, default=u'', nullable=False)
+
+
+class FieldAnswerGroup_v_39(Model):
+    __tablename__ = 'fieldanswergroup'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    number = Column(Integer, default=0, nullable=False)
+    fieldanswer_id = Column(Unicode(36), nullable=False)
+
+
+class FieldAttr_v_39(Model):
+    __tablename__ = 'fieldattr'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    field_id = Column(Unicode(36), nullable=False)
+    name = Column(UnicodeText, nullable=False)
+    type = Column(UnicodeText, nullable=False)
+    value = Column(JSON, nullable=False)
+
+
+class FieldOption_v_39(Model):
+    __tablename__ = 'fieldoption'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    field_id = Column(Unicode(36), nullable=False)
+    presentation_order = Column(Integer, default=0, nullable=False)
+    label = Column(JSON, nullable=False)
+    score_points = Column(Integer, default=0, nullable=False)
+    trigger_field = Column(Unicode(36))
+
+
+class File_v_39(Model):
+    __tablename__ = 'file'
+    tid = Column(Integer, primary_key=True, default=1, nullable=False)
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    name = Column(UnicodeText, default=u'', nullable=False)
+    data = Column(UnicodeText, nullable=False)
+
+
+class IdentityAccessRequest_v_39(Model):
+    __tablename__ = 'identityaccessrequest'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    receivertip_id = Column(Unicode(36), nullable=False)
+    request_date = Column(DateTime, default=datetime_now, nullable=False)
+    request_motivation = Column(UnicodeText, default=u'')
+    reply_date = Column(DateTime, default=datetime_null, nullable=False)
+    reply_user_id = Column(Unicode(36), default=u'', nullable=False)
+    reply_motivation = Column(UnicodeText, default=u'', nullable=False)
+    reply = Column(UnicodeText, default=u'pending', nullable=False)
+
+
+class InternalFile_v_39(Model):
+    __tablename__ = 'internalfile'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    internaltip_id = Column(Unicode(36), nullable=False)
+    name = Column(UnicodeText, nullable=False)
+    file_path = Column(UnicodeText, nullable=False)
+    content_type = Column(UnicodeText, nullable=False)
+    size = Column(Integer, nullable=False)
+    new = Column(Integer, default=True, nullable=False)
+    submission = Column(Integer, default = False, nullable=False)
+    processing_attempts = Column(Integer, default=0, nullable=False)
+
+
+class InternalTip_v_39(Model):
+    __tablename__ = 'internaltip'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    update_date = Column(DateTime, default=datetime_now, nullable=False)
+    context_id = Column(Unicode(36), nullable=False)
+    questionnaire_hash = Column(Unicode(64), nullable=False)
+    preview = Column(JSON, nullable=False)
+    progressive = Column(Integer, default=0, nullable=False)
+    https = Column(Boolean, default=False, nullable=False)
+    total_score = Column(Integer, default=0, nullable=False)
+    expiration_date = Column(DateTime, nullable=False)
+    identity_provided = Column(Boolean, default=False, nullable=False)
+    identity_provided_date = Column(DateTime, default=datetime_null, nullable=False)
+    enable_two_way_comments = Column(Boolean, default=True, nullable=False)
+    enable_two_way_messages = Column(Boolean, default=True, nullable=False)
+    enable_attachments = Column(Boolean, default=True, nullable=False)
+    enable_whistleblower_identity = Column(Boolean, default=False, nullable=False)
+    receipt_hash = Column(Unicode(128), nullable=False)
+    wb_last_access = Column(DateTime, default=datetime_now, nullable=False)
+    wb_access_counter = Column(Integer, default=0, nullable=False)
+
+
+class Mail_v_39(Model):
+    __tablename__ = 'mail'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    address = Column(UnicodeText, nullable=False)
+    subject = Column(UnicodeText, nullable=False)
+    body = Column(UnicodeText, nullable=False)
+    processing_attempts = Column(Integer, default=0, nullable=False)
+
+
+class Message_v_39(Model):
+    __tablename__ = 'message'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    receivertip_id = Column(Unicode(36), nullable=False)
+    content = Column(UnicodeText, nullable=False)
+    type = Column(UnicodeText, nullable=False)
+    new = Column(Integer, default=True, nullable=False)
+
+
+class Questionnaire_v_39(Model):
+    __tablename__ = 'questionnaire'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    name = Column(UnicodeText, default=u'', nullable=False)
+    enable_whistleblower_identity = Column(Boolean, default=False, nullable=False)
+    editable = Column(Boolean, default=True, nullable=False)
+
+
+class Receiver_v_39(Model):
+    __tablename__ = 'receiver'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    configuration = Column(UnicodeText, default=u'default', nullable=False)
+    can_delete_submission = Column(Boolean, default=False, nullable=False)
+    can_postpone_expiration = Column(Boolean, default=False, nullable=False)
+    can_grant_permissions = Column(Boolean, default=False, nullable=False)
+    tip_notification = Column(Boolean, default=True, nullable=False)
+
+
+class ReceiverContext_v_39(Model):
+    __tablename__ = 'receiver_context'
+    context_id = Column(Unicode(36), primary_key=True, nullable=False)
+    receiver_id = Column(Unicode(36), primary_key=True, nullable=False)
+    presentation_order = Column(Integer, default=0, nullable=False)
+
+
+class ReceiverFile_v_39(Model):
+    __tablename__ = 'receiverfile'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    internalfile_id = Column(Unicode(36), nullable=False)
+    receivertip_id = Column(Unicode(36), nullable=False)
+    file_path = Column(UnicodeText, nullable=False)
+    size = Column(Integer, nullable=False)
+    downloads = Column(Integer, default=0, nullable=False)
+    last_access = Column(DateTime, default=datetime_null, nullable=False)
+    new = Column(Integer, default=True, nullable=False)
+    status = Column(UnicodeText, nullable=False)
+
+
+class ReceiverTip_v_39(Model):
+    __tablename__ = 'receivertip'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    internaltip_id = Column(Unicode(36), nullable=False)
+    receiver_id = Column(Unicode(36), nullable=False)
+    last_access = Column(DateTime, default=datetime_null, nullable=False)
+    access_counter = Column(Integer, default=0, nullable=False)
+    label = Column(UnicodeText, default=u'', nullable=False)
+    can_access_whistleblower_identity = Column(Boolean, default=False, nullable=False)
+    new = Column(Integer, default=True, nullable=False)
+    enable_notifications = Column(Boolean, default=True, nullable=False)
+
+
+class SecureFileDelete_v_39(Model):
+    __tablename__ = 'securefiledelete'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    filepath = Column(UnicodeText, nullable=False)
+
+
+class ShortURL_v_39(Model):
+    __tablename__ = 'shorturl'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    shorturl = Column(UnicodeText, nullable=False)
+    longurl = Column(UnicodeText, nullable=False)
+
+
+class Stats_v_39(Model):
+    __tablename__ = 'stats'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    start = Column(DateTime, nullable=False)
+    summary = Column(JSON, nullable=False)
+
+
+class Step_v_39(Model):
+    __tablename__ = 'step'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    questionnaire_id = Column(Unicode(36), nullable=True)
+    label = Column(JSON, nullable=False)
+    description = Column(JSON, nullable=False)
+    presentation_order = Column(Integer, default=0, nullable=False)
+
+
+class Tenant_v_39(Model):
+    __tablename__ = 'tenant'
+    id = Column(Integer, primary_key=True, nullable=False)
+    label = Column(UnicodeText, default=u'', nullable=False)
+    active = Column(Boolean, default=True, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    subdomain = Column(UnicodeText, default=u'', nullable=False)
+
+    unicode_keys = ['label', 'subdomain']
+
+
+class User_v_39(Model):
+    __tablename__ = 'user'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    tid = Column(Integer, default=1, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    username = Column(UnicodeText, default=u'', nullable=False)
+    password = Column(UnicodeText, default=u'', nullable=False)
+    salt = Column(Unicode(24), nullable=False)
+    name = Column(UnicodeText, default=u'', nullable=False)
+    description = Column(JSON, default=dict, nullable=False)
+    role = Column(UnicodeText, default=u'receiver', nullable=False)
+    state = Column(UnicodeText, default=u'enabled', nullable=False)
+    last_login = Column(DateTime, default=datetime_null, nullable=False)
+    mail_address = Column(UnicodeText, default=u'', nullable=False)
+    language = Column(UnicodeText, nullable=False)
+    password_change_needed = Column(Boolean, default=True, nullable=False)
+    password_change_date = Column(DateTime, default=datetime_null, nullable=False)
+    auth_token = Column(UnicodeText, default=get_auth_token, nullable=False)
+    pgp_key_fingerprint = Column(UnicodeText, default=u'', nullable=False)
+    pgp_key_public = Column(UnicodeText, default=u'', nullable=False)
+    pgp_key_expiration = Column(DateTime, default=datetime_null, nullable=False)
+
+
+class UserImg_v_39(Model):
+    __tablename__ = 'userimg'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    data = Column(UnicodeText, nullable=False)
+
+
+class WhistleblowerFile_v_39(Model):
+    __tablename__ = 'whistleblowerfile'
+    id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
+    receivertip_id = Column(Unicode(36), nullable=False)
+    name = Column(UnicodeText, nullable=False)
+    file_path = Column(UnicodeText, nullable=False)
+    size = Column(Integer, nullable=False)
+    content_type = Column(UnicodeText, nullable=False)
+    downloads = Column(Integer, default=0, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    last_access = Column(DateTime, default=datetime_null, nullable=False)
+    description = Column(UnicodeText, nullable=False)
+
+
+class MigrationScript(MigrationBase):
+    """
+    The version 40 adds secondary indexes on the columns used by the
+    tip, delivery and notification queries and the outbox of the
+    notification events and the priority and the retry schedule of the
+    mails; the new flags of tips, comments, messages and receiver files
+    are replaced by the events of the outbox. The indexes are created
+    together with the new schema and the rest of the data is migrated
+    unchanged.
+    """
+    def epilogue(self):
+        """
+        Append to the outbox the events of the objects still to be notified
+        """
+        m = self.model_from
+
+        queries = [
+            self.session_old.query(m['ReceiverTip'].id, m['InternalTip'].tid)
+                            .filter(m['ReceiverTip'].new == True,
+                                    m['InternalTip'].id == m['ReceiverTip'].internaltip_id),
+            self.session_old.query(m['Comment'].id, m['InternalTip'].tid)
+                            .filter(m['Comment'].new == True,
+                                    m['InternalTip'].id == m['Comment'].internaltip_id),
+            self.session_old.query(m['Message'].id, m['InternalTip'].tid)
+                            .filter(m['Message'].new == True,
+                                    m['ReceiverTip'].id == m['Message'].receivertip_id,
+                                    m['InternalTip'].id == m['ReceiverTip'].internaltip_id),
+            self.session_old.query(m['ReceiverFile'].id, m['InternalTip'].tid)
+                            .filter(m['ReceiverFile'].new == True,
+                                    m['ReceiverTip'].id == m['ReceiverFile'].receivertip_id,
+                                    m['InternalTip'].id == m['ReceiverTip'].internaltip_id)
+        ]
+
+        for trigger, query in zip(['ReceiverTip', 'Comment', 'Message', 'ReceiverFile'], queries):
+            for object_id, tid in query:
+                self.session_new.add(self.model_to['NotificationEvent']({
+                    'tid': tid,
+                    'trigger': trigger,
+                    'object_id': object_id
+                }))
@@ -51,6 +51,11 @@ class AdminConfigHandler(OperationHandler):
     """
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_shared = True
+
+    def get_cache_invalidation_targets(self, *args):
+        # the tenant list of the root tenant exposes the hostnames of the tenants
+        return super(AdminConfigHandler, self).get_cache_invalidation_targets(*args) + [(1, ['/admin/tenants'])]
 
     @inlineCallbacks
     def set_hostname(self, req_args, *args, **kwargs):
@@ -10,7 +10,7 @@ from globaleaks import models
 from globaleaks.handlers.admin.modelimgs import db_get_model_img
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.operation import OperationHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 from globaleaks.utils.structures import fill_localized_keys, get_localized_values
 
@@ -53,7 +53,7 @@ def admin_serialize_context(session, context, language):
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-@transact
+@transact_ro
 def get_context_list(session, tid, language):
     """
     Returns the context list.
@@ -198,6 +198,7 @@ class ContextsCollection(OperationHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/contexts']
 
     def get(self):
         """
@@ -223,6 +224,7 @@ class ContextsCollection(OperationHandler):
 class ContextInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/contexts']
 
     def put(self, context_id):
         """
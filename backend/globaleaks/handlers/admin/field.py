@@ -8,7 +8,7 @@ from sqlalchemy.sql.expression import not_
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_field
+from globaleaks.handlers.public import db_prepare_fields_serialization, serialize_field
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
@@ -283,15 +283,20 @@ def get_fieldtemplate_list(session, tid, language):
     """
     templates = session.query(models.Field).filter(models.Field.tid.in_(set([1, tid])),
                                                    models.Field.instance == u'template',
-                                                   models.Field.fieldgroup_id == None)
+                                                   models.Field.fieldgroup_id == None).all()
 
-    return [serialize_field(session, tid, f, language) for f in templates]
+    data = db_prepare_fields_serialization(session, templates)
+
+    return [serialize_field(session, tid, f, language, data) for f in templates]
 
 
 class FieldTemplatesCollection(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def get(self):
         """
@@ -316,6 +321,9 @@ class FieldTemplatesCollection(BaseHandler):
 class FieldTemplateInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def put(self, field_id):
         """
@@ -351,6 +359,9 @@ class FieldsCollection(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def post(self):
         """
@@ -376,6 +387,9 @@ class FieldInstance(BaseHandler):
     """
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def put(self, field_id):
         """
@@ -66,6 +66,7 @@ def get_file(session, tid, id):
 class FileInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/s/']
     upload_handler = True
 
     def post(self, id):
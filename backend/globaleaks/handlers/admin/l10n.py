@@ -36,6 +36,9 @@ class AdminL10NHandler(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
 
+    def get_cache_invalidation_targets(self, lang):
+        return [(self.request.tid, ['/l10n/' + lang])]
+
     def get(self, lang):
         return get(self.request.tid, lang)
 
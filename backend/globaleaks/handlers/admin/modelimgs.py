@@ -46,6 +46,7 @@ def del_model_img(session, tid, obj_key, obj_id):
 class ModelImgInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/users', '/admin/receivers', '/admin/contexts']
     upload_handler = True
 
     def post(self, obj_key, obj_id):
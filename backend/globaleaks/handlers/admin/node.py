@@ -114,6 +114,11 @@ class NodeInstance(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_shared = True
+
+    def get_cache_invalidation_targets(self, *args):
+        # the tenant list of the root tenant exposes the hostnames of the tenants
+        return super(NodeInstance, self).get_cache_invalidation_targets(*args) + [(1, ['/admin/tenants'])]
 
     def get(self):
         """
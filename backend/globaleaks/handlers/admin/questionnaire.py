@@ -9,20 +9,22 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 from globaleaks import models, QUESTIONNAIRE_EXPORT_VERSION
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_questionnaire
-from globaleaks.orm import transact
+from globaleaks.handlers.public import db_prepare_questionnaires_serialization, serialize_questionnaire
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests
 from globaleaks.utils.structures import fill_localized_keys
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now
 
 
 def db_get_questionnaire_list(session, tid, language):
-    questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_(set([1, tid])))
+    questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_(set([1, tid]))).all()
 
-    return [serialize_questionnaire(session, tid, questionnaire, language) for questionnaire in questionnaires]
+    data = db_prepare_questionnaires_serialization(session, questionnaires)
 
+    return [serialize_questionnaire(session, tid, questionnaire, language, data) for questionnaire in questionnaires]
 
-@transact
+
+@transact_ro
 def get_questionnaire_list(session, tid, language):
     """
     Returns the questionnaire list.
@@ -112,6 +114,9 @@ class QuestionnairesCollection(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def get(self):
         """
@@ -135,6 +140,9 @@ class QuestionnairesCollection(BaseHandler):
 class QuestionnaireInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def put(self, questionnaire_id):
         """
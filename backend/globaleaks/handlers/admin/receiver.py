@@ -7,12 +7,12 @@
 from globaleaks import models
 from globaleaks.handlers.admin.user import admin_serialize_receiver
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests
 from globaleaks.utils.structures import fill_localized_keys
 
 
-@transact
+@transact_ro
 def get_receiver_list(session, tid, language):
     return [admin_serialize_receiver(session, receiver, user, language)
         for receiver, user in session.query(models.Receiver, models.User) \
@@ -63,6 +63,7 @@ class ReceiversCollection(BaseHandler):
 class ReceiverInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/users', '/admin/receivers', '/admin/contexts']
 
     def put(self, receiver_id):
         """
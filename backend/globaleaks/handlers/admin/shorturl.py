@@ -35,6 +35,7 @@ class ShortURLCollection(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/admin/shorturls']
 
     def get(self):
         """
@@ -53,6 +54,8 @@ class ShortURLCollection(BaseHandler):
 
 class ShortURLInstance(BaseHandler):
     check_roles = 'admin'
+    invalidate_cache = True
+    invalidate_cache_resources = ['/admin/shorturls']
 
     def delete(self, shorturl_id):
         """
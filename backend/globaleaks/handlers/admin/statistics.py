@@ -187,7 +187,30 @@ class JobsTiming(BaseHandler):
         for job in State.jobs:
             response.append({
               'name': job.name,
-              'timings': job.last_executions
+              'timings': job.last_executions,
+              'stats': job.get_stats()
             })
 
         return response
+
+
+class ProfilerStats(BaseHandler):
+    """
+    This handler returns the percentiles of the timings and of the queries
+    of the API handlers and the slowest requests recorded by the profiler
+    """
+    check_roles = 'admin'
+    root_tenant_only = True
+
+    def get(self):
+        if State.profiler is None:
+            return {'enabled': False, 'handlers': [], 'slowest': []}
+
+        ret = State.profiler.get_stats()
+        ret['enabled'] = True
+
+        return ret
+
+    def delete(self):
+        if State.profiler is not None:
+            State.profiler.reset()
@@ -97,6 +97,9 @@ class StepCollection(OperationHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def post(self):
         """
@@ -131,6 +134,9 @@ class StepInstance(BaseHandler):
     """
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/questionnaires', '/admin/fieldtemplates', '/admin/contexts']
+    invalidate_cache_shared = True
+    invalidate_questionnaires = True
 
     def put(self, step_id):
         """
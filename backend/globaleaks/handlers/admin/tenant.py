@@ -105,6 +105,7 @@ class TenantCollection(BaseHandler):
     cache_resource = True
     root_tenant_only = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/admin/tenants']
     invalidate_tenant_states = True
 
     def get(self):
@@ -130,6 +131,9 @@ class TenantInstance(BaseHandler):
     root_tenant_only = True
     invalidate_tenant_states = True
 
+    def get_cache_invalidation_targets(self, tenant_id):
+        return [(int(tenant_id), None), (1, ['/admin/tenants'])]
+
     def get(self, tenant_id):
         tenant_id = int(tenant_id)
 
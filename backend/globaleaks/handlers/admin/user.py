@@ -6,9 +6,9 @@
 #
 from globaleaks import models
 from globaleaks.db import db_refresh_memory_variables
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, stream_list
 from globaleaks.handlers.user import parse_pgp_options, user_serialize_user
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 from globaleaks.state import State
 from globaleaks.utils import security
@@ -160,7 +160,7 @@ def db_get_admin_users(session, tid):
             for user in session.query(models.User).filter(models.User.tid == tid, models.User.role ==u'admin')]
 
 
-@transact
+@transact_ro
 def get_user_list(session, tid, language):
     """
     Returns:
@@ -174,12 +174,13 @@ class UsersCollection(BaseHandler):
     check_roles = 'admin'
     cache_resource = True
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/users', '/admin/receivers', '/admin/contexts']
 
     def get(self):
         """
         Return all the users.
         """
-        return get_user_list(self.request.tid, self.request.language)
+        return get_user_list(self.request.tid, self.request.language).addCallback(stream_list)
 
     def post(self):
         """
@@ -194,6 +195,7 @@ class UsersCollection(BaseHandler):
 class UserInstance(BaseHandler):
     check_roles = 'admin'
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/users', '/admin/receivers', '/admin/contexts']
 
     def put(self, user_id):
         """
@@ -8,6 +8,8 @@ import mimetypes
 import os
 import re
 import shutil
+import time
+import zlib
 from datetime import datetime
 
 from cryptography.hazmat.primitives import constant_time
@@ -17,10 +19,11 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.event import track_handler
 from globaleaks.rest import errors, requests
-from globaleaks.utils.securetempfile import SecureTemporaryFile
 from globaleaks.utils.security import generateRandomKey, sha512
+from globaleaks.utils.storage import Storage
 from globaleaks.settings import Settings
 from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.upload import UploadSession, get_chunk_size
 from globaleaks.utils.utility import datetime_now, deferred_sleep, log
 
 HANDLER_EXEC_TIME_THRESHOLD = 120
@@ -45,43 +48,198 @@ mimetypes.add_type('application/woff', '.woff')
 mimetypes.add_type('application/woff2', '.woff2')
 
 
+def parse_byte_range(value, size):
+    """
+    Parse the value of a Range header requesting a single range of bytes
+
+    @return: the (first, last) positions of the range or None if the whole file
+             has to be served; the range is not satisfiable if first > last
+    """
+    if value is None:
+        return None
+
+    unit, _, ranges = value.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+
+    first, sep, last = ranges.strip().partition('-')
+    if not sep:
+        return None
+
+    try:
+        first = int(first) if first else None
+        last = int(last) if last else None
+    except ValueError:
+        return None
+
+    if first is None:
+        # suffix range: the last bytes of the file
+        if not last:
+            return 0, -1
+
+        return max(size - last, 0), size - 1
+
+    if last is None or last >= size:
+        last = size - 1
+    elif last < first:
+        return None
+
+    if first >= size:
+        return first, -1
+
+    return first, last
+
+
 class FileProducer(object):
     """
     Streaming producer for files
 
+    The producer writes the file until the transport asks it to pause.
+
     @ivar request: The L{IRequest} to write the contents of the file to.
     @ivar fileObject: The file the contents of which to write to the request.
     """
     bufferSize = Settings.file_chunk_size
 
-    def __init__(self, request, filePath):
+    def __init__(self, request, fileObject, size):
         self.finish = defer.Deferred()
         self.request = request
-        self.fileSize = os.stat(filePath).st_size
-        self.fileObject = open(filePath, "rb")
-        self.bytesWritten = 0
+        self.fileObject = fileObject
+        self.remaining = size
+        self.paused = False
 
     def start(self):
-        self.request.registerProducer(self, False)
+        self.request.registerProducer(self, True)
+        self.resumeProducing()
         return self.finish
 
     def resumeProducing(self):
-        try:
-            if self.request is not None:
-                data = self.fileObject.read(self.bufferSize)
-                if data:
-                    self.bytesWritten += len(data)
-                    self.request.write(data)
+        self.paused = False
 
-                if self.bytesWritten == self.fileSize:
+        try:
+            while self.request is not None and not self.paused:
+                data = self.fileObject.read(min(self.bufferSize, self.remaining)) if self.remaining else b''
+                if not data:
                     self.stopProducing()
+                    break
+
+                self.remaining -= len(data)
+                self.request.write(data)
+        except:
+            self.stopProducing()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def stopProducing(self):
+        if self.request is None:
+            return
+
+        request, self.request = self.request, None
+
+        try:
+            self.fileObject.close()
+            request.unregisterProducer()
+            request.finish()
         except:
             pass
 
+        self.finish.callback(None)
+
+
+def iterencode_list(rows):
+    """
+    Encode the rows yielded by an iterator as a JSON array one row at a time
+    """
+    yield '['
+
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(row, separators=(',', ':'))
+        separator = ','
+
+    yield ']'
+
+
+def stream_list(rows):
+    """
+    Iterate over a list releasing each row as soon as it is yielded
+    """
+    rows.reverse()
+
+    while rows:
+        yield rows.pop()
+
+
+class JSONStreamProducer(object):
+    """
+    Streaming producer for the JSON arrays of the rows returned by handlers as iterators
+
+    The array is written in chunks of Settings.file_chunk_size bytes eventually
+    compressed with gzip so that its whole encoding is never kept in memory.
+    """
+    bufferSize = Settings.file_chunk_size
+
+    def __init__(self, request, rows, compress=False):
+        self.finish = defer.Deferred()
+        self.request = request
+        self.chunks = iterencode_list(rows)
+        self.compressor = None
+        self.encodingTime = 0
+
+        if compress:
+            self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.request.setHeader("Content-encoding", "gzip")
+            self.request.setHeader("Vary", "Accept-Encoding")
+
+    def start(self):
+        self.request.registerProducer(self, False)
+        return self.finish
+
+    def read_chunk(self):
+        """
+        Return the next chunk and True if it is the last one; a chunk is never
+        empty until the end given that a pull producer has to write something
+        at every invocation in order to be resumed.
+        """
+        chunk = []
+        chunk_size = 0
+
+        for data in self.chunks:
+            if self.compressor is not None:
+                data = self.compressor.compress(data)
+
+            chunk_size += len(data)
+            chunk.append(data)
+            if chunk_size >= self.bufferSize:
+                return ''.join(chunk), False
+
+        if self.compressor is not None:
+            chunk.append(self.compressor.flush())
+
+        return ''.join(chunk), True
+
+    def resumeProducing(self):
+        try:
+            if self.request is None:
+                return
+
+            start = time.time()
+            data, last = self.read_chunk()
+            self.encodingTime += time.time() - start
+
+            if data:
+                self.request.write(data)
+
+            if last:
+                self.stopProducing()
+        except:
+            self.stopProducing()
+            raise
+
     def stopProducing(self):
         try:
             if self.request is not None:
-                self.fileObject.close()
                 self.request.unregisterProducer()
                 self.request.finish()
                 self.request = None
@@ -116,9 +274,13 @@ class BaseHandler(object):
     handler_exec_time_threshold = HANDLER_EXEC_TIME_THRESHOLD
     uniform_answer_time = False
     cache_resource = False
+    cache_language = True
     invalidate_global_cache = False
     invalidate_cache = False
+    invalidate_cache_resources = None
+    invalidate_cache_shared = False
     invalidate_tenant_states = False
+    invalidate_questionnaires = False
     bypass_basic_auth = False
     root_tenant_only = False
     upload_handler = False
@@ -160,6 +322,20 @@ class BaseHandler(object):
 
         return wrapper
 
+    def get_cache_invalidation_targets(self, *args):
+        """
+        Return the list of (tid, resources) of the cache entries made stale by a write;
+        a None tid selects all the tenants and None resources all the resources.
+
+        The resources edited on the root tenant and marked as shared (e.g.
+        the questionnaires) are served also by the other tenants.
+        """
+        if self.invalidate_global_cache or \
+           (self.invalidate_cache_shared and self.request.tid == 1):
+            return [(None, self.invalidate_cache_resources)]
+
+        return [(self.request.tid, self.invalidate_cache_resources)]
+
     @staticmethod
     def decorator_invalidate_tenant_states(f):
         """
@@ -177,6 +353,29 @@ class BaseHandler(object):
 
         return wrapper
 
+    @staticmethod
+    def decorator_invalidate_questionnaires(f):
+        """
+        Decorator for invalidation of the compiled questionnaires
+        """
+        def wrapper(self, *args, **kwargs):
+            from globaleaks.handlers.public import QuestionnaireCache
+
+            # the input validation errors are raised synchronously
+            # and are not affected given that nothing is written
+            ret = f(self, *args, **kwargs)
+
+            def callback(data):
+                QuestionnaireCache.invalidate()
+                return data
+
+            if isinstance(ret, defer.Deferred):
+                return ret.addCallback(callback)
+
+            return callback(ret)
+
+        return wrapper
+
     def basic_auth(self):
         msg = None
         if "authorization" in self.request.headers:
@@ -358,6 +557,37 @@ class BaseHandler(object):
         self.request.setHeader(b"location", url)
         self.request.finish()
 
+    def write_file_object(self, fileObject, fileSize):
+        """
+        Write the file to the request serving the byte range eventually requested
+        """
+        self.request.setHeader(b'Accept-Ranges', b'bytes')
+
+        byte_range = None
+        if self.request.getHeader(b'if-range') is None:
+            byte_range = parse_byte_range(self.request.getHeader(b'range'), fileSize)
+
+        if byte_range is not None:
+            first, last = byte_range
+
+            if first > last:
+                fileObject.close()
+                self.request.setResponseCode(416)
+                self.request.setHeader(b'Content-Range', b'bytes */%d' % fileSize)
+                return
+
+            fileObject.seek(first)
+
+            self.request.setResponseCode(206)
+            self.request.setHeader(b'Content-Range', b'bytes %d-%d/%d' % (first, last, fileSize))
+            length = last - first + 1
+        else:
+            length = fileSize
+
+        self.request.setHeader(b'Content-Length', b'%d' % length)
+
+        return FileProducer(self.request, fileObject, length).start()
+
     def write_file(self, filename, filepath):
         if not os.path.exists(filepath) or not os.path.isfile(filepath):
             raise errors.ResourceNotFound()
@@ -370,7 +600,9 @@ class BaseHandler(object):
         if mime_type:
             self.request.setHeader("Content-Type", mime_type)
 
-        return FileProducer(self.request, filepath).start()
+        fileObject = open(filepath, 'rb')
+
+        return self.write_file_object(fileObject, os.fstat(fileObject.fileno()).st_size)
 
     def force_file_download(self, filename, filepath):
         if not os.path.exists(filepath) or not os.path.isfile(filepath):
@@ -380,7 +612,13 @@ class BaseHandler(object):
         self.request.setHeader('Content-Type', 'application/octet-stream')
         self.request.setHeader('Content-Disposition', 'attachment; filename=\"%s\"' % filename)
 
-        return FileProducer(self.request, filepath).start()
+        fileObject = Storage.open(filepath)
+
+        fileSize = getattr(fileObject, 'size', None)
+        if fileSize is None:
+            fileSize = os.fstat(fileObject.fileno()).st_size
+
+        return self.write_file_object(fileObject, fileSize)
 
     def get_current_user(self):
         api_session = self.get_api_session()
@@ -426,30 +664,73 @@ class BaseHandler(object):
             return self.state.api_token_session
         return None
 
+    def get_upload_session_key(self):
+        """
+        Return the key of the upload session; the flow.js identifiers are
+        chosen by the client and so are scoped to the resource and the user
+        """
+        user_id = self.current_user.user_id if self.current_user else None
+
+        return (self.request.tid, self.request.path, user_id, self.request.args['flowIdentifier'][0])
+
+    def get_upload_parameters(self):
+        if 'flowIdentifier' not in self.request.args:
+            raise errors.InputValidationError("Invalid upload parameters")
+
+        try:
+            return (int(self.request.args['flowTotalSize'][0]),
+                    int(self.request.args['flowChunkSize'][0]),
+                    int(self.request.args['flowTotalChunks'][0]),
+                    int(self.request.args['flowChunkNumber'][0]))
+        except (KeyError, ValueError):
+            raise errors.InputValidationError("Invalid upload parameters")
+
+    def probe_file_upload(self, *args):
+        """
+        Answer the flow.js test-chunk requests used to resume an upload:
+        200 if the chunk has been already received, 204 otherwise
+        """
+        total_file_size, chunk_size, total_chunks, chunk_number = self.get_upload_parameters()
+
+        session = self.state.TempUploadFiles.get(self.get_upload_session_key())
+        if session is None or \
+           not session.match(total_file_size, chunk_size, total_chunks) or \
+           not session.has_chunk(chunk_number):
+            self.request.setResponseCode(204)
+
     def process_file_upload(self):
         if 'flowFilename' not in self.request.args:
             return None
 
-        total_file_size = int(self.request.args['flowTotalSize'][0])
-        flow_identifier = self.request.args['flowIdentifier'][0]
+        total_file_size, chunk_size, total_chunks, chunk_number = self.get_upload_parameters()
 
-        chunk_size = len(self.request.args['file'][0])
-        if ((chunk_size / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
+        # the chunk is a SecureTemporaryFile when the body has been streamed to disk
+        chunk = self.request.args['file'][0]
+        if ((get_chunk_size(chunk) / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize or
             (total_file_size / (1024 * 1024)) > self.state.tenant_cache[self.request.tid].maximum_filesize):
             log.err("File upload request rejected: file too big", tid=self.request.tid)
             raise errors.FileTooBig(self.state.tenant_cache[self.request.tid].maximum_filesize)
 
-        if flow_identifier not in self.state.TempUploadFiles:
-            self.state.TempUploadFiles.set(flow_identifier, SecureTemporaryFile(Settings.tmp_path))
+        key = self.get_upload_session_key()
 
-        f = self.state.TempUploadFiles[flow_identifier]
-        with f.open('w') as f:
-            f.write(self.request.args['file'][0])
+        session = self.state.TempUploadFiles.get(key)
+        if session is None or not session.match(total_file_size, chunk_size, total_chunks):
+            if session is not None:
+                self.state.TempUploadFiles.delete(key)
 
-            if self.request.args['flowChunkNumber'][0] != self.request.args['flowTotalChunks'][0]:
-                return None
-            else:
-                f.finalize_write()
+            session = UploadSession(Settings.tmp_path, total_file_size, chunk_size, total_chunks)
+            self.state.TempUploadFiles.set(key, session)
+
+        session.write_chunk(chunk_number, chunk)
+
+        if not session.is_complete():
+            return None
+
+        # the completed file is kept until it is consumed by the handler
+        # or the delivery and is looked up by path as the other temporary files
+        f = session.file
+        self.state.TempUploadFiles.delete(key)
+        self.state.TempUploadFiles.set(f.filepath, f)
 
         mime_type, _ = mimetypes.guess_type(self.request.args['flowFilename'][0])
         if mime_type is None:
@@ -475,16 +756,28 @@ class BaseHandler(object):
             log.debug('Creating file %s with %d bytes', destination, self.uploaded_file['size'])
 
             with self.uploaded_file['body'].open('r') as encrypted_file, open(destination, 'w') as plaintext_file:
-                while True:
-                    chunk = encrypted_file.read(4096)
-                    if not chunk:
-                        break
-
-                    plaintext_file.write(chunk)
+                encrypted_file.copy_to(plaintext_file)
 
         finally:
             self.uploaded_file['path'] = destination
 
+    def write_upload_to_storage(self):
+        """
+        Store the plaintext of the uploaded file in the attachments storage
+        """
+        log.debug('Storing file %s with %d bytes', self.uploaded_file['name'], self.uploaded_file['size'])
+
+        writer = Storage.writer()
+
+        try:
+            with self.uploaded_file['body'].open('r') as encrypted_file:
+                encrypted_file.copy_to(writer)
+        except:
+            writer.abort()
+            raise
+
+        self.uploaded_file['path'] = writer.close()
+
     @inlineCallbacks
     def execution_check(self):
         self.request.execution_time = datetime.now() - self.request.start_time
@@ -8,24 +8,34 @@ from globaleaks.rest import requests
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now
 
 
-def serialize_identityaccessrequest(session, tid, identityaccessrequest):
-    itip, user = session.query(models.InternalTip, models.User) \
-                      .filter(models.InternalTip.id == models.ReceiverTip.internaltip_id,
-                              models.ReceiverTip.id == identityaccessrequest.receivertip_id,
-                              models.ReceiverTip.receiver_id == models.User.id,
-                              models.User.tid == tid).one()
-
-    reply_user = session.query(models.User) \
-                      .filter(models.User.id == identityaccessrequest.reply_user_id,
-                              models.User.tid == tid).one_or_none()
+def serialize_identityaccessrequest(session, tid, identityaccessrequest, data=None):
+    if data is not None:
+        itip = data['itip']
+        request_user_name = data['users_names'][data['receivers_by_rtip'][identityaccessrequest.receivertip_id]]
+        reply_user_id = identityaccessrequest.reply_user_id if identityaccessrequest.reply_user_id in data['tenant_users_ids'] else None
+    else:
+        itip, user = session.query(models.InternalTip, models.User) \
+                          .filter(models.InternalTip.id == models.ReceiverTip.internaltip_id,
+                                  models.ReceiverTip.id == identityaccessrequest.receivertip_id,
+                                  models.ReceiverTip.receiver_id == models.User.id,
+                                  models.User.tid == tid).one()
+
+        request_user_name = user.name
+
+        reply_user = session.query(models.User) \
+                          .filter(models.User.id == identityaccessrequest.reply_user_id,
+                                  models.User.tid == tid).one_or_none()
+
+        reply_user_id = reply_user.id if reply_user is not None else None
+
     return {
         'id': identityaccessrequest.id,
         'receivertip_id': identityaccessrequest.receivertip_id,
         'request_date': datetime_to_ISO8601(identityaccessrequest.request_date),
-        'request_user_name': user.name,
+        'request_user_name': request_user_name,
         'request_motivation': identityaccessrequest.request_motivation,
         'reply_date': datetime_to_ISO8601(identityaccessrequest.reply_date),
-        'reply_user_name': reply_user.id if reply_user is not None else '',
+        'reply_user_name': reply_user_id if reply_user_id is not None else '',
         'reply': identityaccessrequest.reply,
         'reply_motivation': identityaccessrequest.reply_motivation,
         'submission_date': datetime_to_ISO8601(itip.creation_date)
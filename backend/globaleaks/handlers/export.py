@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 #
 # API handling export of submissions
+from collections import deque
+
+from twisted.internet import reactor
 from twisted.internet.defer import Deferred, inlineCallbacks
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
 
 from globaleaks import models
 from globaleaks.handlers.admin.context import admin_serialize_context
@@ -12,8 +17,9 @@ from globaleaks.handlers.rtip import db_access_rtip, serialize_rtip
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.orm import transact
 from globaleaks.settings import Settings
+from globaleaks.utils.storage import Storage
 from globaleaks.utils.templating import Templating
-from globaleaks.utils.utility import msdos_encode, datetime_now
+from globaleaks.utils.utility import log, msdos_encode, datetime_now
 from globaleaks.utils.zipstream import ZipStream
 
 
@@ -69,50 +75,100 @@ def get_tip_export(session, tid, user_id, rtip_id, language):
 
 
 class ZipStreamProducer(object):
-    """Streaming producter for ZipStream"""
-    bufferSize = Settings.file_chunk_size
-
-    def __init__(self, handler, zipstreamObject):
+    """
+    Streaming producer for ZipStream
+
+    The chunks requiring compression are processed on State.export_tp while
+    up to Settings.export_concurrency of them are in flight; the results are
+    written in the order of the archive.
+    """
+    def __init__(self, handler, zip_stream):
         self.finish = Deferred()
         self.handler = handler
-        self.zipstreamObject = zipstreamObject
+        self.chunks = zip_stream.iter_chunks()
+        self.pending = deque()
+        self.paused = False
+        self.exhausted = False
 
     def start(self):
-        self.handler.request.registerProducer(self, False)
+        self.handler.request.registerProducer(self, True)
+        self.schedule()
         return self.finish
 
-    def resumeProducing(self):
+    def schedule(self):
         try:
-            if not self.handler:
-                return
+            while self.handler is not None and not self.paused and not self.exhausted and \
+                  len(self.pending) < Settings.export_concurrency:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    self.exhausted = True
+                    break
+
+                job = [chunk, False, None]
+                self.pending.append(job)
+
+                if chunk.fn is None:
+                    job[1] = True
+                else:
+                    deferToThreadPool(reactor, self.handler.state.export_tp, chunk.run) \
+                        .addBoth(self.completed, job)
+
+            self.flush()
+        except Exception as excep:
+            self.abort(excep)
 
-            data = self.zip_chunk()
+    def completed(self, result, job):
+        job[1], job[2] = True, result
+
+        if self.handler is not None:
+            self.schedule()
+
+    def flush(self):
+        while self.handler is not None and self.pending and self.pending[0][1]:
+            chunk, _, result = self.pending.popleft()
+
+            if isinstance(result, Failure):
+                result.raiseException()
+
+            data = chunk.process(result)
             if data:
                 self.handler.request.write(data)
-            else:
-                self.stopProducing()
-        except:
+
+        if self.handler is not None and self.exhausted and not self.pending:
             self.stopProducing()
-            raise
 
-    def stopProducing(self):
-        self.handler.request.unregisterProducer()
-        self.handler.request.finish()
-        self.handler = None
+    def abort(self, excep):
+        log.err("Unable to complete the export: %s", excep)
+
+        if self.handler is None:
+            return
+
+        request, self.handler = self.handler.request, None
+        self.pending.clear()
+        request.unregisterProducer()
+
+        # the response is not finished so that the client does not take
+        # the truncated archive for a complete one
+        request.transport.abortConnection()
+
         self.finish.callback(None)
 
-    def zip_chunk(self):
-        chunk = []
-        chunk_size = 0
+    def pauseProducing(self):
+        self.paused = True
 
-        for data in self.zipstreamObject:
-            if data:
-                chunk_size += len(data)
-                chunk.append(data)
-                if chunk_size >= Settings.file_chunk_size:
-                    return ''.join(chunk)
+    def resumeProducing(self):
+        self.paused = False
+        self.schedule()
 
-        return ''.join(chunk)
+    def stopProducing(self):
+        if self.handler is None:
+            return
+
+        request, self.handler = self.handler.request, None
+        self.pending.clear()
+        request.unregisterProducer()
+        request.finish()
+        self.finish.callback(None)
 
 
 class ExportHandler(BaseHandler):
@@ -130,6 +186,12 @@ class ExportHandler(BaseHandler):
         self.request.setHeader('Content-Type', 'application/octet-stream')
         self.request.setHeader('Content-Disposition', 'attachment; filename=\"%s.zip\"' % tip_export['tip']['sequence_number'])
 
-        self.zip_stream = iter(ZipStream(tip_export['files']))
+        zip_stream = ZipStream(tip_export['files'],
+                               chunk_size=Settings.file_chunk_size,
+                               open_file=Storage.open)
+
+        size = zip_stream.get_size()
+        if size is not None:
+            self.request.setHeader('Content-Length', str(size))
 
-        yield ZipStreamProducer(self, self.zip_stream).start()
+        yield ZipStreamProducer(self, zip_stream).start()
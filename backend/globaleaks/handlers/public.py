@@ -1,14 +1,14 @@
 # -*- coding: utf-8 -*-
 #
 # Handlers dealing with public API exporting main platform configuration/resources
-import copy
+from sqlalchemy.sql.expression import or_
 
 from globaleaks import models, LANGUAGES_SUPPORTED, LANGUAGES_SUPPORTED_CODES
 from globaleaks.handlers.admin.file import db_get_file
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models.config import ConfigFactory
 from globaleaks.models.l10n import NodeL10NFactory
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.state import State
 from globaleaks.utils.sets import merge_dicts
 from globaleaks.utils.structures import get_localized_values
@@ -50,35 +50,53 @@ def db_prepare_receivers_serialization(session, receivers):
 
 
 def db_prepare_fields_serialization(session, fields):
+    """
+    Load with a fixed number of queries for each level of nesting all the
+    objects needed to serialize the specified fields and their children.
+    """
     ret = {
         'fields': {},
+        'templates': {},
         'attrs': {},
         'options': {},
         'triggers': {}
     }
 
-    fields_ids = []
-    for f in fields:
-        fields_ids.append(f.id)
-        if f.template_id is not None:
-            fields_ids.append(f.template_id)
+    objs = {f.id: f for f in fields}
+    templates_ids = set(f.template_id for f in fields if f.template_id is not None)
 
-    tmp = copy.deepcopy(fields_ids)
+    # the children of each field are the children of its template if any
+    tmp = list(objs) + list(templates_ids)
     while tmp:
-        fs = session.query(models.Field).filter(models.Field.fieldgroup_id.in_(tmp))
+        fs = session.query(models.Field).filter(or_(models.Field.fieldgroup_id.in_(tmp),
+                                                    models.Field.id.in_(tmp)))
 
-        tmp = []
+        parents_ids = set(tmp)
+        tmp = set()
         for f in fs:
-            tmp.append(f.id)
-            if f.template_id is not None:
-                tmp.append(f.template_id)
+            if f.fieldgroup_id in parents_ids:
+                if f.fieldgroup_id not in ret['fields']:
+                    ret['fields'][f.fieldgroup_id] = []
+                ret['fields'][f.fieldgroup_id].append(f)
+
+            if f.id in parents_ids:
+                objs[f.id] = f
+            elif f.id not in objs:
+                objs[f.id] = f
+                tmp.add(f.id)
 
-            if f.fieldgroup_id not in ret['fields']:
-                ret['fields'][f.fieldgroup_id] = []
-            ret['fields'][f.fieldgroup_id].append(f)
+            if f.template_id is not None and f.template_id not in templates_ids:
+                templates_ids.add(f.template_id)
+                if f.template_id not in objs:
+                    tmp.add(f.template_id)
 
-        fields_ids.extend(tmp)
+        tmp = list(tmp)
 
+    for template_id in templates_ids:
+        if template_id in objs:
+            ret['templates'][template_id] = objs[template_id]
+
+    fields_ids = list(objs)
     if fields_ids:
         objs = session.query(models.FieldAttr).filter(models.FieldAttr.field_id.in_(fields_ids))
         for obj in objs:
@@ -96,9 +114,45 @@ def db_prepare_fields_serialization(session, fields):
 
         objs = session.query(models.FieldOption).filter(models.FieldOption.trigger_field.in_(fields_ids))
         for obj in objs:
-            if obj.field_id not in ret['triggers']:
-                ret['triggers'][obj.field_id] = []
-            ret['triggers'][obj.field_id].append(obj)
+            if obj.trigger_field not in ret['triggers']:
+                ret['triggers'][obj.trigger_field] = []
+            ret['triggers'][obj.trigger_field].append(obj)
+
+    return ret
+
+
+def db_prepare_steps_serialization(session, steps):
+    ret = {'children': {}}
+
+    steps_ids = [s.id for s in steps]
+
+    fields = []
+    if steps_ids:
+        fields = session.query(models.Field).filter(models.Field.step_id.in_(steps_ids)).all()
+        for f in fields:
+            if f.step_id not in ret['children']:
+                ret['children'][f.step_id] = []
+            ret['children'][f.step_id].append(f)
+
+    ret.update(db_prepare_fields_serialization(session, fields))
+
+    return ret
+
+
+def db_prepare_questionnaires_serialization(session, questionnaires):
+    ret = {'steps': {}}
+
+    questionnaires_ids = [q.id for q in questionnaires]
+
+    steps = []
+    if questionnaires_ids:
+        steps = session.query(models.Step).filter(models.Step.questionnaire_id.in_(questionnaires_ids)).all()
+        for s in steps:
+            if s.questionnaire_id not in ret['steps']:
+                ret['steps'][s.questionnaire_id] = []
+            ret['steps'][s.questionnaire_id].append(s)
+
+    ret.update(db_prepare_steps_serialization(session, steps))
 
     return ret
 
@@ -163,7 +217,7 @@ def serialize_context(session, context, language, data=None):
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-def serialize_questionnaire(session, tid, questionnaire, language):
+def serialize_questionnaire(session, tid, questionnaire, language, data=None):
     """
     Serialize the specified questionnaire
 
@@ -171,14 +225,16 @@ def serialize_questionnaire(session, tid, questionnaire, language):
     :param language: the language in which to localize data.
     :return: a dictionary representing the serialization of the questionnaire.
     """
-    steps = session.query(models.Step).filter(models.Step.questionnaire_id == questionnaire.id,
-                                              models.Questionnaire.id == questionnaire.id)
+    if data is None:
+        data = db_prepare_questionnaires_serialization(session, [questionnaire])
+
+    steps = data['steps'].get(questionnaire.id, [])
 
     ret_dict = {
         'id': questionnaire.id,
         'editable': questionnaire.editable and questionnaire.tid == tid,
         'name': questionnaire.name,
-        'steps': sorted([serialize_step(session, tid, s, language) for s in steps],
+        'steps': sorted([serialize_step(session, tid, s, language, data) for s in steps],
                         key=lambda x: x['presentation_order'])
     }
 
@@ -238,7 +294,7 @@ def serialize_field(session, tid, field, language, data=None):
         data = db_prepare_fields_serialization(session, [field])
 
     if field.template_id is not None:
-        f_to_serialize = session.query(models.Field).filter(models.Field.id == field.template_id, models.Field.tid == field.tid).one_or_none()
+        f_to_serialize = data['templates'][field.template_id]
     else:
         f_to_serialize = field
 
@@ -247,8 +303,7 @@ def serialize_field(session, tid, field, language, data=None):
         attrs[attr.name] = serialize_field_attr(attr, language)
 
     triggered_by_options = []
-    _triggered_by_options = session.query(models.FieldOption).filter(models.FieldOption.trigger_field == field.id, models.Field.tid == field.tid)
-    for trigger in _triggered_by_options:
+    for trigger in data['triggers'].get(field.id, []):
         triggered_by_options.append({
             'field': trigger.field_id,
             'option': trigger.id
@@ -273,13 +328,13 @@ def serialize_field(session, tid, field, language, data=None):
         'triggered_by_score': field.triggered_by_score,
         'triggered_by_options':  triggered_by_options,
         'options': [serialize_field_option(o, language) for o in data['options'].get(f_to_serialize.id, [])],
-        'children': [serialize_field(session, tid, f, language) for f in data['fields'].get(f_to_serialize.id, [])]
+        'children': [serialize_field(session, tid, f, language, data) for f in data['fields'].get(f_to_serialize.id, [])]
     }
 
     return get_localized_values(ret_dict, f_to_serialize, field.localized_keys, language)
 
 
-def serialize_step(session, tid, step, language):
+def serialize_step(session, tid, step, language, data=None):
     """
     Serialize a step, localizing its content depending on the language.
 
@@ -287,9 +342,10 @@ def serialize_step(session, tid, step, language):
     :param language: the language in which to localize data
     :return: a serialization of the object
     """
-    children = session.query(models.Field).filter(models.Field.step_id == step.id)
+    if data is None:
+        data = db_prepare_steps_serialization(session, [step])
 
-    data = db_prepare_fields_serialization(session, children)
+    children = data['children'].get(step.id, [])
 
     ret_dict = {
         'id': step.id,
@@ -341,13 +397,95 @@ def db_get_public_context_list(session, tid, language):
     return [serialize_context(session, context, language, data) for context in contexts]
 
 
+class QuestionnaireCache(object):
+    """
+    Cache of the compiled questionnaires indexed by (questionnaire id, version).
+
+    A compiled questionnaire is its serialization without localization and
+    the version is incremented at every change of the questionnaires so that
+    the compilations in progress during a change are never reused.
+    """
+    version = 0
+    compiled_dict = {}
+
+    @classmethod
+    def get(cls, session, questionnaires):
+        version = cls.version
+
+        ret = {}
+        missing = []
+        for questionnaire in questionnaires:
+            compiled = cls.compiled_dict.get((questionnaire.id, version))
+            if compiled is None:
+                missing.append(questionnaire)
+            else:
+                ret[questionnaire.id] = compiled
+
+        if missing:
+            data = db_prepare_questionnaires_serialization(session, missing)
+
+            for questionnaire in missing:
+                ret[questionnaire.id] = serialize_questionnaire(session, questionnaire.tid, questionnaire, None, data)
+
+                if version == cls.version:
+                    cls.compiled_dict[(questionnaire.id, version)] = ret[questionnaire.id]
+
+        return ret
+
+    @classmethod
+    def invalidate(cls):
+        cls.version += 1
+        cls.compiled_dict = {}
+
+
+def localize_field(field, editable, language):
+    ret_dict = dict(field)
+
+    ret_dict['editable'] = field['editable'] and editable
+    ret_dict['triggered_by_options'] = [dict(t) for t in field['triggered_by_options']]
+
+    ret_dict['attrs'] = {}
+    for name, attr in field['attrs'].items():
+        ret_dict['attrs'][name] = dict(attr)
+        if attr['type'] == u'localized':
+            get_localized_values(ret_dict['attrs'][name], attr, ['value'], language)
+
+    ret_dict['options'] = [get_localized_values(dict(o), o, models.FieldOption.localized_keys, language) for o in field['options']]
+    ret_dict['children'] = [localize_field(f, editable, language) for f in field['children']]
+
+    return get_localized_values(ret_dict, field, models.Field.localized_keys, language)
+
+
+def localize_questionnaire(questionnaire, editable, language):
+    """
+    Localize a compiled questionnaire.
+
+    :param editable: False if the questionnaire is not owned by the tenant
+    :param language: the language in which to localize data
+    :return: the same serialization returned by serialize_questionnaire
+    """
+    steps = []
+    for step in questionnaire['steps']:
+        step_dict = dict(step)
+        step_dict['children'] = [localize_field(f, editable, language) for f in step['children']]
+        steps.append(get_localized_values(step_dict, step, models.Step.localized_keys, language))
+
+    ret_dict = dict(questionnaire)
+    ret_dict['editable'] = questionnaire['editable'] and editable
+    ret_dict['steps'] = steps
+
+    return get_localized_values(ret_dict, questionnaire, models.Questionnaire.localized_keys, language)
+
+
 def db_get_questionnaire_list(session, tid, language):
     questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_(set([1, tid])),
                                                                 models.Context.questionnaire_id == models.Questionnaire.id,
                                                                 models.Context.id == models.ReceiverContext.context_id,
-                                                                models.Context.tid == tid)
+                                                                models.Context.tid == tid).all()
+
+    compiled = QuestionnaireCache.get(session, questionnaires)
 
-    return [serialize_questionnaire(session, tid, questionnaire, language) for questionnaire in questionnaires]
+    return [localize_questionnaire(compiled[q.id], q.tid == tid, language) for q in questionnaires]
 
 
 def db_get_public_receiver_list(session, tid, language):
@@ -367,7 +505,7 @@ def db_get_public_receiver_list(session, tid, language):
     return ret
 
 
-@transact
+@transact_ro
 def get_public_resources(session, tid, language):
     return {
         'node': db_serialize_node(session, tid, language),
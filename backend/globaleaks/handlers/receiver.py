@@ -4,12 +4,12 @@
 from sqlalchemy.sql.expression import func, distinct
 
 from globaleaks import models
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, stream_list
 from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_itip
 from globaleaks.handlers.submission import db_serialize_archived_preview_schema
 from globaleaks.handlers.user import db_user_update_user
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest import requests, errors
 from globaleaks.state import State
 from globaleaks.utils.structures import get_localized_values
@@ -61,7 +61,7 @@ def update_receiver_settings(session, state, tid, receiver_id, request, language
     return receiver_serialize_receiver(session, tid, receiver, user, language)
 
 
-@transact
+@transact_ro
 def get_receivertip_list(session, tid, receiver_id, language):
     rtip_summary_list = []
 
@@ -192,7 +192,7 @@ class TipsCollection(BaseHandler):
     def get(self):
         return get_receivertip_list(self.request.tid,
                                     self.current_user.user_id,
-                                    self.request.language)
+                                    self.request.language).addCallback(stream_list)
 
 
 class TipsOperations(BaseHandler):
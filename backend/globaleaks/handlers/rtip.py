@@ -2,14 +2,13 @@
 #
 # Handlers dealing with tip interface for receivers (rtip)
 import os
-import string
 
 from twisted.internet import threads
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.custodian import serialize_identityaccessrequest, db_get_identityaccessrequest_list
+from globaleaks.handlers.custodian import serialize_identityaccessrequest
 from globaleaks.handlers.operation import OperationHandler
 from globaleaks.handlers.submission import serialize_usertip
 from globaleaks.models import serializers
@@ -17,15 +16,19 @@ from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
 from globaleaks.settings import Settings
 from globaleaks.utils.security import directory_traversal_check
+from globaleaks.utils.storage import Storage
 from globaleaks.state import State
 from globaleaks.utils.utility import log, get_expiration, datetime_now, datetime_never, \
     datetime_to_ISO8601
 
 
-def receiver_serialize_rfile(session, rfile):
-    ifile = session.query(models.InternalFile) \
-                   .filter(models.InternalFile.id == models.ReceiverFile.internalfile_id,
-                           models.ReceiverFile.id == rfile.id).one()
+def receiver_serialize_rfile(session, rfile, data=None):
+    if data is not None:
+        ifile = data['ifiles'][rfile.internalfile_id]
+    else:
+        ifile = session.query(models.InternalFile) \
+                       .filter(models.InternalFile.id == models.ReceiverFile.internalfile_id,
+                               models.ReceiverFile.id == rfile.id).one()
 
     if rfile.status == 'unavailable':
         return {
@@ -54,8 +57,11 @@ def receiver_serialize_rfile(session, rfile):
     }
 
 
-def receiver_serialize_wbfile(session, wbfile):
-    rtip = models.db_get(session, models.ReceiverTip, models.ReceiverTip.id == wbfile.receivertip_id)
+def receiver_serialize_wbfile(session, wbfile, data=None):
+    if data is not None:
+        receiver_id = data['receivers_by_rtip'][wbfile.receivertip_id]
+    else:
+        receiver_id = models.db_get(session, models.ReceiverTip, models.ReceiverTip.id == wbfile.receivertip_id).receiver_id
 
     return {
         'id': wbfile.id,
@@ -65,18 +71,21 @@ def receiver_serialize_wbfile(session, wbfile):
         'size': wbfile.size,
         'content_type': wbfile.content_type,
         'downloads': wbfile.downloads,
-        'author': rtip.receiver_id
+        'author': receiver_id
     }
 
 
-def serialize_comment(session, comment):
+def serialize_comment(session, comment, data=None):
     author = 'Recipient'
 
     if comment.type == 'whistleblower':
         author = 'Whistleblower'
     elif comment.author_id is not None:
-        author = session.query(models.User) \
-                        .filter(models.User.id == comment.author_id).one().name
+        if data is not None:
+            author = data['users_names'][comment.author_id]
+        else:
+            author = session.query(models.User) \
+                            .filter(models.User.id == comment.author_id).one().name
 
     return {
         'id': comment.id,
@@ -87,9 +96,11 @@ def serialize_comment(session, comment):
     }
 
 
-def serialize_message(session, message):
+def serialize_message(session, message, data=None):
     if message.type == 'whistleblower':
         author = 'Whistleblower'
+    elif data is not None:
+        author = data['users_names'][data['receivers_by_rtip'][message.receivertip_id]]
     else:
         author = session.query(models.User) \
                         .filter(models.User.id == models.ReceiverTip.receiver_id,
@@ -105,19 +116,65 @@ def serialize_message(session, message):
     }
 
 
+def db_prefetch_rtip_data(session, rtip, itip):
+    """
+    Load with a fixed number of queries all the objects related to a tip
+    and the data needed by their serialization.
+    """
+    data = {
+        'itip': itip,
+        'comments': session.query(models.Comment).filter(models.Comment.internaltip_id == itip.id).all(),
+        'messages': session.query(models.Message).filter(models.Message.receivertip_id == rtip.id).all(),
+        'rfiles': session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == rtip.id).all(),
+        'iars': session.query(models.IdentityAccessRequest).filter(models.IdentityAccessRequest.receivertip_id == rtip.id).all(),
+        'ifiles': {},
+        'receivers_by_rtip': {},
+        'users_names': {},
+        'tenant_users_ids': set()
+    }
+
+    for rtip_id, receiver_id in session.query(models.ReceiverTip.id, models.ReceiverTip.receiver_id) \
+                                       .filter(models.ReceiverTip.internaltip_id == itip.id):
+        data['receivers_by_rtip'][rtip_id] = receiver_id
+
+    data['wbfiles'] = []
+    if data['receivers_by_rtip']:
+        data['wbfiles'] = session.query(models.WhistleblowerFile) \
+                                 .filter(models.WhistleblowerFile.receivertip_id.in_(data['receivers_by_rtip'].keys())).all()
+
+    ifiles_ids = set(rfile.internalfile_id for rfile in data['rfiles'])
+    if ifiles_ids:
+        for ifile in session.query(models.InternalFile).filter(models.InternalFile.id.in_(ifiles_ids)):
+            data['ifiles'][ifile.id] = ifile
+
+    users_ids = set(comment.author_id for comment in data['comments'] if comment.author_id is not None)
+    users_ids.update(iar.reply_user_id for iar in data['iars'] if iar.reply_user_id is not None)
+    users_ids.add(rtip.receiver_id)
+
+    for user_id, user_tid, user_name in session.query(models.User.id, models.User.tid, models.User.name) \
+                                               .filter(models.User.id.in_(users_ids)):
+        data['users_names'][user_id] = user_name
+        if user_tid == itip.tid:
+            data['tenant_users_ids'].add(user_id)
+
+    return data
+
+
 def serialize_rtip(session, rtip, itip, language):
     user_id = rtip.receiver_id
 
     ret = serialize_usertip(session, rtip, itip, language)
 
+    data = db_prefetch_rtip_data(session, rtip, itip)
+
     ret['id'] = rtip.id
     ret['receiver_id'] = user_id
     ret['label'] = rtip.label
-    ret['comments'] = db_get_itip_comment_list(session, itip.tid, itip)
-    ret['messages'] = db_get_itip_message_list(session, itip.tid, rtip)
-    ret['rfiles'] = db_receiver_get_rfile_list(session, itip.tid, rtip.id)
-    ret['wbfiles'] = db_receiver_get_wbfile_list(session, itip.tid, itip.id)
-    ret['iars'] = db_get_identityaccessrequest_list(session, itip.tid, rtip.id)
+    ret['comments'] = [serialize_comment(session, comment, data) for comment in data['comments']]
+    ret['messages'] = [serialize_message(session, message, data) for message in data['messages']]
+    ret['rfiles'] = [receiver_serialize_rfile(session, rfile, data) for rfile in data['rfiles']]
+    ret['wbfiles'] = [receiver_serialize_wbfile(session, wbfile, data) for wbfile in data['wbfiles']]
+    ret['iars'] = [serialize_identityaccessrequest(session, itip.tid, iar, data) for iar in data['iars']]
     ret['enable_notifications'] = bool(rtip.enable_notifications)
 
     return ret
@@ -352,6 +409,8 @@ def create_comment(session, tid, user_id, rtip_id, request):
     session.add(comment)
     session.flush()
 
+    models.db_add_notification_event(session, tid, comment)
+
     return serialize_comment(session, comment)
 
 
@@ -472,19 +531,16 @@ class WhistleblowerFileHandler(BaseHandler):
 
         rtip = yield get_rtip(self.request.tid, self.current_user.user_id, tip_id, self.request.language)
 
-        # First: dump the file in the filesystem
-        filename = string.split(os.path.basename(self.uploaded_file['path']), '.aes')[0] + '.plain'
-
-        dst = os.path.join(Settings.attachments_path, filename)
-
-        directory_traversal_check(Settings.attachments_path, dst)
-
-        yield threads.deferToThread(self.write_upload_plaintext_to_disk, dst)
+        # First: dump the file in the attachments storage
+        yield threads.deferToThread(self.write_upload_to_storage)
 
         self.uploaded_file['creation_date'] = datetime_now()
         self.uploaded_file['submission'] = False
 
-        yield register_wbfile_on_db(self.request.tid, rtip['id'], self.uploaded_file)
+        try:
+            yield register_wbfile_on_db(self.request.tid, rtip['id'], self.uploaded_file)
+        finally:
+            Storage.unpin(self.uploaded_file['path'])
 
         log.debug("Recorded new WhistleblowerFile %s", self.uploaded_file['name'])
 
@@ -140,10 +140,17 @@ class SignupActivation(BaseHandler):
   check_roles = 'unauthenticated'
   invalidate_cache = True
 
+  def get_cache_invalidation_targets(self, token):
+      # invalidate also cache of tenant 1
+      return [(self.request.tid, None), (1, None)]
+
   def get(self, token):
-      ret = signup_activation(self.state, self.request.tid, token, self.request.language)
+      # the cache invalidation decorator wraps only the writes and so
+      # the activation, performed with a GET, invalidates explicitly
+      def invalidate(ret):
+          for tid, resources in self.get_cache_invalidation_targets(token):
+              apicache.ApiCache.invalidate(tid, resources)
 
-      # invalidate also cache of tenant 1
-      apicache.ApiCache.invalidate(1)
+          return ret
 
-      return ret
+      return signup_activation(self.state, self.request.tid, token, self.request.language).addBoth(invalidate)
@@ -1,11 +1,167 @@
 # -*- coding: utf-8 -*-
 #
 # Handler exposing application files
+import hashlib
+import mimetypes
 import os
+import re
+from io import BytesIO
 
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import errors
+from globaleaks.rest.apicache import choose_encoding, coding_etag, etag_match, gzipdata
+from globaleaks.settings import Settings
 from globaleaks.utils.security import directory_traversal_check
+from globaleaks.utils.utility import log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the files whose name includes the hash of their content never change
+FINGERPRINT_REGEXP = re.compile(r'\.[0-9a-f]{8,}\.[^/]+$')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml',
+                      'application/vnd.ms-fontobject', 'application/x-font-ttf')
+
+
+class StaticFile(object):
+    """
+    Entry of the static file index
+
+    The encodings of the files exceeding the limits of the cache are not
+    kept in memory and the files are served from disk.
+    """
+    def __init__(self, path, content_type, size, etag):
+        self.path = path
+        self.content_type = content_type
+        self.size = size
+        self.etag = etag
+        self.gzip_path = None
+        self.identity = None
+        self.gzip = None
+        self.brotli = None
+        self.immutable = FINGERPRINT_REGEXP.search(path) is not None
+
+    def get_memory_size(self):
+        return sum(len(x) for x in (self.identity, self.gzip, self.brotli) if x is not None)
+
+
+def read_file(path):
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def build_static_file(abspath, budget):
+    """
+    Index a file along with its precompressed .gz and .br variants
+
+    @param budget: the memory still available to the cache
+    """
+    name = abspath[:-3] if abspath.endswith('.gz') else abspath
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    stat = os.stat(abspath)
+
+    entry = StaticFile(abspath, content_type, stat.st_size, '"%x-%x"' % (int(stat.st_mtime), stat.st_size))
+
+    if stat.st_size > Settings.static_cache_max_file_size or stat.st_size > budget:
+        if os.path.isfile(abspath + '.gz'):
+            entry.gzip_path = abspath + '.gz'
+
+        return entry
+
+    if abspath.endswith('.gz'):
+        # the file is available only compressed
+        entry.gzip = read_file(abspath)
+        entry.etag = '"%s"' % hashlib.sha256(entry.gzip).hexdigest()
+        return entry
+
+    data = read_file(abspath)
+
+    entry.identity = data
+    entry.etag = '"%s"' % hashlib.sha256(data).hexdigest()
+
+    if content_type.startswith(COMPRESSIBLE_TYPES):
+        entry.gzip = read_file(abspath + '.gz') or gzipdata(data)
+
+        entry.brotli = read_file(abspath + '.br')
+        if entry.brotli is None and brotli is not None:
+            entry.brotli = brotli.compress(data)
+
+        # the compressed encodings not reducing the size are discarded
+        for encoding in ('gzip', 'brotli'):
+            if getattr(entry, encoding) is not None and len(getattr(entry, encoding)) >= len(data):
+                setattr(entry, encoding, None)
+
+    if entry.get_memory_size() > budget:
+        entry.identity = entry.gzip = entry.brotli = None
+
+    return entry
+
+
+class StaticFileIndex(object):
+    """
+    Immutable index of the client files built at startup.
+
+    The index maps the path of each file relative to the client directory
+    to a StaticFile holding its content type, its ETag and its identity,
+    gzip and brotli encodings; the memory used is bounded by
+    Settings.static_cache_size and the smaller files are cached first.
+    """
+    index_dict = {}
+
+    @classmethod
+    def load(cls, root):
+        root = os.path.abspath(root)
+
+        files = []
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                abspath = os.path.join(dirpath, filename)
+                if filename.endswith('.br'):
+                    continue
+
+                if filename.endswith('.gz') and os.path.isfile(abspath[:-3]):
+                    continue
+
+                files.append((os.path.getsize(abspath), abspath))
+
+        index = {}
+        memory_size = 0
+        for _, abspath in sorted(files):
+            try:
+                entry = build_static_file(abspath, Settings.static_cache_size - memory_size)
+            except (IOError, OSError) as excep:
+                log.err("Unable to index the static file %s: %s", abspath, excep)
+                continue
+
+            memory_size += entry.get_memory_size()
+
+            relpath = os.path.relpath(abspath, root)
+            if relpath.endswith('.gz'):
+                relpath = relpath[:-3]
+
+            index[relpath.replace(os.sep, '/')] = entry
+
+        log.debug("Indexed %d static files using %d bytes of memory", len(index), memory_size)
+
+        cls.index_dict[root] = index
+
+        return index
+
+    @classmethod
+    def get(cls, root, relpath):
+        index = cls.index_dict.get(root)
+        if index is None:
+            index = cls.load(root)
+
+        return index.get(relpath)
 
 
 class StaticFileHandler(BaseHandler):
@@ -25,10 +181,44 @@ class StaticFileHandler(BaseHandler):
 
         directory_traversal_check(self.root, abspath)
 
-        if os.path.exists(abspath + '.gz') and os.path.isfile(abspath + '.gz'):
-            return self.write_file(filename + '.gz', abspath + '.gz')
-        if os.path.exists(abspath) and os.path.isfile(abspath):
-            return self.write_file(filename, abspath)
-        else:
+        entry = StaticFileIndex.get(self.root[:-1], abspath[len(self.root):])
+        if entry is None:
             raise errors.ResourceNotFound()
 
+        accept_encoding = self.request.getHeader(b'accept-encoding')
+
+        if entry.path.endswith('.gz'):
+            # the file is available only compressed
+            coding = 'gzip'
+        elif entry.identity is None:
+            coding = choose_encoding(accept_encoding, ['gzip'] if entry.gzip_path is not None else [])
+        else:
+            available = [c for c, data in (('br', entry.brotli), ('gzip', entry.gzip)) if data is not None]
+            coding = choose_encoding(accept_encoding, available)
+
+        etag = coding_etag(entry.etag, coding)
+
+        self.request.setHeader(b'ETag', etag)
+        self.request.setHeader(b'Vary', b'Accept-Encoding')
+
+        if entry.immutable:
+            self.request.setHeader(b'Cache-Control', b'public, max-age=31536000, immutable')
+        else:
+            self.request.setHeader(b'Cache-Control', b'no-cache')
+
+        if etag_match(self.request.getHeader(b'if-none-match'), etag):
+            self.request.setResponseCode(304)
+            return
+
+        if entry.identity is None and entry.gzip is None:
+            path = entry.gzip_path if coding == 'gzip' and entry.gzip_path is not None else entry.path
+            return self.write_file(os.path.basename(path), path)
+
+        self.request.setHeader(b'Content-Type', entry.content_type)
+
+        if coding != 'identity':
+            self.request.setHeader(b'Content-Encoding', coding)
+
+        data = {'br': entry.brotli, 'gzip': entry.gzip, 'identity': entry.identity}[coding]
+
+        return self.write_file_object(BytesIO(data), len(data))
@@ -267,6 +267,8 @@ def db_create_receivertip(session, receiver, internaltip):
 
     session.add(receivertip)
 
+    models.db_add_notification_event(session, internaltip.tid, receivertip)
+
     return receivertip.id
 
 
@@ -7,7 +7,7 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
 from globaleaks.rest import requests
 from globaleaks.state import State
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import Keyring, PGPContext
 from globaleaks.utils.security import change_password
 from globaleaks.utils.structures import get_localized_values
 from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now, datetime_null
@@ -26,6 +26,9 @@ def parse_pgp_options(state, user, request):
 
         k = pgpctx.load_key(pgp_key_public)
 
+    if user.pgp_key_fingerprint and (k is None or k['fingerprint'] != user.pgp_key_fingerprint):
+        Keyring.invalidate(user.pgp_key_fingerprint)
+
     if k is not None:
         user.pgp_key_public = pgp_key_public
         user.pgp_key_fingerprint = k['fingerprint']
@@ -129,6 +132,7 @@ class UserInstance(BaseHandler):
     """
     check_roles = {'admin', 'receiver', 'custodian'}
     invalidate_cache = True
+    invalidate_cache_resources = ['/public', '/admin/users', '/admin/receivers']
 
     def get(self):
         return get_user_settings(self.request.tid,
@@ -90,6 +90,8 @@ def create_comment(session, tid, wbtip_id, request):
     session.add(comment)
     session.flush()
 
+    models.db_add_notification_event(session, tid, comment)
+
     return serialize_comment(session, comment)
 
 
@@ -124,6 +126,8 @@ def create_message(session, tid, wbtip_id, receiver_id, request):
     session.add(msg)
     session.flush()
 
+    models.db_add_notification_event(session, tid, msg)
+
     return serialize_message(session, msg)
 
 
@@ -88,6 +88,7 @@ class Wizard(BaseHandler):
     """
     check_roles = 'unauthenticated'
     invalidate_cache = True
+    invalidate_cache_shared = True
 
     def post(self):
         request = self.validate_message(self.request.content.read(),
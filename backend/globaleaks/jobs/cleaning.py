@@ -9,8 +9,10 @@ from sqlalchemy import and_, not_
 from sqlalchemy.sql.expression import func
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
 
 from globaleaks import models
+from globaleaks.db import sync_count_file_references
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.rtip import db_delete_itips
@@ -19,6 +21,7 @@ from globaleaks.jobs.base import LoopingJob
 from globaleaks.orm import transact
 from globaleaks.state import State
 from globaleaks.utils.security import overwrite_and_remove
+from globaleaks.utils.storage import Storage, is_blob
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_to_ISO8601, is_expired
 
@@ -111,7 +114,32 @@ class Cleaning(LoopingJob):
 
     @transact
     def get_files_to_secure_delete(self, session):
-        return [x[0] for x in session.query(models.SecureFileDelete.filepath)]
+        """
+        Return the files marked for secure deletion
+        """
+        return list(set(x[0] for x in session.query(models.SecureFileDelete.filepath)))
+
+    def secure_delete_files(self, filepaths):
+        """
+        Remove the files and return the ones whose deletion is completed;
+        the blobs of the attachments storage are kept while they are
+        referenced by other files and the ones pinned by a writer are left
+        to the next run as their reference may never be committed.
+        """
+        deleted = []
+
+        for filepath in filepaths:
+            if is_blob(filepath):
+                # the references are counted in a new transaction holding the
+                # lock of the store so that a concurrent deduplication is seen
+                if Storage.remove_unreferenced(filepath, sync_count_file_references, overwrite_and_remove) is None:
+                    continue
+            else:
+                overwrite_and_remove(filepath)
+
+            deleted.append(filepath)
+
+        return deleted
 
     @transact
     def commit_files_deletion(self, session, filepaths):
@@ -120,12 +148,11 @@ class Cleaning(LoopingJob):
     @inlineCallbacks
     def perform_secure_deletion_of_files(self):
         # Delete files that are marked for secure deletion
-        files_to_delete = yield self.get_files_to_secure_delete()
-        for file_to_delete in files_to_delete:
-            overwrite_and_remove(file_to_delete)
-
-        if files_to_delete:
-            yield self.commit_files_deletion(files_to_delete)
+        filepaths = yield self.get_files_to_secure_delete()
+        if filepaths:
+            filepaths = yield deferToThread(self.secure_delete_files, filepaths)
+            if filepaths:
+                yield self.commit_files_deletion(filepaths)
 
         # Delete the outdated AES files older than 1 day
         files_to_remove = [f for f in os.listdir(self.state.settings.attachments_path) if fnmatch.fnmatch(f, '*.aes')]
@@ -5,15 +5,20 @@
 #
 # Call also the FileProcess working point, in order to verify which
 # kind of file has been submitted.
+import fcntl
 import os
+import threading
+import time
 
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
 
 from globaleaks import models
 from globaleaks.jobs.base import LoopingJob
 from globaleaks.orm import transact
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import Keyring
 from globaleaks.utils.security import generateRandomKey, overwrite_and_remove
+from globaleaks.utils.storage import Storage, is_blob
 from globaleaks.settings import Settings
 from globaleaks.utils.utility import log
 
@@ -50,9 +55,10 @@ def receiverfile_planning(session):
 
         ifile.processing_attempts += 1
 
-        for rtip, user in session.query(models.ReceiverTip, models.User) \
-                                 .filter(models.ReceiverTip.internaltip_id == ifile.internaltip_id,
-                                         models.User.id == models.ReceiverTip.receiver_id):
+        for rtip, user, tid in session.query(models.ReceiverTip, models.User, models.InternalTip.tid) \
+                                      .filter(models.ReceiverTip.internaltip_id == ifile.internaltip_id,
+                                              models.InternalTip.id == ifile.internaltip_id,
+                                              models.User.id == models.ReceiverTip.receiver_id):
             receiverfile = models.ReceiverFile()
             receiverfile.internalfile_id = ifile.id
             receiverfile.receivertip_id = rtip.id
@@ -60,15 +66,16 @@ def receiverfile_planning(session):
             receiverfile.size = ifile.size
             receiverfile.status = u'processing'
 
-            # https://github.com/globaleaks/GlobaLeaks/issues/444
-            # avoid to mark the receiverfile as new if it is part of a submission
-            # this way we avoid to send unuseful messages
-            receiverfile.new = False if ifile.submission else True
-
             session.add(receiverfile)
 
             session.flush()
 
+            # https://github.com/globaleaks/GlobaLeaks/issues/444
+            # avoid to notify the receiverfile if it is part of a submission
+            # this way we avoid to send unuseful messages
+            if not ifile.submission:
+                models.db_add_notification_event(session, tid, receiverfile)
+
             if ifile.id not in receiverfiles_maps:
                 receiverfiles_maps[ifile.id] = {
                   'plaintext_file_needed': False,
@@ -94,81 +101,236 @@ def receiverfile_planning(session):
     return receiverfiles_maps
 
 
-def fsops_pgp_encrypt(state, sf, key, fingerprint):
+def fsops_pgp_encrypt(state, f, key):
     """
-    Encrypt the file for a speficic key
+    Encrypt for a speficic key the data read from a file
 
     return
         path of encrypted file,
         length of the encrypted file
     """
-    pgpctx = PGPContext(state.settings.tmp_path)
-
-    pgpctx.load_key(key)
+    encrypted_file_path = os.path.join(os.path.abspath(state.settings.attachments_path), "pgp_encrypted-%s" % generateRandomKey(16))
 
-    with sf.open('r') as f:
-        encrypted_file_path = os.path.join(os.path.abspath(state.settings.attachments_path), "pgp_encrypted-%s" % generateRandomKey(16))
-        _, encrypted_file_size = pgpctx.encrypt_file(fingerprint, f, encrypted_file_path)
+    _, encrypted_file_size = Keyring.encrypt_file(key, f, encrypted_file_path)
 
     return encrypted_file_path, encrypted_file_size
 
 
-def process_files(state, receiverfiles_maps):
+def set_cloexec(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+
+class PGPSink(object):
     """
-    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
-    @return: return None
+    Sink feeding through a pipe the encryption of a file for a receiver
+
+    The pipes are not inherited by the gpg processes so that the end of the
+    input of an encryption is not kept open by the encryptions running in
+    parallel; the thread is started by start() once all the pipes of the
+    batch are created.
     """
-    for ifile_id, receiverfiles_map in receiverfiles_maps.items():
-        ifile_path = receiverfiles_map['ifile_path']
-        ifile_name = os.path.basename(ifile_path).split('.')[0]
-        plain_path = os.path.join(Settings.attachments_path, "%s.plain" % ifile_name)
-
-        sf = state.get_tmp_file_by_path(ifile_path)
-
-        receiverfiles_map['plaintext_file_needed'] = False
-        for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
-            if rfileinfo['receiver']['pgp_key_public']:
-                try:
-                    new_path, new_size = fsops_pgp_encrypt(state,
-                                                           sf,
-                                                           rfileinfo['receiver']['pgp_key_public'],
-                                                           rfileinfo['receiver']['pgp_key_fingerprint'])
-
-                    log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d",
-                              rcounter,  rfileinfo['receiver']['name'], rfileinfo['path'],
-                              new_path, rfileinfo['size'], new_size)
-
-                    rfileinfo['path'] = new_path
-                    rfileinfo['size'] = new_size
-                    rfileinfo['status'] = u'encrypted'
-                except Exception as excep:
-                    log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
-                            rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
-                    rfileinfo['status'] = u'unavailable'
-            elif state.tenant_cache[receiverfiles_map['tid']].allow_unencrypted:
-                receiverfiles_map['plaintext_file_needed'] = True
-                rfileinfo['status'] = u'reference'
-                rfileinfo['path'] = plain_path
-            else:
-                rfileinfo['status'] = u'nokey'
+    def __init__(self, state, rfileinfo):
+        self.rfileinfo = rfileinfo
+        self.result = None
+        self.error = None
+
+        fd_r, fd_w = os.pipe()
+        set_cloexec(fd_r)
+        set_cloexec(fd_w)
+
+        self.pipe = os.fdopen(fd_w, 'wb')
+
+        self.thread = threading.Thread(target=self.run, args=(state, fd_r))
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def run(self, state, fd):
+        # the read end is closed also on failure so that the writer is not blocked
+        with os.fdopen(fd, 'rb') as f:
+            try:
+                self.result = fsops_pgp_encrypt(state, f, self.rfileinfo['receiver']['pgp_key_public'])
+            except Exception as excep:
+                self.error = excep
+
+    def write(self, data):
+        self.pipe.write(data)
+
+    def close_pipe(self):
+        try:
+            self.pipe.close()
+        except Exception:
+            pass
+
+    def close(self):
+        self.close_pipe()
+
+        self.thread.join()
+
+        return self.error is None
+
+
+class StorageSink(object):
+    """
+    Sink writing the plaintext version of a file to the attachments storage
+    """
+    def __init__(self):
+        self.error = None
+        self.path = None
+        self.writer = Storage.writer()
+
+    def write(self, data):
+        self.writer.write(data)
+
+    def close(self):
+        if self.error is not None:
+            self.writer.abort()
+            return False
+
+        self.path = self.writer.close()
+
+        return True
+
+
+def fanout_file(sf, sinks, stats):
+    """
+    Decrypt the file once writing each chunk to all the sinks;
+    a sink is abandoned as soon as it fails.
+    """
+    alive = list(sinks)
+
+    try:
+        with sf.open('r') as f:
+            for chunk in f.iter_decrypted():
+                if not alive:
+                    break
+
+                for sink in alive[:]:
+                    try:
+                        sink.write(chunk)
+                    except Exception as excep:
+                        sink.error = excep
+                        alive.remove(sink)
+
+                stats['current_bytes'] += len(chunk)
+    except Exception as excep:
+        for sink in alive:
+            sink.error = excep
+    finally:
+        # all the pipes are closed before waiting for any of the encryptions
+        for sink in sinks:
+            if isinstance(sink, PGPSink):
+                sink.close_pipe()
+
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as excep:
+                sink.error = excep
+
+
+def process_file(state, receiverfiles_map, stats):
+    ifile_path = receiverfiles_map['ifile_path']
 
-        if receiverfiles_map['plaintext_file_needed']:
-            log.debug("Not all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s",
-                      ifile_path, plain_path)
+    sf = receiverfiles_map.pop('sf')
 
+    pgp_rfiles = []
+    reference_rfiles = []
+    receiverfiles_map['plaintext_file_needed'] = False
+    for rfileinfo in receiverfiles_map['rfiles']:
+        if rfileinfo['receiver']['pgp_key_public']:
+            pgp_rfiles.append(rfileinfo)
+        elif state.tenant_cache[receiverfiles_map['tid']].allow_unencrypted:
+            receiverfiles_map['plaintext_file_needed'] = True
+            reference_rfiles.append(rfileinfo)
+        else:
+            rfileinfo['status'] = u'nokey'
+
+    plaintext_sink = None
+    if receiverfiles_map['plaintext_file_needed']:
+        log.debug("Not all receivers support PGP and the system allows plaintext version of files: %s saved in the attachments storage",
+                  ifile_path)
+        try:
+            plaintext_sink = StorageSink()
+        except Exception as excep:
+            log.err("Unable to store plaintext version of %s: %s", ifile_path, excep)
+    else:
+        log.debug("All receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+
+    # the file is decrypted once for each group of at most
+    # Settings.delivery_concurrency receivers encrypted in parallel
+    concurrency = max(Settings.delivery_concurrency, 1)
+    batches = [pgp_rfiles[i:i + concurrency] for i in range(0, len(pgp_rfiles), concurrency)] or [[]]
+
+    for batch in batches:
+        sinks = []
+        for rfileinfo in batch:
             try:
-                with sf.open('r') as encrypted_file, open(plain_path, "a+") as plaintext_file:
-                    while True:
-                        chunk = encrypted_file.read(4096)
-                        if not chunk:
-                            break
-                        plaintext_file.write(chunk)
-
-                receiverfiles_map['ifile_path'] = plain_path
+                sinks.append(PGPSink(state, rfileinfo))
             except Exception as excep:
-                log.err("Unable to create plaintext file %s: %s", plain_path, excep)
+                log.err("Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
+                        rfileinfo['receiver']['name'], rfileinfo['path'], excep)
+                rfileinfo['status'] = u'unavailable'
+
+        for sink in sinks:
+            sink.start()
+
+        if plaintext_sink is not None:
+            sinks.append(plaintext_sink)
+
+        if not sinks:
+            continue
+
+        fanout_file(sf, sinks, stats)
+
+        for sink in sinks:
+            if sink is plaintext_sink:
+                continue
+
+            rfileinfo = sink.rfileinfo
+            if sink.error is None:
+                new_path, new_size = sink.result
+
+                log.debug("Switch on Receiver File for %s path %s => %s size %d => %d",
+                          rfileinfo['receiver']['name'], rfileinfo['path'],
+                          new_path, rfileinfo['size'], new_size)
+
+                rfileinfo['path'] = new_path
+                rfileinfo['size'] = new_size
+                rfileinfo['status'] = u'encrypted'
+            else:
+                log.err("Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable.",
+                        rfileinfo['receiver']['name'], rfileinfo['path'], sink.error)
+                rfileinfo['status'] = u'unavailable'
+
+        if plaintext_sink is not None:
+            if plaintext_sink.error is None:
+                receiverfiles_map['ifile_path'] = plaintext_sink.path
+            else:
+                log.err("Unable to store plaintext version of %s: %s", ifile_path, plaintext_sink.error)
+
+            plaintext_sink = None
+
+    # all the receivers without PGP share the stored plaintext version
+    for rfileinfo in reference_rfiles:
+        if receiverfiles_map['ifile_path'] != ifile_path:
+            rfileinfo['status'] = u'reference'
+            rfileinfo['path'] = receiverfiles_map['ifile_path']
         else:
-            log.debug("All receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+            rfileinfo['status'] = u'unavailable'
+
+
+def process_files(state, receiverfiles_maps, stats):
+    """
+    @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
+    @param stats: the dictionary where to report the progress of the job
+    @return: return None
+    """
+    for ifile_id, receiverfiles_map in receiverfiles_maps.items():
+        process_file(state, receiverfiles_map, stats)
+
+        stats['current_files'] += 1
 
 
 @transact
@@ -197,12 +359,52 @@ class Delivery(LoopingJob):
     interval = 5
     monitor_interval = 180
 
+    def __init__(self):
+        self.stats = {
+            'files': 0,
+            'bytes': 0,
+            'throughput': 0,
+            'current_files': 0,
+            'current_bytes': 0,
+            'current_total_files': 0,
+            'current_total_bytes': 0
+        }
+
+        LoopingJob.__init__(self)
+
+    def get_stats(self):
+        return self.stats
+
     @inlineCallbacks
     def operation(self):
         """
         This function creates receiver files
         """
         receiverfiles_maps = yield receiverfile_planning()
-        if receiverfiles_maps:
-            process_files(self.state, receiverfiles_maps)
+        if not receiverfiles_maps:
+            return
+
+        for receiverfiles_map in receiverfiles_maps.values():
+            receiverfiles_map['sf'] = self.state.get_tmp_file_by_path(receiverfiles_map['ifile_path'])
+
+        self.stats['current_files'] = self.stats['current_bytes'] = 0
+        self.stats['current_total_files'] = len(receiverfiles_maps)
+        self.stats['current_total_bytes'] = sum(m['ifile_size'] for m in receiverfiles_maps.values())
+
+        start_time = time.time()
+
+        try:
+            yield deferToThread(process_files, self.state, receiverfiles_maps, self.stats)
+        finally:
+            elapsed = time.time() - start_time
+            self.stats['files'] += self.stats['current_files']
+            self.stats['bytes'] += self.stats['current_bytes']
+            self.stats['throughput'] = int(self.stats['current_bytes'] / elapsed) if elapsed else 0
+
+        try:
             yield update_internalfile_and_store_receiverfiles(receiverfiles_maps)
+        finally:
+            # the plaintext versions stored are referenced by the files
+            for receiverfiles_map in receiverfiles_maps.values():
+                if is_blob(receiverfiles_map['ifile_path']):
+                    Storage.unpin(receiverfiles_map['ifile_path'])
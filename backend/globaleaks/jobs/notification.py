@@ -1,7 +1,9 @@
 #######i -*- coding: utf-8 -*-
 # Implement the notification of new submissions
 import copy
+from datetime import timedelta
 
+from sqlalchemy import func, not_
 from twisted.internet import defer
 
 from globaleaks import models
@@ -12,9 +14,9 @@ from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serializ
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import NetLoopingJob
 from globaleaks.orm import transact
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import Keyring
 from globaleaks.utils.templating import Templating
-from globaleaks.utils.utility import log
+from globaleaks.utils.utility import datetime_now, log
 
 
 trigger_template_map = {
@@ -33,14 +35,23 @@ trigger_model_map = {
 }
 
 
+# the mails are retried after 30s, 1m, 2m, ... up to MAIL_MAX_ATTEMPTS times
+MAIL_MAX_ATTEMPTS = 10
+MAIL_RETRY_DELAY = 30
+
+
 def gen_cache_key(*args):
     return '-'.join(['{}'.format(arg) for arg in args])
 
 
 class MailGenerator(object):
+    # maximum number of events processed by each run of the notification job
+    batch_size = 100
+
     def __init__(self, state):
         self.state = state
         self.cache = {}
+        self.digests = {}
 
     def serialize_config(self, session, key, tid, language):
         cache_key = gen_cache_key(key, tid, language)
@@ -167,6 +178,29 @@ class MailGenerator(object):
             log.debug("Discarding emails for %s due to receiver's preference.", user_id)
             return
 
+        # the events of the tenants using the digest mode are collected per receiver
+        if self.state.tenant_cache[tid].notification.notification_digest_interval:
+            self.digests.setdefault((tid, user_id), []).append(data)
+            return
+
+        self.spool_mail(session, tid, data)
+
+    def process_digests(self, session):
+        for (tid, _), events in self.digests.items():
+            if len(events) == 1:
+                data = events[0]
+            else:
+                data = {
+                    'type': u'digest',
+                    'user': events[0]['user'],
+                    'events': events
+                }
+
+            self.spool_mail(session, tid, data)
+
+    def spool_mail(self, session, tid, data):
+        user_id = data['user']['id']
+
         # https://github.com/globaleaks/GlobaLeaks/issues/798
         # TODO: the current solution is global and configurable only by the admin
         sent_emails = self.state.get_mail_counter(user_id)
@@ -197,9 +231,7 @@ class MailGenerator(object):
 
         # If the receiver has encryption enabled encrypt the mail body
         if data['user']['pgp_key_public']:
-            pgpctx = PGPContext(self.state.settings.tmp_path)
-            fingerprint = pgpctx.load_key(data['user']['pgp_key_public'])['fingerprint']
-            body = pgpctx.encrypt_message(fingerprint, body)
+            body = Keyring.encrypt_message(data['user']['pgp_key_public'], body)
 
         session.add(models.Mail({
             'address': data['user']['mail_address'],
@@ -208,50 +240,108 @@ class MailGenerator(object):
             'tid': tid,
         }))
 
+    def get_collecting_tenants(self, session):
+        """
+        Return the tenants in digest mode whose oldest pending event
+        is more recent than their digest interval
+        """
+        intervals = {tid: cache_item.notification.notification_digest_interval
+                     for tid, cache_item in self.state.tenant_cache.items()
+                     if cache_item.notification.notification_digest_interval}
+
+        if not intervals:
+            return []
+
+        now = datetime_now()
+
+        return [tid for tid, first_event_date in session.query(models.NotificationEvent.tid,
+                                                               func.min(models.NotificationEvent.creation_date)) \
+                                                        .filter(models.NotificationEvent.tid.in_(intervals.keys())) \
+                                                        .group_by(models.NotificationEvent.tid)
+                if first_event_date > now - timedelta(minutes=intervals[tid])]
+
     @transact
     def generate(self, session):
-        for trigger in ['ReceiverTip', 'Comment', 'Message', 'ReceiverFile']:
-            model = trigger_model_map[trigger]
+        """
+        Process a batch of the events of the outbox
+        """
+        query = session.query(models.NotificationEvent)
 
-            for tid, cache_item in self.state.tenant_cache.items():
-                if cache_item.notification.disable_receiver_notification_emails:
-                    session.query(models.ReceiverTip).filter(models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                             models.InternalTip.tid == tid).update({'new': False})
+        # the events of the tenants in digest mode are left in the outbox until the digest is due
+        collecting_tenants = self.get_collecting_tenants(session)
+        if collecting_tenants:
+            query = query.filter(not_(models.NotificationEvent.tid.in_(collecting_tenants)))
 
-                    session.query(models.Comment).filter(models.Comment.internaltip_id == models.InternalTip.id,
-                                                         models.InternalTip.tid == tid).update({'new': False})
+        events = query.order_by(models.NotificationEvent.id).limit(self.batch_size).all()
 
-                    session.query(models.Message).filter(models.Message.receivertip_id == models.ReceiverTip.id,
-                                                         models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                         models.InternalTip.tid == tid).update({'new': False})
+        if not events:
+            return
 
-                    session.query(models.ReceiverFile).filter(models.ReceiverFile.receivertip_id == models.ReceiverTip.id,
-                                                              models.ReceiverTip.internaltip_id == models.InternalTip.id,
-                                                              models.InternalTip.tid == tid).update({'new': False})
-                    continue
+        # the objects referenced by the events are loaded with a query per trigger
+        elements = {}
+        for trigger, model in trigger_model_map.items():
+            ids = [event.object_id for event in events if event.trigger == trigger]
+            if ids:
+                elements.update((x.id, x) for x in session.query(model).filter(model.id.in_(ids)))
 
-            for element in session.query(model).filter(model.new == True):
-                element.new = False
+        for event in events:
+            element = elements.get(event.object_id)
 
-                data = {
-                    'type': trigger_template_map[trigger]
-                }
+            # the object could have been deleted before the notification
+            if element is None or event.tid not in self.state.tenant_cache:
+                continue
+
+            if self.state.tenant_cache[event.tid].notification.disable_receiver_notification_emails:
+                continue
+
+            data = {
+                'type': trigger_template_map[event.trigger]
+            }
+
+            getattr(self, 'process_%s' % event.trigger)(session, element, data)
+
+        self.process_digests(session)
+
+        session.query(models.NotificationEvent) \
+               .filter(models.NotificationEvent.id.in_([event.id for event in events])) \
+               .delete(synchronize_session=False)
 
-                getattr(self, 'process_%s' % trigger)(session, element, data)
 
 @transact
 def delete_sent_mails(session, mail_ids):
     session.query(models.Mail).filter(models.Mail.id.in_(mail_ids)).delete(synchronize_session='fetch')
 
 
+def get_mail_retry_delay(attempts):
+    """
+    Return the delay of the attempt following the given number of attempts
+    """
+    return timedelta(seconds=MAIL_RETRY_DELAY * 2 ** (attempts - 1))
+
+
 @transact
-def get_mails_from_the_pool(session):
-    session.query(models.Mail).filter(models.Mail.processing_attempts > 9).delete(synchronize_session='fetch')
-    session.query(models.Mail).update({'processing_attempts': models.Mail.processing_attempts + 1})
+def get_mails_from_the_pool(session, limit):
+    """
+    Return a batch of the mails due to be sent in order of priority
+
+    The next attempt of each mail is scheduled before the mail is sent so
+    that the failures are retried with an exponential backoff.
+    """
+    now = datetime_now()
+
+    session.query(models.Mail).filter(models.Mail.next_attempt <= now,
+                                      models.Mail.processing_attempts >= MAIL_MAX_ATTEMPTS).delete(synchronize_session='fetch')
 
     ret = []
 
-    for mail in session.query(models.Mail).order_by(models.Mail.creation_date):
+    mails = session.query(models.Mail).filter(models.Mail.next_attempt <= now) \
+                                      .order_by(models.Mail.priority.desc(), models.Mail.next_attempt) \
+                                      .limit(limit)
+
+    for mail in mails:
+        mail.processing_attempts += 1
+        mail.next_attempt = now + get_mail_retry_delay(mail.processing_attempts)
+
         ret.append({
             'id': mail.id,
             'address': mail.address,
@@ -266,6 +356,7 @@ def get_mails_from_the_pool(session):
 class Notification(NetLoopingJob):
     interval = 5
     monitor_interval = 3 * 60
+    mail_batch_size = 100
     mails_to_delete = []
 
     @defer.inlineCallbacks
@@ -276,9 +367,10 @@ class Notification(NetLoopingJob):
 
     @defer.inlineCallbacks
     def spool_emails(self):
-        mails = yield get_mails_from_the_pool()
-        for mail in mails:
-            yield self.sendmail(mail)
+        mails = yield get_mails_from_the_pool(self.mail_batch_size)
+
+        # the mails are queued at once so that the SMTP sessions are reused
+        yield defer.DeferredList([self.sendmail(mail) for mail in mails])
 
         if self.mails_to_delete:
             yield delete_sent_mails(self.mails_to_delete)
@@ -101,8 +101,7 @@ class OnionService(BaseJob):
                 tid_list = list(set([1, tid]))
 
                 for x in tid_list:
-                    ApiCache().invalidate(x)
-                    ApiCache().invalidate(x)
+                    ApiCache.invalidate(x, ['/public', '/admin/node', '/admin/tenants'])
 
                 yield refresh_memory_variables(tid_list)
 
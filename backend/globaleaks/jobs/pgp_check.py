@@ -13,6 +13,7 @@ from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import LoopingJob
 from globaleaks.orm import transact
 from globaleaks.transactions import db_schedule_email
+from globaleaks.utils.pgp import Keyring
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import datetime_now, datetime_null
 from globaleaks.utils.utility import log
@@ -78,6 +79,7 @@ class PGPCheck(LoopingJob):
 
             log.info('Removing expired PGP key of: %s', user.username, tid=user.tid)
             if user.pgp_key_expiration < datetime_now():
+                Keyring.invalidate(user.pgp_key_fingerprint)
                 user.pgp_key_public = ''
                 user.pgp_key_fingerprint = ''
                 user.pgp_key_expiration = datetime_null()
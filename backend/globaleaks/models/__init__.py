@@ -61,6 +61,21 @@ def delete(session, model, *args, **kwargs):
     return db_delete(session, model, *args, **kwargs)
 
 
+def db_add_notification_event(session, tid, obj):
+    """
+    Append to the outbox the event of the creation of a ReceiverTip,
+    Comment, Message or ReceiverFile
+    """
+    if obj.id is None:
+        session.flush()
+
+    session.add(NotificationEvent({
+        'tid': tid,
+        'trigger': obj.__class__.__name__,
+        'object_id': obj.id
+    }))
+
+
 
 Base = declarative_base()
 
@@ -355,7 +370,7 @@ class InternalTip(Model, Base):
 
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
-    tid = Column(Integer, ForeignKey('tenant.id', ondelete='CASCADE'), default=1, nullable=False)
+    tid = Column(Integer, ForeignKey('tenant.id', ondelete='CASCADE'), default=1, nullable=False, index=True)
 
     creation_date = Column(DateTime, default=datetime_now, nullable=False)
     update_date = Column(DateTime, default=datetime_now, nullable=False)
@@ -365,7 +380,7 @@ class InternalTip(Model, Base):
     progressive = Column(Integer, default=0, nullable=False)
     https = Column(Boolean, default=False, nullable=False)
     total_score = Column(Integer, default=0, nullable=False)
-    expiration_date = Column(DateTime, nullable=False)
+    expiration_date = Column(DateTime, nullable=False, index=True)
     identity_provided = Column(Boolean, default=False, nullable=False)
     identity_provided_date = Column(DateTime, default=datetime_null, nullable=False)
     enable_two_way_comments = Column(Boolean, default=True, nullable=False)
@@ -387,13 +402,12 @@ class ReceiverTip(Model, Base):
 
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
-    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False)
-    receiver_id = Column(Unicode(36), ForeignKey('receiver.id', ondelete='CASCADE'), nullable=False)
+    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False, index=True)
+    receiver_id = Column(Unicode(36), ForeignKey('receiver.id', ondelete='CASCADE'), nullable=False, index=True)
     last_access = Column(DateTime, default=datetime_null, nullable=False)
     access_counter = Column(Integer, default=0, nullable=False)
     label = Column(UnicodeText, default=u'', nullable=False)
     can_access_whistleblower_identity = Column(Boolean, default=False, nullable=False)
-    new = Column(Integer, default=True, nullable=False)
     enable_notifications = Column(Boolean, default=True, nullable=False)
 
     unicode_keys = ['label']
@@ -428,12 +442,12 @@ class InternalFile(Model, Base):
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
     creation_date = Column(DateTime, default=datetime_now, nullable=False)
-    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False)
+    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False, index=True)
     name = Column(UnicodeText, nullable=False)
     file_path = Column(UnicodeText, nullable=False)
     content_type = Column(UnicodeText, nullable=False)
     size = Column(Integer, nullable=False)
-    new = Column(Integer, default=True, nullable=False)
+    new = Column(Integer, default=True, nullable=False, index=True)
     submission = Column(Integer, default = False, nullable=False)
     processing_attempts = Column(Integer, default=0, nullable=False)
 
@@ -447,12 +461,11 @@ class ReceiverFile(Model, Base):
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
     internalfile_id = Column(Unicode(36), ForeignKey('internalfile.id', ondelete='CASCADE'), nullable=False)
-    receivertip_id = Column(Unicode(36), ForeignKey('receivertip.id', ondelete='CASCADE'), nullable=False)
+    receivertip_id = Column(Unicode(36), ForeignKey('receivertip.id', ondelete='CASCADE'), nullable=False, index=True)
     file_path = Column(UnicodeText, nullable=False)
     size = Column(Integer, nullable=False)
     downloads = Column(Integer, default=0, nullable=False)
     last_access = Column(DateTime, default=datetime_null, nullable=False)
-    new = Column(Integer, default=True, nullable=False)
     status = Column(UnicodeText, nullable=False)
 
     __table_args__ = (CheckConstraint(status.in_(['processing', 'reference', 'encrypted', 'unavailable', 'nokey'])),)
@@ -488,11 +501,10 @@ class Comment(Model, Base):
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
     creation_date = Column(DateTime, default=datetime_now, nullable=False)
-    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False)
+    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=False, index=True)
     author_id = Column(Unicode(36), ForeignKey('user.id', ondelete='SET NULL'))
     content = Column(UnicodeText, nullable=False)
     type = Column(UnicodeText, nullable=False)
-    new = Column(Integer, default=True, nullable=False)
 
 
 class Message(Model, Base):
@@ -505,10 +517,9 @@ class Message(Model, Base):
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
     creation_date = Column(DateTime, default=datetime_now, nullable=False)
-    receivertip_id = Column(Unicode(36), ForeignKey('receivertip.id', ondelete='CASCADE'), nullable=False)
+    receivertip_id = Column(Unicode(36), ForeignKey('receivertip.id', ondelete='CASCADE'), nullable=False, index=True)
     content = Column(UnicodeText, nullable=False)
     type = Column(UnicodeText, nullable=False)
-    new = Column(Integer, default=True, nullable=False)
 
     __table_args__ = (CheckConstraint(type.in_(['receiver', 'whistleblower'])),)
 
@@ -516,20 +527,53 @@ class Message(Model, Base):
 class Mail(Model, Base):
     """
     This model keeps track of emails to be spooled by the system
+
+    The mails are sent in order of priority and are retried with an
+    exponential backoff tracked by next_attempt.
     """
     __tablename__ = 'mail'
 
+    PRIORITY_NOTIFICATION = 0
+    PRIORITY_SYSTEM = 1
+    PRIORITY_ALERT = 2
+
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
     tid = Column(Integer, ForeignKey('tenant.id', ondelete='CASCADE'), default=1, nullable=False)
 
-    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    creation_date = Column(DateTime, default=datetime_now, nullable=False, index=True)
     address = Column(UnicodeText, nullable=False)
     subject = Column(UnicodeText, nullable=False)
     body = Column(UnicodeText, nullable=False)
     processing_attempts = Column(Integer, default=0, nullable=False)
+    priority = Column(Integer, default=0, nullable=False)
+    next_attempt = Column(DateTime, default=datetime_now, nullable=False, index=True)
 
     unicode_keys = ['address', 'subject', 'body']
+    int_keys = ['priority']
+
+
+class NotificationEvent(Model, Base):
+    """
+    This model implements the append only outbox of the events to be notified
+
+    The events are consumed in the order of their monotonic id and
+    are deleted in the same transaction that spools the mails.
+    """
+    __tablename__ = 'notificationevent'
+
+    id = Column(Integer, primary_key=True, nullable=False)
+
+    tid = Column(Integer, ForeignKey('tenant.id', ondelete='CASCADE'), default=1, nullable=False)
+
+    creation_date = Column(DateTime, default=datetime_now, nullable=False)
+    trigger = Column(UnicodeText, nullable=False)
+    object_id = Column(Unicode(36), nullable=False)
+
+    __table_args__ = (CheckConstraint(trigger.in_(['ReceiverTip', 'Comment', 'Message', 'ReceiverFile'])),
+                      {'sqlite_autoincrement': True})
+
+    unicode_keys = ['trigger', 'object_id']
 
 
 class Receiver(Model, Base):
@@ -670,7 +714,7 @@ class FieldAnswer(Model, Base):
 
     id = Column(Unicode(36), primary_key=True, default=uuid4, nullable=False)
 
-    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=True)
+    internaltip_id = Column(Unicode(36), ForeignKey('internaltip.id', ondelete='CASCADE'), nullable=True, index=True)
     fieldanswergroup_id = Column(Unicode(36), ForeignKey('fieldanswergroup.id', ondelete='CASCADE'), nullable=True)
     key = Column(UnicodeText, default=u'', nullable=False)
     is_leaf = Column(Boolean, default=True, nullable=False)
@@ -123,6 +123,8 @@ class NotificationL10NFactory(ConfigL10NFactory):
         u'comment_mail_title',
         u'message_mail_template',
         u'message_mail_title',
+        u'digest_mail_template',
+        u'digest_mail_title',
         u'tip_expiration_summary_mail_template',
         u'tip_expiration_summary_mail_title',
         u'receiver_notification_limit_reached_mail_template',
@@ -1,5 +1,6 @@
 # -*- coding: utf-8
 import random
+import threading
 import time
 
 
@@ -17,6 +18,19 @@ from twisted.internet.threads import deferToThreadPool
 
 __DB_URI = 'sqlite:'
 __THREAD_POOL = None
+__WRITE_THREAD_POOL = None
+__PROFILER = None
+
+# When WAL is enabled the write transactions are serialized on the dedicated
+# writer thread pool while the read only ones run on the orm thread pool.
+__WAL_MODE = False
+__PRAGMAS = []
+
+# Engines and session factories shared by all the transactions of the process;
+# they are indexed by db uri and created on first use.
+__ENGINES = {}
+__SESSION_FACTORIES = {}
+__ENGINES_LOCK = threading.Lock()
 
 
 def make_db_uri(db_file):
@@ -27,44 +41,155 @@ def set_db_uri(db_uri):
     global __DB_URI
     __DB_URI = db_uri
 
+    # The database file could have been replaced (e.g. by a migration or by
+    # the tests) and so the connections currently pooled must not be reused.
+    dispose_engines()
+
 
 def get_db_uri():
     global __DB_URI
     return __DB_URI
 
 
-def get_engine(db_uri=None, foreign_keys=True):
+def set_wal_mode(enabled, synchronous=u'NORMAL', mmap_size=0, cache_size=-2000):
+    """
+    Configure the journal mode and the tuning pragmas applied to every
+    connection of the shared engines.
+    """
+    global __WAL_MODE, __PRAGMAS
+    __WAL_MODE = enabled
+
+    if enabled:
+        __PRAGMAS = [('journal_mode', 'WAL'),
+                     ('synchronous', synchronous),
+                     ('mmap_size', int(mmap_size)),
+                     ('cache_size', int(cache_size))]
+    else:
+        __PRAGMAS = []
+
+    dispose_engines()
+
+
+def get_wal_mode():
+    return __WAL_MODE
+
+
+def get_engine(db_uri=None, foreign_keys=True, pool_size=1, pragmas=None):
     if db_uri is None:
         db_uri = get_db_uri()
 
-    engine = create_engine(db_uri, module=sqlite, connect_args={'timeout': 30}, poolclass=QueuePool, pool_size=1)
+    # The connections of a shared engine are used by all the threads of the
+    # orm thread pool and so the sqlite same thread check is disabled.
+    engine = create_engine(db_uri,
+                           module=sqlite,
+                           connect_args={'timeout': 30, 'check_same_thread': False},
+                           poolclass=QueuePool,
+                           pool_size=pool_size)
+
+    if pragmas is None:
+        pragmas = []
 
     if foreign_keys:
+        pragmas = [('foreign_keys', 'ON')] + pragmas
+
+    if pragmas:
         def on_connect(conn, record):
-            conn.execute('pragma foreign_keys=ON')
+            for name, value in pragmas:
+                conn.execute('pragma %s=%s' % (name, value))
 
         event.listen(engine, 'connect', on_connect)
 
     return engine
 
 
+def get_shared_engine(db_uri=None):
+    """
+    Return the engine shared by all the transactions operating on db_uri.
+
+    The engine is created only once and its pool is sized on the orm thread pool.
+    """
+    if db_uri is None:
+        db_uri = get_db_uri()
+
+    with __ENGINES_LOCK:
+        if db_uri not in __ENGINES:
+            # one connection for each of the reader threads plus one for the writer
+            engine = get_engine(db_uri, pool_size=get_thread_pool_size() + 1, pragmas=__PRAGMAS)
+            __ENGINES[db_uri] = engine
+            __SESSION_FACTORIES[db_uri] = sessionmaker(bind=engine)
+
+        return __ENGINES[db_uri]
+
+
+def get_session_factory(db_uri=None):
+    if db_uri is None:
+        db_uri = get_db_uri()
+
+    get_shared_engine(db_uri)
+
+    return __SESSION_FACTORIES[db_uri]
+
+
+def dispose_engines():
+    """
+    Close the pooled connections of all the shared engines and forget them;
+    new engines are created on the next request of a session.
+    """
+    with __ENGINES_LOCK:
+        for engine in __ENGINES.values():
+            engine.dispose()
+
+        __ENGINES.clear()
+        __SESSION_FACTORIES.clear()
+
 
 def get_session(db_uri=None):
-    engine  = get_engine(db_uri)
-    session = sessionmaker(bind=engine)
-    return session()
+    return get_session_factory(db_uri)()
 
 
 def set_thread_pool(thread_pool):
     global __THREAD_POOL
     __THREAD_POOL = thread_pool
 
+    # The pool of the shared engines is sized on the thread pool
+    dispose_engines()
+
 
 def get_thread_pool():
     global __THREAD_POOL
     return __THREAD_POOL
 
 
+def set_write_thread_pool(thread_pool):
+    global __WRITE_THREAD_POOL
+    __WRITE_THREAD_POOL = thread_pool
+
+
+def get_write_thread_pool():
+    """
+    Return the thread pool where the write transactions are scheduled.
+
+    Without WAL readers and writers share the orm thread pool.
+    """
+    if __WAL_MODE and __WRITE_THREAD_POOL is not None:
+        return __WRITE_THREAD_POOL
+
+    return get_thread_pool()
+
+
+def set_profiler(profiler):
+    global __PROFILER
+    __PROFILER = profiler
+
+
+def get_profiler():
+    return __PROFILER
+
+
+def get_thread_pool_size():
+    return max(getattr(get_thread_pool(), 'max', 1), 1)
+
+
 class transact(object):
     """
     Class decorator for managing transactions.
@@ -80,13 +205,26 @@ class transact(object):
     def __call__(self, *args, **kwargs):
         return self.run(self._wrap, self.method, *args, **kwargs)
 
+    def get_thread_pool(self):
+        return get_write_thread_pool()
+
     def run(self, function, *args, **kwargs):
+        profiler = get_profiler()
+        if profiler is not None:
+            return profiler.run_transaction(self.get_thread_pool(), function, *args, **kwargs)
+
         return deferToThreadPool(reactor,
-                                 get_thread_pool(),
+                                 self.get_thread_pool(),
                                  function,
                                  *args,
                                  **kwargs)
 
+    def _call(self, function, session, *args, **kwargs):
+        if self.instance:
+            return function(self.instance, session, *args, **kwargs)
+
+        return function(session, *args, **kwargs)
+
     def _wrap(self, function, *args, **kwargs):
         """
         Wrap provided function calling it inside a thread and
@@ -97,16 +235,14 @@ class transact(object):
         try:
             while True:
                 try:
-                    if self.instance:
-                        result = function(self.instance, session, *args, **kwargs)
-                    else:
-                        result = function(session, *args, **kwargs)
-
+                    result = self._call(function, session, *args, **kwargs)
                     session.commit()
                 except OperationalError as e:
                     session.rollback()
 
-                    if "database is locked" not in str(e):
+                    # With WAL the writer is unique and so lock contentions
+                    # could only be caused by external processes.
+                    if get_wal_mode() or "database is locked" not in str(e):
                         raise
 
                     time.sleep(0.1)
@@ -119,6 +255,37 @@ class transact(object):
             session.close()
 
 
+class transact_ro(transact):
+    """
+    Class decorator for managing read only transactions.
+
+    The transactions are scheduled on the orm thread pool and are always
+    rolled back; with WAL they run concurrently to the unique writer.
+    """
+    def get_thread_pool(self):
+        return get_thread_pool()
+
+    def _wrap(self, function, *args, **kwargs):
+        session = get_session()
+
+        try:
+            while True:
+                try:
+                    return self._call(function, session, *args, **kwargs)
+                except OperationalError as e:
+                    session.rollback()
+
+                    # Without WAL the readers share the rollback journal
+                    # with the writer and are locked out while it commits.
+                    if get_wal_mode() or "database is locked" not in str(e):
+                        raise
+
+                    time.sleep(0.1)
+        finally:
+            session.rollback()
+            session.close()
+
+
 class transact_sync(transact):
     def run(self, function, *args, **kwargs):
         return function(*args, **kwargs)
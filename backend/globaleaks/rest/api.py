@@ -4,8 +4,10 @@
 #
 #   This file defines the URI mapping for the GlobaLeaks API and its factory
 
+import collections
 import json
 import re
+import time
 import types
 import urlparse
 
@@ -48,6 +50,7 @@ from globaleaks.handlers.admin import statistics as admin_statistics
 from globaleaks.handlers.admin import step as admin_step
 from globaleaks.handlers.admin import tenant as admin_tenant
 from globaleaks.handlers.admin import user as admin_user
+from globaleaks.handlers.base import JSONStreamProducer
 from globaleaks.rest import apicache, requests, errors
 from globaleaks.settings import Settings
 from globaleaks.state import State
@@ -130,6 +133,7 @@ api_spec = [
     (r'/admin/activities/(summary|details)', admin_statistics.RecentEventsCollection),
     (r'/admin/anomalies', admin_statistics.AnomalyCollection),
     (r'/admin/jobs', admin_statistics.JobsTiming),
+    (r'/admin/profiler', admin_statistics.ProfilerStats),
     (r'/admin/l10n/(' + '|'.join(LANGUAGES_SUPPORTED_CODES) + ')', admin_l10n.AdminL10NHandler),
     (r'/admin/files/(logo|favicon|css|homepage|script)', admin_file.FileInstance),
     (r'/admin/config', admin_config.AdminConfigHandler),
@@ -170,7 +174,7 @@ def decorate_method(h, method):
 
     f = getattr(h, method)
 
-    if State.settings.enable_api_cache:
+    if State.settings.enable_api_cache and method != 'probe_file_upload':
         if method == 'get':
             if h.cache_resource:
                 f = apicache.decorator_cache_get(f)
@@ -182,6 +186,9 @@ def decorate_method(h, method):
             if h.invalidate_tenant_states:
                f = getattr(h, 'decorator_invalidate_tenant_states')(f)
 
+    if method not in ('get', 'probe_file_upload') and h.invalidate_questionnaires:
+        f = getattr(h, 'decorator_invalidate_questionnaires')(f)
+
     f = getattr(h, 'decorator_authentication')(f, value)
 
     setattr(h, method, f)
@@ -216,8 +223,21 @@ class APIResourceWrapper(Resource):
                     if hasattr(handler, m):
                         decorate_method(handler, m)
 
+                if handler.upload_handler:
+                    decorate_method(handler, 'probe_file_upload')
+
             self._registry.append((re.compile(pattern), handler, args))
 
+    def is_upload_path(self, path):
+        """
+        Return True if the path is served by a handler accepting file uploads
+        """
+        for regexp, handler, _ in self._registry:
+            if regexp.match(path):
+                return handler.upload_handler
+
+        return False
+
     def should_redirect_tor(self, request):
         if request.client_using_tor and \
             request.hostname not in ['127.0.0.1'] + State.tenant_cache[request.tid].onionnames:
@@ -348,11 +368,15 @@ class APIResourceWrapper(Resource):
             return b''
 
         method = request.method.lower()
-        if not method in self.method_map or not hasattr(handler, method):
+
+        # flow.js checks with a GET request if a chunk has to be uploaded again
+        chunk_probe = method == 'get' and handler.upload_handler and 'flowChunkNumber' in request.args
+
+        if not method in self.method_map or not (chunk_probe or hasattr(handler, method)):
             self.handle_exception(errors.MethodNotImplemented(), request)
             return b''
 
-        f = getattr(handler, method)
+        f = getattr(handler, 'probe_file_upload' if chunk_probe else method)
         groups = [unicode(g) for g in match.groups()]
 
         self.handler = handler(State, request, **args)
@@ -368,7 +392,18 @@ class APIResourceWrapper(Resource):
             if self.handler.uploaded_file is None:
                return b''
 
-        d = defer.maybeDeferred(f, self.handler, *groups)
+        # the profile is current only while the handler code runs synchronously;
+        # the profiler propagates it to the transactions and to their callbacks
+        profiler = State.profiler
+        profile = None
+        if profiler is not None:
+            profile = profiler.start_request(self.handler, method)
+
+        try:
+            d = defer.maybeDeferred(f, self.handler, *groups)
+        finally:
+            if profiler is not None:
+                profiler.current = None
 
         @defer.inlineCallbacks
         def concludeHandlerFailure(err):
@@ -384,16 +419,32 @@ class APIResourceWrapper(Resource):
             """
             Concludes successful execution of a `BaseHandler` instance
 
-            @param ret: A `dict`, `list`, `str`, `None` or something unexpected
+            @param ret: A `dict`, `list`, iterator of rows, `str`, `None` or something unexpected
             """
             yield self.handler.execution_check()
 
-            if not request_finished[0]:
+            if not request_finished[0] and isinstance(ret, collections.Iterator):
+                request.setHeader(b'content-type', b'application/json')
+
+                gzip = apicache.choose_encoding(request.getHeader('accept-encoding'), ['gzip']) == 'gzip'
+
+                producer = JSONStreamProducer(request, ret, gzip)
+
+                yield producer.start()
+
+                if profile is not None:
+                    profile.serialization_time += producer.encodingTime
+
+            elif not request_finished[0]:
                 if ret is not None:
                    if isinstance(ret, (types.DictType, types.ListType)):
+                       start = time.time()
                        ret = json.dumps(ret, separators=(',', ':'))
                        request.setHeader(b'content-type', b'application/json')
 
+                       if profile is not None:
+                           profile.serialization_time += time.time() - start
+
                    request.write(bytes(ret))
 
                 request.finish()
@@ -401,6 +452,14 @@ class APIResourceWrapper(Resource):
         d.addErrback(concludeHandlerFailure)
         d.addCallback(concludeHandlerSuccess)
 
+        if profile is not None:
+            def stopProfile(ret):
+                # the failed requests are recorded too
+                profiler.stop_request(profile)
+                return ret
+
+            d.addBoth(stopProfile)
+
         return NOT_DONE_YET
 
     def set_headers(self, request):
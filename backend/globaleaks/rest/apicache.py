@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+import collections
 import cStringIO
 import gzip
+import hashlib
 import json
 import types
 
-from twisted.internet import defer
+from collections import OrderedDict
+
+from twisted.internet import defer, reactor
+
+from globaleaks.settings import Settings
 
 
 def gzipdata(data):
@@ -16,76 +22,393 @@ def gzipdata(data):
     return fgz.getvalue()
 
 
+def etag_match(header, etag):
+    """
+    Evaluate an If-None-Match header against the specified entity tag
+    using the weak comparison mandated by RFC 7232.
+    """
+    if header is None:
+        return False
+
+    tags = [tag.strip() for tag in header.split(',')]
+
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def parse_accept_encoding(header):
+    """
+    Return the dict of the content codings listed by an Accept-Encoding
+    header mapped to their q-values
+    """
+    codings = {}
+
+    for item in (header or '').split(','):
+        params = item.split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+
+        codings[coding] = q
+
+    return codings
+
+
+def choose_encoding(header, available):
+    """
+    Return the content coding with the highest q-value among the available
+    ones listed in order of preference, or 'identity' if none is acceptable
+    """
+    codings = parse_accept_encoding(header)
+
+    best, best_q = 'identity', 0.0
+    for coding in available:
+        q = codings.get(coding, codings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+
+    return best
+
+
+def coding_etag(etag, coding):
+    """
+    Return the entity tag of the representation with the specified content coding
+    """
+    if coding == 'identity':
+        return etag
+
+    return '%s-%s"' % (etag[:-1], coding)
+
+
 class ApiCache(object):
-    memory_cache_dict = {}
+    """
+    LRU cache of the API responses bounded by Settings.api_cache_size.
+
+    The entries are indexed by (tid, resource, language) and each tenant keeps
+    the index of its own entries so that invalidations never scan the cache of
+    the other tenants.
+
+    Each entry is a tuple (content_type, gzipped data, data, etag) where the
+    uncompressed data is kept for the clients not accepting gzip; the etag
+    is the one of the identity representation and the gzipped one is served
+    with the tag suffixed by the coding.
+
+    The renderings in progress are tracked in pending_dict so that the
+    concurrent misses of the same entry wait for a single rendering.
+    """
+    memory_cache_dict = OrderedDict()
+    pending_dict = {}
+    tenant_index = {}
+    memory_size = 0
+
+    hits = 0
+    misses = 0
+    evictions = 0
 
     @classmethod
     def get(cls, tid, resource, language):
-        if tid in cls.memory_cache_dict \
-           and resource in cls.memory_cache_dict[tid] \
-           and language in cls.memory_cache_dict[tid][resource]:
-            return cls.memory_cache_dict[tid][resource][language]
+        key = (tid, resource, language)
+
+        entry = cls.memory_cache_dict.pop(key, None)
+        if entry is None:
+            cls.misses += 1
+            return None
+
+        # reinsert the entry in order to mark it as the most recently used
+        cls.memory_cache_dict[key] = entry
+        cls.hits += 1
+
+        return entry
+
+    @staticmethod
+    def build_entry(content_type, data):
+        data = bytes(data)
+
+        return (content_type, gzipdata(data), data, '"%s"' % hashlib.sha256(data).hexdigest())
 
     @classmethod
     def set(cls, tid, resource, language, content_type, data):
-        data = gzipdata(bytes(data))
+        entry = cls.build_entry(content_type, data)
+
+        size = len(entry[1]) + len(entry[2])
 
-        if tid not in ApiCache.memory_cache_dict:
-            cls.memory_cache_dict[tid] = {}
+        # responses exceeding the whole budget are served but not cached
+        if size > Settings.api_cache_size:
+            return entry
 
-        if resource not in ApiCache.memory_cache_dict[tid]:
-            cls.memory_cache_dict[tid][resource] = {}
+        key = (tid, resource, language)
 
-        entry = (content_type, data)
+        cls._remove(key)
 
-        cls.memory_cache_dict[tid][resource][language] = entry
+        cls.memory_cache_dict[key] = entry
+        cls.tenant_index.setdefault(tid, set()).add(key)
+        cls.memory_size += size
+
+        while cls.memory_size > Settings.api_cache_size:
+            cls._remove(next(iter(cls.memory_cache_dict)))
+            cls.evictions += 1
 
         return entry
 
     @classmethod
-    def invalidate(cls, tid=None):
-        if tid is not None:
-            cls.memory_cache_dict.pop(tid, None)
-        else:
+    def _remove(cls, key):
+        entry = cls.memory_cache_dict.pop(key, None)
+        if entry is None:
+            return
+
+        cls.memory_size -= len(entry[1]) + len(entry[2])
+
+        keys = cls.tenant_index[key[0]]
+        keys.discard(key)
+        if not keys:
+            del cls.tenant_index[key[0]]
+
+    @classmethod
+    def invalidate(cls, tid=None, resources=None):
+        """
+        Invalidate the entries of the resources starting with one of the
+        specified prefixes; a None tid selects all the tenants and None
+        resources select all the resources.
+        """
+        def match(key):
+            return (tid is None or key[0] == tid) and \
+                   (resources is None or key[1].startswith(tuple(resources)))
+
+        # the renderings in progress could include the invalidated data
+        # and so they are detached in order to not be cached at completion
+        for key in [key for key in cls.pending_dict if match(key)]:
+            del cls.pending_dict[key]
+
+        if tid is None and resources is None:
             cls.memory_cache_dict.clear()
+            cls.tenant_index.clear()
+            cls.memory_size = 0
+        else:
+            if tid is None:
+                keys = list(cls.memory_cache_dict)
+            else:
+                keys = list(cls.tenant_index.get(tid, []))
+
+            for key in keys:
+                if match(key):
+                    cls._remove(key)
+
+        if Settings.enable_api_cache and Settings.enable_api_cache_warmup:
+            schedule_warmup(tid)
+
+    @classmethod
+    def fetch(cls, tid, resource, language, render):
+        """
+        Return a deferred firing with the cache entry of a missing resource.
+
+        The entry is produced by calling render(), that must return a tuple
+        (content_type, data) or None for the uncacheable answers; the
+        concurrent misses of the same entry share the same rendering.
+        """
+        key = (tid, resource, language)
+
+        if key in cls.pending_dict:
+            d = defer.Deferred()
+            cls.pending_dict[key].append(d)
+            return d
+
+        waiters = cls.pending_dict[key] = []
+
+        def callback(result):
+            pending = cls.pending_dict.get(key) is waiters
+            if pending:
+                del cls.pending_dict[key]
+
+            if result is None:
+                entry = None
+            elif pending:
+                entry = cls.set(tid, resource, language, *result)
+            else:
+                entry = cls.build_entry(*result)
+
+            for waiter in waiters:
+                waiter.callback(entry)
+
+            return entry
+
+        def errback(failure):
+            if cls.pending_dict.get(key) is waiters:
+                del cls.pending_dict[key]
+
+            for waiter in waiters:
+                waiter.errback(failure)
+
+            return failure
+
+        return defer.maybeDeferred(render).addCallbacks(callback, errback)
+
+    @classmethod
+    def get_stats(cls):
+        return {
+            'entries': len(cls.memory_cache_dict),
+            'tenants': len(cls.tenant_index),
+            'memory_size': cls.memory_size,
+            'memory_limit': Settings.api_cache_size,
+            'hits': cls.hits,
+            'misses': cls.misses,
+            'evictions': cls.evictions
+        }
+
+    @classmethod
+    def reset_stats(cls):
+        cls.hits = cls.misses = cls.evictions = 0
+
+
+def serve_cache_entry(handler, entry):
+    request = handler.request
+
+    encoding = choose_encoding(request.getHeader('accept-encoding'), ['gzip'])
+    etag = coding_etag(entry[3], encoding)
+
+    request.setHeader("Content-type", entry[0])
+    request.setHeader("ETag", etag)
+    request.setHeader("Vary", "Accept-Encoding")
+
+    # public resources could be stored by the browsers given that they are
+    # always revalidated; the others are never stored as all the api answers
+    if handler.check_roles == '*':
+        request.setHeader("Cache-control", "no-cache")
+
+    if etag_match(request.getHeader('if-none-match'), etag):
+        request.setResponseCode(304)
+        return None
+
+    if encoding == 'gzip':
+        request.setHeader("Content-encoding", "gzip")
+        return entry[1]
+
+    return entry[2]
+
+
+def get_cache_key(handler_class, tid, resource, language):
+    """
+    Return the key of the cache entry of a resource served by a handler;
+    the language is not part of the key of the handlers whose answers do
+    not depend on the language of the request (e.g. /l10n/<lang>).
+    """
+    return tid, resource, language if handler_class.cache_language else None
 
 
 def decorator_cache_get(f):
     def decorator_cache_get_wrapper(self, *args, **kwargs):
-        c = ApiCache.get(self.request.tid, self.request.path, self.request.language)
-        if c is None:
-            d = defer.maybeDeferred(f, self, *args, **kwargs)
+        rendered = []
+
+        def render():
+            rendered.append(True)
 
             def callback(data):
+                # the handlers streaming their output (e.g. files) are not cached
+                if data is None:
+                    return data
+
+                # the cached answers are kept whole and so the rows are not streamed
+                if isinstance(data, collections.Iterator):
+                    data = list(data)
+
                 if isinstance(data, (types.DictType, types.ListType)):
                     self.request.setHeader(b'content-type', b'application/json')
                     data = json.dumps(data)
 
-                self.request.setHeader("Content-encoding", "gzip")
+                return self.request.responseHeaders.getRawHeaders("Content-type", ["application/json"])[0], data
 
-                c = self.request.responseHeaders.getRawHeaders("Content-type", ["application/json"])[0]
-                return ApiCache.set(self.request.tid, self.request.path, self.request.language, c, data)[1]
+            return defer.maybeDeferred(f, self, *args, **kwargs).addCallback(callback)
 
-            d.addCallback(callback)
+        def serve(entry):
+            if entry is not None:
+                return serve_cache_entry(self, entry)
 
-            return d
+            # the answers that are not cacheable (e.g. streamed files) are
+            # written by the handler itself and so the concurrent requests
+            # coalesced on the same rendering have to be served on their own
+            if not rendered:
+                return f(self, *args, **kwargs)
 
-        else:
-            self.request.setHeader("Content-encoding", "gzip")
-            self.request.setHeader("Content-type", c[0])
+        tid, resource, language = get_cache_key(type(self), self.request.tid, self.request.path, self.request.language)
 
-        return c[1]
+        c = ApiCache.get(tid, resource, language)
+        if c is not None:
+            return serve(c)
+
+        return ApiCache.fetch(tid, resource, language, render).addCallback(serve)
 
     return decorator_cache_get_wrapper
 
 
 def decorator_cache_invalidate(f):
     def decorator_cache_invalidate_wrapper(self, *args, **kwargs):
-        if self.invalidate_cache and self.request.tid != 1:
-            ApiCache.invalidate(self.request.tid)
-        else:
-            ApiCache.invalidate()
+        d = defer.maybeDeferred(f, self, *args, **kwargs)
+
+        # The invalidation follows the write so that a concurrent read
+        # could not cache again the data that is going to be replaced;
+        # it is performed also on failure as the write could be partial.
+        def callback(data):
+            for tid, resources in self.get_cache_invalidation_targets(*args):
+                ApiCache.invalidate(tid, resources)
 
-        return f(self, *args, **kwargs)
+            return data
+
+        d.addBoth(callback)
+
+        return d
 
     return decorator_cache_invalidate_wrapper
+
+
+def warmup(tid):
+    """
+    Render the public resources of a tenant for all its enabled languages.
+    """
+    from globaleaks.handlers.l10n import L10NHandler, get_l10n
+    from globaleaks.handlers.public import PublicResource, get_public_resources
+    from globaleaks.state import State
+
+    def render(f, *args):
+        return lambda: f(*args).addCallback(lambda data: ('application/json', json.dumps(data)))
+
+    dl = []
+
+    if tid in State.tenant_cache:
+        for lang in State.tenant_cache[tid].languages_enabled:
+            for resource, handler_class, f in [('/public', PublicResource, get_public_resources),
+                                               ('/l10n/' + lang, L10NHandler, get_l10n)]:
+                key = get_cache_key(handler_class, tid, resource, lang)
+                if key not in ApiCache.memory_cache_dict and key not in ApiCache.pending_dict:
+                    dl.append(ApiCache.fetch(key[0], key[1], key[2], render(f, tid, lang)))
+
+    return defer.DeferredList(dl, consumeErrors=True)
+
+
+_warmup_tids = set()
+
+
+def schedule_warmup(tid=None):
+    """
+    Schedule the cache warm-up of a tenant or of all the tenants;
+    the multiple requests issued in the same reactor iteration are merged.
+    """
+    from globaleaks.state import State
+
+    if not _warmup_tids:
+        reactor.callLater(0, _run_warmup)
+
+    _warmup_tids.update(State.tenant_cache.keys() if tid is None else [tid])
+
+
+def _run_warmup():
+    tids = list(_warmup_tids)
+    _warmup_tids.clear()
+
+    return defer.DeferredList([warmup(tid) for tid in tids])
@@ -266,6 +266,7 @@ AdminNotificationDesc = merge_dicts({
     'disable_receiver_notification_emails': bool,
     'tip_expiration_threshold': int,
     'notification_threshold_per_hour': int,
+    'notification_digest_interval': int,
     'reset_templates': bool
   },
   {k: unicode for k in NotificationL10NFactory.keys}
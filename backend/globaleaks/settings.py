@@ -14,7 +14,7 @@ import sys
 from optparse import OptionParser
 
 from globaleaks import __version__, DATABASE_VERSION
-from globaleaks.orm import make_db_uri, set_db_uri
+from globaleaks.orm import make_db_uri, set_db_uri, set_wal_mode
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.utility import log
 
@@ -70,6 +70,13 @@ class SettingsClass(object):
         # debug defaults
         self.orm_debug = False
 
+        # sqlite tuning; with WAL the write transactions are serialized on a
+        # dedicated thread while the read only ones are executed in parallel
+        self.orm_wal_mode = False
+        self.orm_synchronous = u'NORMAL'
+        self.orm_mmap_size = 0
+        self.orm_cache_size = -2000 # 2MB
+
         # files and paths
         self.src_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         self.backend_script = os.path.abspath(os.path.join(self.src_path, 'globaleaks/backend.py'))
@@ -163,6 +170,23 @@ class SettingsClass(object):
 
 
         self.enable_api_cache = True
+        self.api_cache_size = 32 * 1024 * 1024 # 32MB
+        self.enable_api_cache_warmup = False
+
+        self.static_cache_size = 32 * 1024 * 1024 # 32MB
+        self.static_cache_max_file_size = 4 * 1024 * 1024 # 4MB
+
+        self.enable_profiler = False
+        self.profiler_slowest = 20
+
+        self.delivery_concurrency = 4
+
+        self.export_concurrency = 4
+
+        self.smtp_concurrency = 4
+        self.smtp_rate_limit = 0
+
+        self.pgp_backend = 'gnupg'
 
     def eval_paths(self):
         self.config_file_path = '/etc/globaleaks'
@@ -194,6 +218,7 @@ class SettingsClass(object):
         self.field_attrs_file = os.path.join(self.client_path, 'data/field_attrs.json')
 
         set_db_uri(make_db_uri(self.db_file_path))
+        set_wal_mode(self.orm_wal_mode, self.orm_synchronous, self.orm_mmap_size, self.orm_cache_size)
 
     def set_devel_mode(self):
         self.devel_mode = True
@@ -260,6 +285,28 @@ class SettingsClass(object):
 
         self.api_prefix = self.cmdline_options.api_prefix
 
+        self.orm_wal_mode = self.cmdline_options.orm_wal_mode
+        self.orm_synchronous = self.cmdline_options.orm_synchronous
+        self.orm_mmap_size = self.cmdline_options.orm_mmap_size
+        self.orm_cache_size = self.cmdline_options.orm_cache_size
+
+        self.api_cache_size = self.cmdline_options.api_cache_size
+        self.enable_api_cache_warmup = self.cmdline_options.api_cache_warmup
+
+        self.static_cache_size = self.cmdline_options.static_cache_size
+
+        self.enable_profiler = self.cmdline_options.profiler
+        self.profiler_slowest = self.cmdline_options.profiler_slowest
+
+        self.delivery_concurrency = self.cmdline_options.delivery_concurrency
+
+        self.export_concurrency = self.cmdline_options.export_concurrency
+
+        self.smtp_concurrency = self.cmdline_options.smtp_concurrency
+        self.smtp_rate_limit = self.cmdline_options.smtp_rate_limit
+
+        self.pgp_backend = self.cmdline_options.pgp_backend
+
         if self.cmdline_options.client_path:
             self.client_path = os.path.abspath(os.path.join(self.src_path, self.cmdline_options.client_path))
 
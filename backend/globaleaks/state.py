@@ -7,12 +7,13 @@ from twisted.python.threadpool import ThreadPool
 
 from globaleaks import __version__, orm, models
 from globaleaks.utils.agent import get_tor_agent, get_web_agent
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.utils.mailutils import SMTPClientPool
 from globaleaks.utils.objectdict import ObjectDict
 from globaleaks.utils.singleton import Singleton
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.tor_exit_set import TorExitSet
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils.pgp import Keyring
+from globaleaks.utils.profiler import Profiler
 from globaleaks.utils.security import sha256
 from globaleaks.utils.utility import datetime_now, log
 from globaleaks.utils.tempdict import TempDict
@@ -56,6 +57,7 @@ class StateClass(ObjectDict):
         self.exceptions = {}
         self.exceptions_email_count = 0
         self.mail_counters = {}
+        self.smtp_pools = {}
         self.stats_collection_start_time = datetime_now()
 
         self.accept_submissions = True
@@ -64,7 +66,11 @@ class StateClass(ObjectDict):
         self.tenant_cache = {}
         self.tenant_hostname_id_map = {}
 
+        self.profiler = None
+
         self.set_orm_tp(ThreadPool(4, 16))
+        self.set_orm_wtp(ThreadPool(1, 1))
+        self.export_tp = ThreadPool(0, self.settings.export_concurrency, 'export')
         self.TempUploadFiles = TempDict(timeout=3600)
 
     def init_environment(self):
@@ -77,6 +83,22 @@ class StateClass(ObjectDict):
         self.orm_tp = orm_tp
         orm.set_thread_pool(orm_tp)
 
+    def set_orm_wtp(self, orm_wtp):
+        self.orm_wtp = orm_wtp
+        orm.set_write_thread_pool(orm_wtp)
+
+    def enable_profiler(self):
+        if self.profiler is None:
+            self.profiler = Profiler(slowest=self.settings.profiler_slowest)
+            self.profiler.install()
+            orm.set_profiler(self.profiler)
+
+    def disable_profiler(self):
+        if self.profiler is not None:
+            self.profiler.uninstall()
+            self.profiler = None
+            orm.set_profiler(None)
+
     def get_agent(self, tid=1):
         if self.tenant_cache[tid].anonymize_outgoing_connections:
             return get_tor_agent(self.settings.socks_host, self.settings.socks_port)
@@ -166,25 +188,37 @@ class StateClass(ObjectDict):
 
         self.stats_collection_start_time = datetime_now()
 
+    def get_smtp_pool(self, tid):
+        """
+        Return the pool of the SMTP sessions of a tenant
+
+        A new pool is created when the SMTP configuration changes while the
+        sessions of the previous one are left to complete their deliveries.
+        """
+        key = (self.tenant_cache[tid].notification.smtp_username,
+               self.tenant_cache[tid].notification.smtp_password,
+               self.tenant_cache[tid].notification.smtp_server,
+               self.tenant_cache[tid].notification.smtp_port,
+               self.tenant_cache[tid].notification.smtp_security,
+               self.tenant_cache[tid].notification.smtp_source_name,
+               self.tenant_cache[tid].notification.smtp_source_email,
+               self.tenant_cache[tid].anonymize_outgoing_connections,
+               self.settings.socks_host,
+               self.settings.socks_port)
+
+        if tid not in self.smtp_pools or self.smtp_pools[tid][0] != key:
+            self.smtp_pools[tid] = (key, SMTPClientPool(tid, *key,
+                                                        concurrency=self.settings.smtp_concurrency,
+                                                        rate_limit=self.settings.smtp_rate_limit))
+
+        return self.smtp_pools[tid][1]
+
     def sendmail(self, tid, to_address, subject, body):
        if self.settings.testing:
            # during unit testing do not try to send the mail
            return defer.succeed(True)
 
-       return sendmail(tid,
-                       self.tenant_cache[tid].notification.smtp_username,
-                       self.tenant_cache[tid].notification.smtp_password,
-                       self.tenant_cache[tid].notification.smtp_server,
-                       self.tenant_cache[tid].notification.smtp_port,
-                       self.tenant_cache[tid].notification.smtp_security,
-                       self.tenant_cache[tid].notification.smtp_source_name,
-                       self.tenant_cache[tid].notification.smtp_source_email,
-                       to_address,
-                       subject,
-                       body,
-                       self.tenant_cache[tid].anonymize_outgoing_connections,
-                       self.settings.socks_host,
-                       self.settings.socks_port)
+       return self.get_smtp_pool(tid).sendmail(to_address, subject, body)
 
 
     def schedule_exception_email(self, exception_text, *args):
@@ -228,12 +262,10 @@ class StateClass(ObjectDict):
             # Opportunisticly encrypt the mail body. NOTE that mails will go out
             # unencrypted if one address in the list does not have a public key set.
             if pgp_key_public:
-               pgpctx = PGPContext(self.settings.tmp_path)
-               fingerprint = pgpctx.load_key(pgp_key_public)['fingerprint']
-               mail_body = pgpctx.encrypt_message(fingerprint, mail_body)
+               mail_body = Keyring.encrypt_message(pgp_key_public, mail_body)
 
             # avoid waiting for the notification to send and instead rely on threads to handle it
-            schedule_email(1, mail_address, mail_subject, mail_body)
+            schedule_email(1, mail_address, mail_subject, mail_body, models.Mail.PRIORITY_ALERT)
 
     def refresh_tenant_states(self):
         # Remove selected onion services and add missing services
@@ -253,15 +285,14 @@ class StateClass(ObjectDict):
         subject, body = Templating().get_mail_subject_and_body(template_vars)
 
         if user_desc.get('pgp_key_public', ''):
-            pgpctx = PGPContext(self.settings.tmp_path)
-            fingerprint = pgpctx.load_key(user_desc['pgp_key_public'])['fingerprint']
-            body = pgpctx.encrypt_message(fingerprint, body)
+            body = Keyring.encrypt_message(user_desc['pgp_key_public'], body)
 
         session.add(models.Mail({
             'address': user_desc['mail_address'],
             'subject': subject,
             'body': body,
             'tid': tid,
+            'priority': models.Mail.PRIORITY_SYSTEM
         }))
 
     def get_tmp_file_by_path(self, path):
@@ -20,7 +20,7 @@ class TestTipsOverviewDesc(helpers.TestHandlerWithPopulatedDB):
     @inlineCallbacks
     def test_get(self):
         handler = self.request({}, role='admin')
-        response = yield handler.get()
+        response = list((yield handler.get()))
 
         self.assertEqual(len(response), self.population_of_submissions)
         self._handler.validate_message(json.dumps(response), requests.TipsOverviewDesc)
@@ -86,3 +86,46 @@ class TestJobsTiming(helpers.TestHandler):
         handler = self.request({}, role='admin')
 
         yield handler.get()
+
+
+class TestProfilerStats(helpers.TestHandler):
+    _handler = statistics.ProfilerStats
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandler.setUp(self)
+        self.state.enable_profiler()
+
+    def tearDown(self):
+        self.state.disable_profiler()
+        return helpers.TestHandler.tearDown(self)
+
+    @inlineCallbacks
+    def profiled_handler(self):
+        yield statistics.get_anomaly_history(1, 20)
+
+        # the second transaction is started by a callback of the first one
+        yield statistics.get_anomaly_history(1, 20)
+
+    @inlineCallbacks
+    def test_get(self):
+        handler = self.request({}, role='admin')
+
+        profile = self.state.profiler.start_request(handler, 'get')
+        d = self.profiled_handler()
+        self.state.profiler.current = None
+        yield d
+        self.state.profiler.stop_request(profile)
+
+        self.assertEqual(len(profile.queries), 2)
+
+        response = yield handler.get()
+        self.assertTrue(response['enabled'])
+        self.assertEqual(response['handlers'][0]['handler'], 'ProfilerStats.get')
+        self.assertEqual(response['handlers'][0]['query_count']['p50'], 2)
+        self.assertEqual(len(response['slowest'][0]['queries']), 2)
+
+        yield handler.delete()
+        response = yield handler.get()
+        self.assertEqual(response['handlers'], [])
+        self.assertEqual(response['slowest'], [])
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import json
+import zlib
 
-from globaleaks.handlers.base import BaseHandler
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.handlers.base import BaseHandler, JSONStreamProducer, iterencode_list, parse_byte_range, stream_list
 from globaleaks.rest.errors import InputValidationError
 from globaleaks.tests import helpers
 
@@ -68,3 +71,48 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
     def test_validate_regexp_valid(self):
         self.assertTrue(BaseHandler.validate_regexp('Foca', '\w+'))
         self.assertFalse(BaseHandler.validate_regexp('Foca', '\d+'))
+
+
+class TestJSONStreamProducer(helpers.TestGL):
+    rows = [{'id': i, 'name': u'antani %d' % i} for i in range(1000)]
+
+    def test_iterencode_list(self):
+        self.assertEqual(''.join(iterencode_list([])), '[]')
+        self.assertEqual(json.loads(''.join(iterencode_list(iter(self.rows)))), self.rows)
+
+    @inlineCallbacks
+    def test_stream(self):
+        self.patch(JSONStreamProducer, 'bufferSize', 1024)
+
+        request = helpers.forge_request()
+        yield JSONStreamProducer(request, iter(self.rows)).start()
+
+        self.assertTrue(len(request.written) > 1)
+        self.assertEqual(json.loads(request.getResponseBody()), self.rows)
+        self.assertEqual(request.finished, 1)
+
+    @inlineCallbacks
+    def test_stream_gzip(self):
+        self.patch(JSONStreamProducer, 'bufferSize', 1024)
+
+        request = helpers.forge_request()
+        yield JSONStreamProducer(request, stream_list(list(self.rows)), True).start()
+
+        self.assertEqual(request.responseHeaders.getRawHeaders('Content-encoding'), ['gzip'])
+        self.assertEqual(json.loads(zlib.decompress(request.getResponseBody(), 16 + zlib.MAX_WBITS)), self.rows)
+
+    def test_parse_byte_range(self):
+        self.assertEqual(parse_byte_range(None, 100), None)
+        self.assertEqual(parse_byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_byte_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(parse_byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=90-1000', 100), (90, 99))
+
+        # unsatisfiable ranges
+        self.assertEqual(parse_byte_range('bytes=100-', 100), (100, -1))
+        self.assertEqual(parse_byte_range('bytes=-0', 100), (0, -1))
+
+        # ranges served as the whole file
+        self.assertEqual(parse_byte_range('bytes=0-1,4-5', 100), None)
+        self.assertEqual(parse_byte_range('bytes=5-3', 100), None)
+        self.assertEqual(parse_byte_range('items=0-9', 100), None)
@@ -1,16 +1,61 @@
 # -*- coding: utf-8 -*-
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks
 
-from globaleaks.rest.apicache import ApiCache, gzipdata
+from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.l10n import L10NHandler
+from globaleaks.rest.apicache import ApiCache, choose_encoding, decorator_cache_get, get_cache_key, gzipdata, warmup
+from globaleaks.settings import Settings
 from globaleaks.tests import helpers
 
 
+class CachedHandler(BaseHandler):
+    check_roles = '*'
+    calls = 0
+    deferred = None
+
+    @decorator_cache_get
+    def get(self):
+        CachedHandler.calls += 1
+
+        if CachedHandler.deferred is not None:
+            return CachedHandler.deferred
+
+        return {'antani': 'sblinda'}
+
+
+class StreamingHandler(BaseHandler):
+    check_roles = '*'
+    calls = 0
+    deferred = None
+
+    @decorator_cache_get
+    def get(self):
+        StreamingHandler.calls += 1
+
+        def write(_):
+            self.request.write('antani')
+
+        # the handlers streaming their output return None
+        return StreamingHandler.deferred.addCallback(write)
+
+
 class TestApiCache(helpers.TestGL):
     @inlineCallbacks
     def setUp(self):
         yield helpers.TestGL.setUp(self)
 
         ApiCache.invalidate()
+        ApiCache.reset_stats()
+
+        CachedHandler.calls = 0
+        CachedHandler.deferred = None
+
+        self.api_cache_size = Settings.api_cache_size
+
+    def tearDown(self):
+        Settings.api_cache_size = self.api_cache_size
+
+        return helpers.TestGL.tearDown(self)
 
     def test_cache(self):
         self.assertEqual(ApiCache.memory_cache_dict, {})
@@ -20,14 +65,209 @@ class TestApiCache(helpers.TestGL):
         ApiCache.set(1, "passante_di_professione", "it", 'text/plain', 'ititit')
         ApiCache.set(1, "passante_di_professione", "en", 'text/plain', 'enenen')
         ApiCache.set(2, "passante_di_professione", "ca", 'text/plain', 'cacaca')
-        self.assertTrue("passante_di_professione" in ApiCache.memory_cache_dict[1])
-        self.assertTrue("passante_di_professione" in ApiCache.memory_cache_dict[2])
-        self.assertIsNone(ApiCache.get(1, "passante_di_professione", "ca"))
-        self.assertTrue("it" in ApiCache.memory_cache_dict[1]['passante_di_professione'])
-        self.assertTrue("en" in ApiCache.memory_cache_dict[1]['passante_di_professione'])
+        self.assertTrue((1, "passante_di_professione", "it") in ApiCache.memory_cache_dict)
+        self.assertTrue((1, "passante_di_professione", "en") in ApiCache.memory_cache_dict)
+        self.assertTrue((2, "passante_di_professione", "ca") in ApiCache.memory_cache_dict)
         self.assertIsNone(ApiCache.get(1, "passante_di_professione", "ca"))
         self.assertEqual(ApiCache.get(1, "passante_di_professione", "it")[1], gzipdata('ititit'))
         self.assertEqual(ApiCache.get(1, "passante_di_professione", "en")[1], gzipdata('enenen'))
         self.assertEqual(ApiCache.get(2, "passante_di_professione", "ca")[1], gzipdata('cacaca'))
         ApiCache.invalidate()
         self.assertEqual(ApiCache.memory_cache_dict, {})
+        self.assertEqual(ApiCache.tenant_index, {})
+        self.assertEqual(ApiCache.memory_size, 0)
+
+        stats = ApiCache.get_stats()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 4)
+
+    def test_lru_eviction(self):
+        ApiCache.set(1, "/a", "en", 'text/plain', 'a')
+        entry_size = ApiCache.memory_size
+        ApiCache.invalidate()
+
+        Settings.api_cache_size = entry_size * 2
+
+        ApiCache.set(1, "/a", "en", 'text/plain', 'a')
+        ApiCache.set(1, "/b", "en", 'text/plain', 'b')
+
+        # access /a so that /b becomes the least recently used entry
+        self.assertIsNotNone(ApiCache.get(1, "/a", "en"))
+
+        ApiCache.set(1, "/c", "en", 'text/plain', 'c')
+
+        self.assertIsNotNone(ApiCache.get(1, "/a", "en"))
+        self.assertIsNone(ApiCache.get(1, "/b", "en"))
+        self.assertIsNotNone(ApiCache.get(1, "/c", "en"))
+        self.assertEqual(ApiCache.memory_size, entry_size * 2)
+        self.assertEqual(ApiCache.get_stats()['evictions'], 1)
+
+        # entries exceeding the budget are not cached
+        Settings.api_cache_size = 1
+        ApiCache.invalidate()
+        ApiCache.set(1, "/a", "en", 'text/plain', 'a')
+        self.assertIsNone(ApiCache.get(1, "/a", "en"))
+
+    def test_targeted_invalidation(self):
+        for tid in [1, 2]:
+            for resource in ["/public", "/l10n/en", "/l10n/it"]:
+                ApiCache.set(tid, resource, "en", 'application/json', '{}')
+
+        ApiCache.invalidate(2, ['/l10n/en'])
+        self.assertIsNone(ApiCache.get(2, "/l10n/en", "en"))
+        self.assertIsNotNone(ApiCache.get(2, "/l10n/it", "en"))
+        self.assertIsNotNone(ApiCache.get(2, "/public", "en"))
+        self.assertIsNotNone(ApiCache.get(1, "/l10n/en", "en"))
+
+        ApiCache.invalidate(resources=['/public'])
+        self.assertIsNone(ApiCache.get(1, "/public", "en"))
+        self.assertIsNone(ApiCache.get(2, "/public", "en"))
+        self.assertIsNotNone(ApiCache.get(1, "/l10n/it", "en"))
+
+        ApiCache.invalidate(1)
+        self.assertNotIn(1, ApiCache.tenant_index)
+        self.assertIsNotNone(ApiCache.get(2, "/l10n/it", "en"))
+
+    @inlineCallbacks
+    def test_etag_and_encodings(self):
+        request = helpers.forge_request(uri='https://www.globaleaks.org/cached',
+                                        headers={'Accept-Encoding': 'gzip, deflate'})
+        request.language = 'en'
+        ret = yield CachedHandler(self.state, request).get()
+        etag = request.responseHeaders.getRawHeaders('ETag')[0]
+        self.assertEqual(ret, gzipdata('{"antani": "sblinda"}'))
+        self.assertEqual(request.responseHeaders.getRawHeaders('Content-encoding'), ['gzip'])
+
+        # the representations with different codings have different tags
+        for header in [None, 'gzip;q=0', 'gzip;q=0, identity']:
+            headers = {'Accept-Encoding': header} if header is not None else {}
+            request = helpers.forge_request(uri='https://www.globaleaks.org/cached', headers=headers)
+            request.language = 'en'
+            ret = yield CachedHandler(self.state, request).get()
+            self.assertEqual(ret, '{"antani": "sblinda"}')
+            self.assertNotEqual(request.responseHeaders.getRawHeaders('ETag'), [etag])
+            self.assertIsNone(request.responseHeaders.getRawHeaders('Content-encoding'))
+
+        request = helpers.forge_request(uri='https://www.globaleaks.org/cached',
+                                        headers={'If-None-Match': etag})
+        request.language = 'en'
+        ret = yield CachedHandler(self.state, request).get()
+        self.assertEqual(ret, '{"antani": "sblinda"}')
+        self.assertNotEqual(request.responseCode, 304)
+
+        etag = request.responseHeaders.getRawHeaders('ETag')[0]
+
+        for header in [etag, 'W/' + etag, '"antani", ' + etag, '*']:
+            request = helpers.forge_request(uri='https://www.globaleaks.org/cached',
+                                            headers={'If-None-Match': header})
+            request.language = 'en'
+            ret = yield CachedHandler(self.state, request).get()
+            self.assertIsNone(ret)
+            self.assertEqual(request.responseCode, 304)
+
+        request = helpers.forge_request(uri='https://www.globaleaks.org/cached',
+                                        headers={'If-None-Match': '"antani"'})
+        request.language = 'en'
+        ret = yield CachedHandler(self.state, request).get()
+        self.assertEqual(ret, '{"antani": "sblinda"}')
+        self.assertNotEqual(request.responseCode, 304)
+
+        self.assertEqual(CachedHandler.calls, 1)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding(None, ['br', 'gzip']), 'identity')
+        self.assertEqual(choose_encoding('gzip, deflate', ['br', 'gzip']), 'gzip')
+        self.assertEqual(choose_encoding('gzip, br', ['br', 'gzip']), 'br')
+        self.assertEqual(choose_encoding('gzip;q=0', ['br', 'gzip']), 'identity')
+        self.assertEqual(choose_encoding('br;q=0.5, gzip', ['br', 'gzip']), 'gzip')
+        self.assertEqual(choose_encoding('*', ['br', 'gzip']), 'br')
+        self.assertEqual(choose_encoding('*, br;q=0', ['br', 'gzip']), 'gzip')
+
+    def get_cached(self):
+        request = helpers.forge_request(uri='https://www.globaleaks.org/cached')
+        request.language = 'en'
+        return CachedHandler(self.state, request).get()
+
+    @inlineCallbacks
+    def test_single_flight(self):
+        CachedHandler.deferred = Deferred()
+
+        d1 = self.get_cached()
+        d2 = self.get_cached()
+        self.assertEqual(CachedHandler.calls, 1)
+
+        CachedHandler.deferred.callback({'antani': 'sblinda'})
+
+        ret1 = yield d1
+        ret2 = yield d2
+        self.assertEqual(ret1, '{"antani": "sblinda"}')
+        self.assertEqual(ret2, '{"antani": "sblinda"}')
+        self.assertEqual(ApiCache.pending_dict, {})
+        self.assertIsNotNone(ApiCache.get(1, '/cached', 'en'))
+
+    @inlineCallbacks
+    def test_single_flight_invalidation(self):
+        CachedHandler.deferred = Deferred()
+
+        d1 = self.get_cached()
+
+        # the rendering in progress could be stale and so it is not cached
+        ApiCache.invalidate(1)
+
+        CachedHandler.deferred.callback({'antani': 'sblinda'})
+        ret = yield d1
+        self.assertEqual(ret, '{"antani": "sblinda"}')
+        self.assertIsNone(ApiCache.get(1, '/cached', 'en'))
+
+    @inlineCallbacks
+    def test_single_flight_failure(self):
+        CachedHandler.deferred = Deferred()
+
+        d1 = self.get_cached()
+        d2 = self.get_cached()
+
+        CachedHandler.deferred.errback(Exception('antani'))
+
+        yield self.assertFailure(d1, Exception)
+        yield self.assertFailure(d2, Exception)
+        self.assertEqual(ApiCache.pending_dict, {})
+        self.assertIsNone(ApiCache.get(1, '/cached', 'en'))
+
+    @inlineCallbacks
+    def test_warmup(self):
+        yield warmup(1)
+
+        for lang in self.state.tenant_cache[1].languages_enabled:
+            self.assertIsNotNone(ApiCache.get(1, '/public', lang))
+            self.assertIsNotNone(ApiCache.get(1, '/l10n/' + lang, None))
+
+        # the translations are requested with any language
+        for lang in self.state.tenant_cache[1].languages_enabled:
+            key = get_cache_key(L10NHandler, 1, '/l10n/en', lang)
+            self.assertIsNotNone(ApiCache.get(*key))
+
+    @inlineCallbacks
+    def test_streaming_handler(self):
+        StreamingHandler.calls = 0
+        StreamingHandler.deferred = Deferred()
+
+        requests = []
+        for _ in range(2):
+            request = helpers.forge_request(uri='https://www.globaleaks.org/stream')
+            request.language = 'en'
+            requests.append(request)
+
+        d1 = StreamingHandler(self.state, requests[0]).get()
+        d2 = StreamingHandler(self.state, requests[1]).get()
+
+        StreamingHandler.deferred.callback(None)
+
+        yield d1
+        yield d2
+
+        # each of the requests is served by its own handler
+        self.assertEqual(StreamingHandler.calls, 2)
+        for request in requests:
+            self.assertEqual(''.join(request.written), 'antani')
+
+        self.assertIsNone(ApiCache.get(1, '/stream', 'en'))
@@ -3,8 +3,17 @@
 from globaleaks.handlers import export
 from globaleaks.jobs.delivery import Delivery
 from globaleaks.tests import helpers
+from globaleaks.utils.zipstream import ZipChunk
 from twisted.internet.defer import inlineCallbacks
 
+
+class AbortableTransport(object):
+    aborted = False
+
+    def abortConnection(self):
+        self.aborted = True
+
+
 class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
     complex_field_population = True
     _handler = export.ExportHandler
@@ -31,3 +40,22 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
 
         yield handler.get(rtips_desc[0]['id'])
         self.assertNotEqual(handler.request.getResponseBody(), '')
+
+    @inlineCallbacks
+    def test_export_failure(self):
+        def iter_chunks(zip_stream):
+            yield ZipChunk(lambda _: 'antani')
+            raise IOError("antani")
+
+        self.patch(export.ZipStream, 'iter_chunks', iter_chunks)
+
+        rtips_desc = yield self.get_rtips()
+
+        handler = self.request({}, role='receiver')
+        handler.current_user.user_id = rtips_desc[0]['receiver_id']
+        handler.request.transport = AbortableTransport()
+
+        yield handler.get(rtips_desc[0]['id'])
+        self.assertEqual(handler.request.getResponseBody(), 'antani')
+        self.assertTrue(handler.request.transport.aborted)
+        self.assertFalse(handler.request.finished)
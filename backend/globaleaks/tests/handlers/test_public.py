@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import json
 
+from globaleaks import models
 from globaleaks.handlers import public
+from globaleaks.orm import transact_ro
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
@@ -16,3 +18,34 @@ class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
         response = yield handler.get()
 
         self._handler.validate_message(json.dumps(response), requests.PublicResourcesDesc)
+
+
+@transact_ro
+def get_questionnaires(session, tid, language):
+    questionnaires = session.query(models.Questionnaire).filter(models.Questionnaire.tid.in_(set([1, tid]))).all()
+
+    compiled = public.QuestionnaireCache.get(session, questionnaires)
+
+    return [(public.serialize_questionnaire(session, tid, q, language),
+             public.localize_questionnaire(compiled[q.id], q.tid == tid, language)) for q in questionnaires]
+
+
+class TestQuestionnaireCache(helpers.TestGLWithPopulatedDB):
+    @inlineCallbacks
+    def test_localize_questionnaire(self):
+        for tid in [1, 2]:
+            for language in ['en', 'it', None]:
+                questionnaires = yield get_questionnaires(tid, language)
+                self.assertTrue(questionnaires)
+                for serialized, localized in questionnaires:
+                    self.assertEqual(localized, serialized)
+
+    @inlineCallbacks
+    def test_invalidate(self):
+        yield get_questionnaires(1, 'en')
+        self.assertTrue(public.QuestionnaireCache.compiled_dict)
+
+        version = public.QuestionnaireCache.version
+        public.QuestionnaireCache.invalidate()
+        self.assertEqual(public.QuestionnaireCache.version, version + 1)
+        self.assertEqual(public.QuestionnaireCache.compiled_dict, {})
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import json
+
 from globaleaks import models
 from globaleaks.handlers.admin import receiver as admin_receiver
 from globaleaks.handlers import receiver
+from globaleaks.handlers.base import JSONStreamProducer
 from globaleaks.orm import transact
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_never
@@ -44,7 +47,16 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
     @inlineCallbacks
     def test_get(self):
         handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
-        yield handler.get()
+        rows = yield handler.get()
+
+        expected = yield receiver.get_receivertip_list(1, self.dummyReceiver_1['id'], 'en')
+        self.assertTrue(len(expected) > 0)
+
+        # the tips are streamed as a JSON array
+        yield JSONStreamProducer(handler.request, rows).start()
+
+        tips = json.loads(handler.request.getResponseBody())
+        self.assertEqual([tip['id'] for tip in tips], [tip['id'] for tip in expected])
 
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
@@ -1,15 +1,96 @@
 # -*- coding: utf-8 -*-
+from sqlalchemy import event
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers import rtip
+from globaleaks.handlers.custodian import db_get_identityaccessrequest_list
 from globaleaks.jobs.delivery import Delivery
+from globaleaks.orm import transact
 from globaleaks.rest import errors
 from globaleaks.state import State
 from globaleaks.tests import helpers
 from globaleaks.utils.utility import datetime_now, ISO8601_to_datetime
 
 
+@transact
+def add_comments_and_messages(session, count):
+    for rtip_obj, itip in session.query(models.ReceiverTip, models.InternalTip) \
+                                 .filter(models.ReceiverTip.internaltip_id == models.InternalTip.id):
+        for i in range(count):
+            comment = models.Comment()
+            comment.internaltip_id = itip.id
+            comment.author_id = rtip_obj.receiver_id
+            comment.content = u'comment'
+            comment.type = u'receiver'
+            session.add(comment)
+
+            message = models.Message()
+            message.receivertip_id = rtip_obj.id
+            message.content = u'message'
+            message.type = u'receiver'
+            session.add(message)
+
+
+@transact
+def serialize_rtips_counting_queries(session):
+    ret = []
+
+    for rtip_obj, itip in session.query(models.ReceiverTip, models.InternalTip) \
+                                 .filter(models.ReceiverTip.internaltip_id == models.InternalTip.id):
+        queries = []
+
+        def count(*args):
+            queries.append(args)
+
+        event.listen(session.bind, 'before_cursor_execute', count)
+        try:
+            desc = rtip.serialize_rtip(session, rtip_obj, itip, 'en')
+        finally:
+            event.remove(session.bind, 'before_cursor_execute', count)
+
+        # the expected serialization is obtained by the unbatched serializers
+        expected = {
+            'comments': rtip.db_get_itip_comment_list(session, itip.tid, itip),
+            'messages': rtip.db_get_itip_message_list(session, itip.tid, rtip_obj),
+            'rfiles': rtip.db_receiver_get_rfile_list(session, itip.tid, rtip_obj.id),
+            'wbfiles': rtip.db_receiver_get_wbfile_list(session, itip.tid, itip.id),
+            'iars': db_get_identityaccessrequest_list(session, itip.tid, rtip_obj.id)
+        }
+
+        ret.append((desc, expected, len(queries)))
+
+    return ret
+
+
+class TestSerializeRTip(helpers.TestHandlerWithPopulatedDB):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestHandlerWithPopulatedDB.setUp(self)
+        yield self.perform_full_submission_actions()
+        yield Delivery().run()
+
+    @inlineCallbacks
+    def test_serialize_rtip(self):
+        results = yield serialize_rtips_counting_queries()
+
+        yield add_comments_and_messages(50)
+
+        results_after = yield serialize_rtips_counting_queries()
+
+        for (desc, expected, queries), (desc_after, expected_after, queries_after) in zip(results, results_after):
+            for key in expected:
+                self.assertEqual(desc[key], expected[key])
+                self.assertEqual(desc_after[key], expected_after[key])
+
+            self.assertTrue(len(desc_after['comments']) >= 50)
+            self.assertTrue(len(desc_after['rfiles']) > 0)
+
+            # the number of queries does not depend on the number of objects
+            self.assertEqual(queries, queries_after)
+            self.assertTrue(queries <= 15)
+
+
 class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.RTipInstance
 
@@ -4,6 +4,7 @@ from globaleaks.handlers import signup
 from globaleaks.models import config
 from globaleaks.orm import transact
 from globaleaks.rest import errors
+from globaleaks.rest.apicache import ApiCache
 from globaleaks.tests import helpers
 
 
@@ -42,12 +43,17 @@ class TestSignupActivation(helpers.TestHandler):
         handler = self.request(self.dummySignup)
         r = yield handler.post()
 
+        ApiCache.set(1, '/public', u'en', 'application/json', '{}')
+
         self._handler = signup.SignupActivation
         handler = self.request(self.dummySignup)
         r = yield handler.get(r['signup']['activation_token'])
 
         self.assertTrue('admin_login_url' in r)
 
+        # the activation invalidates the cache of the root tenant
+        self.assertIsNone(ApiCache.get(1, '/public', u'en'))
+
     @inlineCallbacks
     def test_get_with_invalid_activation_token(self):
         yield enable_signup()
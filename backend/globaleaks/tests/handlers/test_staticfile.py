@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
-from globaleaks.handlers.staticfile import StaticFileHandler
+import zlib
+
+from globaleaks.handlers.staticfile import StaticFileHandler, StaticFileIndex
 from globaleaks.rest import errors
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
@@ -17,7 +19,72 @@ class TestStaticFileHandler(helpers.TestHandler):
         yield handler.get('')
         self.assertTrue(handler.request.getResponseBody().startswith('<!doctype html>'))
 
+    @inlineCallbacks
+    def test_get_range(self):
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'range': 'bytes=1-8'})
+        yield handler.get('')
+        self.assertEqual(handler.request.code, 206)
+        self.assertEqual(handler.request.getResponseBody(), '!doctype')
+
+    @inlineCallbacks
+    def test_get_unsatisfiable_range(self):
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'range': 'bytes=100000000-'})
+        yield handler.get('')
+        self.assertEqual(handler.request.code, 416)
+
     def test_get_unexistent(self):
         handler = self.request(kwargs={'path': Settings.client_path})
 
         return self.assertRaises(errors.ResourceNotFound, handler.get, u'unexistent')
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request(kwargs={'path': Settings.client_path})
+        yield handler.get('')
+        etag = handler.request.responseHeaders.getRawHeaders('etag')[0]
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'if-none-match': etag})
+        yield handler.get('')
+        self.assertEqual(handler.request.code, 304)
+        self.assertEqual(handler.request.getResponseBody(), '')
+
+    @inlineCallbacks
+    def test_get_gzip(self):
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'accept-encoding': 'gzip'})
+        yield handler.get('')
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders('content-encoding'), ['gzip'])
+        self.assertTrue(zlib.decompress(handler.request.getResponseBody(), 16 + zlib.MAX_WBITS).startswith('<!doctype html>'))
+
+    @inlineCallbacks
+    def test_etag_per_encoding(self):
+        handler = self.request(kwargs={'path': Settings.client_path})
+        yield handler.get('')
+        etag = handler.request.responseHeaders.getRawHeaders('etag')[0]
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'accept-encoding': 'gzip'})
+        yield handler.get('')
+        self.assertNotEqual(handler.request.responseHeaders.getRawHeaders('etag')[0], etag)
+
+        handler = self.request(kwargs={'path': Settings.client_path},
+                               headers={'accept-encoding': 'gzip', 'if-none-match': etag})
+        yield handler.get('')
+        self.assertNotEqual(handler.request.code, 304)
+
+        handler = self.request(kwargs={'path': Settings.client_path}, headers={'accept-encoding': 'gzip;q=0'})
+        yield handler.get('')
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders('content-encoding'), None)
+        self.assertEqual(handler.request.responseHeaders.getRawHeaders('etag')[0], etag)
+
+    @inlineCallbacks
+    def test_get_from_disk(self):
+        static_cache_max_file_size = Settings.static_cache_max_file_size
+        Settings.static_cache_max_file_size = 0
+        StaticFileIndex.load(Settings.client_path)
+
+        try:
+            handler = self.request(kwargs={'path': Settings.client_path})
+            yield handler.get('')
+            self.assertTrue(handler.request.getResponseBody().startswith('<!doctype html>'))
+        finally:
+            Settings.static_cache_max_file_size = static_cache_max_file_size
+            StaticFileIndex.load(Settings.client_path)
@@ -23,6 +23,7 @@ from globaleaks.handlers.admin.questionnaire import get_questionnaire, db_get_qu
 from globaleaks.handlers.admin.step import create_step
 from globaleaks.handlers.admin.tenant import create as create_tenant
 from globaleaks.handlers.admin.user import create_user, create_receiver_user
+from globaleaks.handlers.public import QuestionnaireCache
 from globaleaks.handlers.wizard import wizard
 from globaleaks.handlers.submission import create_submission
 from globaleaks.rest.apicache import ApiCache
@@ -131,6 +132,8 @@ def init_state():
         dir_util.remove_tree(Settings.working_path, 0)
 
     orm.set_thread_pool(FakeThreadPool())
+    orm.set_write_thread_pool(FakeThreadPool())
+    State.export_tp = FakeThreadPool()
 
     State.settings.enable_api_cache = False
     State.tenant_cache[1] = ObjectDict()
@@ -336,6 +339,9 @@ class TestGL(unittest.TestCase):
 
         init_state()
 
+        # the questionnaires are recreated with the same ids by each test
+        QuestionnaireCache.invalidate()
+
         self.setUp_dummy()
 
         if self.initialize_test_database_using_archived_db:
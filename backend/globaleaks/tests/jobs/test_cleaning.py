@@ -6,6 +6,7 @@ from globaleaks.jobs import cleaning, delivery
 from globaleaks.orm import transact
 from globaleaks.settings import Settings
 from globaleaks.tests import helpers
+from globaleaks.utils.storage import Storage
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -114,3 +115,28 @@ class TestCleaning(helpers.TestGLWithPopulatedDB):
 
         # verify cascade deletion when tips expire
         yield self.check4()
+
+    @transact
+    def mark_for_secure_deletion(self, session, filepath):
+        secure_file_delete = models.SecureFileDelete()
+        secure_file_delete.filepath = filepath
+        session.add(secure_file_delete)
+
+    @inlineCallbacks
+    def test_pinned_blob_deletion(self):
+        writer = Storage.writer()
+        writer.write("antani")
+        path = writer.close()
+
+        yield self.mark_for_secure_deletion(path)
+
+        # the blob is pinned by the writer and is left to the next run
+        yield cleaning.Cleaning().run()
+        self.assertTrue(os.path.exists(path))
+        yield self.test_model_count(models.SecureFileDelete, 1)
+
+        Storage.unpin(path)
+
+        yield cleaning.Cleaning().run()
+        self.assertFalse(os.path.exists(path))
+        yield self.test_model_count(models.SecureFileDelete, 0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import base64
+
+from globaleaks.jobs.delivery import PGPSink, fanout_file
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.pgp import PGPContext
+
+
+class MemorySink(object):
+    def __init__(self, fail=False):
+        self.error = None
+        self.data = ''
+        self.fail = fail
+
+    def write(self, data):
+        if self.fail:
+            raise IOError
+
+        self.data += bytes(data)
+
+    def close(self):
+        return self.error is None
+
+
+class TestDelivery(helpers.TestGL):
+    def test_fanout_file(self):
+        sf = helpers.get_dummy_file()['body']
+
+        stats = {'current_bytes': 0}
+        sinks = [MemorySink(), MemorySink(), MemorySink(fail=True)]
+
+        fanout_file(sf, sinks, stats)
+
+        content = base64.b64decode(helpers.VALID_BASE64_IMG)
+        self.assertEqual(sinks[0].data, content)
+        self.assertEqual(sinks[1].data, content)
+        self.assertIsInstance(sinks[2].error, IOError)
+        self.assertEqual(stats['current_bytes'], len(content))
+
+    def test_fanout_file_pgp(self):
+        # the encryptions of the batch run in parallel in distinct gpg processes
+        self.patch(Settings, 'pgp_backend', 'gnupg')
+
+        sf = helpers.get_dummy_file()['body']
+
+        stats = {'current_bytes': 0}
+        sinks = []
+        for key in ['VALID_PGP_KEY1_PUB', 'VALID_PGP_KEY2_PUB']:
+            sinks.append(PGPSink(self.state, {'receiver': {'pgp_key_public': helpers.PGPKEYS[key]}}))
+
+        for sink in sinks:
+            sink.start()
+
+        fanout_file(sf, sinks, stats)
+
+        content = base64.b64decode(helpers.VALID_BASE64_IMG)
+
+        for sink, key in zip(sinks, ['VALID_PGP_KEY1_PRV', 'VALID_PGP_KEY2_PRV']):
+            self.assertIsNone(sink.error)
+
+            pgpctx = PGPContext()
+            pgpctx.load_key(helpers.PGPKEYS[key])
+            with open(sink.result[0], 'rb') as f:
+                self.assertEqual(pgpctx.gnupg.decrypt_file(f).data, content)
@@ -1,10 +1,35 @@
 # -*- coding: utf-8 -*-
+import re
+
 from twisted.internet.defer import inlineCallbacks, succeed
 
 from globaleaks import models
 from globaleaks.jobs.delivery import Delivery
-from globaleaks.jobs.notification import Notification
+from globaleaks.jobs.notification import MailGenerator, Notification, get_mails_from_the_pool
+from globaleaks.orm import transact
+from globaleaks.state import State
 from globaleaks.tests import helpers
+from globaleaks.utils.utility import datetime_now, datetime_null
+
+
+@transact
+def count_notification_events(session):
+    return session.query(models.NotificationEvent).count()
+
+
+@transact
+def get_mails(session):
+    return [(m.address, m.subject) for m in session.query(models.Mail)]
+
+
+@transact
+def set_notification_events_date(session, date):
+    session.query(models.NotificationEvent).update({'creation_date': date})
+
+
+@transact
+def set_mails_due(session):
+    session.query(models.Mail).update({'next_attempt': datetime_now()})
 
 
 class TestNotification(helpers.TestGLWithPopulatedDB):
@@ -44,6 +69,88 @@ class TestNotification(helpers.TestGLWithPopulatedDB):
             yield notification.run()
             yield self.test_model_count(models.Mail, 24)
 
+            # the failed mails are not retried before their next attempt
+            mails = yield get_mails_from_the_pool(100)
+            self.assertEqual(len(mails), 0)
+
+            yield set_mails_due()
+
         yield notification.run()
 
         yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_mail_priority(self):
+        for priority in [models.Mail.PRIORITY_NOTIFICATION, models.Mail.PRIORITY_ALERT, models.Mail.PRIORITY_SYSTEM]:
+            yield models.forge_obj(models.Mail, {
+                'address': u'test@example.net',
+                'subject': u'%d' % priority,
+                'body': u'',
+                'priority': priority
+            })
+
+        for priority in [models.Mail.PRIORITY_ALERT, models.Mail.PRIORITY_SYSTEM, models.Mail.PRIORITY_NOTIFICATION]:
+            mails = yield get_mails_from_the_pool(1)
+            self.assertEqual(len(mails), 1)
+            self.assertEqual(mails[0]['subject'], u'%d' % priority)
+
+        mails = yield get_mails_from_the_pool(1)
+        self.assertEqual(len(mails), 0)
+
+    @inlineCallbacks
+    def test_notification_events(self):
+        yield Delivery().run()
+
+        count = yield count_notification_events()
+        self.assertTrue(count > 1)
+
+        # the events are consumed in batches
+        self.patch(MailGenerator, 'batch_size', 1)
+
+        yield MailGenerator(State).generate()
+        self.assertEqual((yield count_notification_events()), count - 1)
+
+        for _ in range(count - 1):
+            yield MailGenerator(State).generate()
+
+        yield self.test_model_count(models.NotificationEvent, 0)
+        yield self.test_model_count(models.Mail, 24)
+
+    @inlineCallbacks
+    def test_notification_disabled(self):
+        yield Delivery().run()
+
+        State.tenant_cache[1].notification.disable_receiver_notification_emails = True
+
+        yield MailGenerator(State).generate()
+
+        yield self.test_model_count(models.NotificationEvent, 0)
+        yield self.test_model_count(models.Mail, 0)
+
+    @inlineCallbacks
+    def test_notification_digest(self):
+        yield Delivery().run()
+
+        count = yield count_notification_events()
+
+        State.tenant_cache[1].notification.notification_digest_interval = 60
+
+        # the events are kept until the digest interval has elapsed
+        yield MailGenerator(State).generate()
+        self.assertEqual((yield count_notification_events()), count)
+        yield self.test_model_count(models.Mail, 0)
+
+        yield set_notification_events_date(datetime_null())
+
+        yield MailGenerator(State).generate()
+        yield self.test_model_count(models.NotificationEvent, 0)
+
+        # a single digest is generated for each receiver
+        mails = yield get_mails()
+        self.assertEqual(len(mails), self.population_of_recipients)
+        self.assertEqual(len(set(address for address, _ in mails)), len(mails))
+
+        for _, subject in mails:
+            match = re.match(r'^(\d+) new events$', subject)
+            self.assertIsNotNone(match)
+            self.assertTrue(int(match.group(1)) > 1)
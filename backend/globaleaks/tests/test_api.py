@@ -1,13 +1,33 @@
 # -*- coding: utf-8 -*-
+import json
+import re
+import zlib
+
 from twisted.internet.address import IPv4Address
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.db import refresh_memory_variables
 from globaleaks.handlers.admin.node import update_enabled_languages
+from globaleaks.handlers.base import BaseHandler
+from globaleaks.rest import errors
 from globaleaks.state import State
 from globaleaks.tests.helpers import TestGL, forge_request
 
 
+class StreamingHandler(BaseHandler):
+    check_roles = '*'
+
+    def get(self):
+        return iter([{'id': 1}])
+
+
+class FailingHandler(BaseHandler):
+    check_roles = '*'
+
+    def get(self):
+        raise errors.ResourceNotFound()
+
+
 class TestAPI(TestGL):
     @inlineCallbacks
     def setUp(self):
@@ -150,3 +170,29 @@ class TestAPI(TestGL):
         self.assertEqual(request.responseCode, 301)
         location = request.responseHeaders.getRawHeaders(b'location')[0]
         self.assertEqual('https://www.globaleaks.org/public', location)
+
+    def test_stream_encoding(self):
+        self.api._registry.insert(0, (re.compile('^/streaming$'), StreamingHandler, {}))
+
+        request = forge_request(uri='https://www.globaleaks.org/streaming', headers={'Accept-Encoding': 'gzip'})
+        self.api.render(request)
+        self.assertEqual(request.responseHeaders.getRawHeaders('Content-Encoding'), ['gzip'])
+        self.assertEqual(json.loads(zlib.decompress(request.getResponseBody(), 16 + zlib.MAX_WBITS)), [{'id': 1}])
+
+        request = forge_request(uri='https://www.globaleaks.org/streaming', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.api.render(request)
+        self.assertIsNone(request.responseHeaders.getRawHeaders('Content-Encoding'))
+        self.assertEqual(json.loads(request.getResponseBody()), [{'id': 1}])
+
+    def test_profile_failed_request(self):
+        self.api._registry.insert(0, (re.compile('^/failing$'), FailingHandler, {}))
+
+        State.enable_profiler()
+
+        try:
+            request = forge_request(uri='https://www.globaleaks.org/failing')
+            self.api.render(request)
+            self.assertEqual(request.responseCode, 404)
+            self.assertIn('FailingHandler.get', State.profiler.handlers)
+        finally:
+            State.disable_profiler()
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+from sqlalchemy.exc import OperationalError
+
+from globaleaks import orm
 from globaleaks.models import Counter
-from globaleaks.orm import get_session, transact
+from globaleaks.orm import get_session, get_shared_engine, transact, transact_ro
 from globaleaks.tests import helpers
 from twisted.internet.defer import inlineCallbacks
 
@@ -24,6 +27,15 @@ class TestORM(helpers.TestGL):
         self.db_add_config(session)
         raise Exception("antani")
 
+    @transact_ro
+    def _transact_ro_with_write(self, session):
+        self.db_add_config(session)
+        session.flush()
+
+    @transact_ro
+    def _get_journal_mode(self, session):
+        return session.execute("PRAGMA journal_mode").fetchone()[0]
+
     def db_add_config(self, session):
         session.add(Counter({'tid': 1, 'key': 'antani', 'number': 31337}))
 
@@ -56,3 +68,50 @@ class TestORM(helpers.TestGL):
             self.assertTrue(getattr(session, 'query'))
 
         return transaction()
+
+    def test_shared_engine(self):
+        engine = get_shared_engine()
+        self.assertIs(engine, get_shared_engine())
+
+        session = get_session()
+        self.assertIs(session.bind, engine)
+        session.close()
+
+    @inlineCallbacks
+    def test_transact_ro_never_commits(self):
+        yield self._transact_ro_with_write()
+
+        session = get_session()
+        self.assertEqual(session.query(Counter).count(), 0)
+        session.close()
+
+    @inlineCallbacks
+    def test_transact_ro_retries_when_locked(self):
+        attempts = []
+
+        @transact_ro
+        def transaction(session):
+            attempts.append(True)
+            if len(attempts) == 1:
+                raise OperationalError(None, None, Exception("database is locked"))
+
+            return len(attempts)
+
+        result = yield transaction()
+        self.assertEqual(result, 2)
+
+    @inlineCallbacks
+    def test_wal_mode(self):
+        orm.set_wal_mode(True)
+
+        try:
+            journal_mode = yield self._get_journal_mode()
+            self.assertEqual(journal_mode, 'wal')
+
+            yield self._transact_with_success()
+
+            session = get_session()
+            self.assertEqual(session.query(Counter).count(), 1)
+            session.close()
+        finally:
+            orm.set_wal_mode(False)
@@ -24,3 +24,66 @@ class TestMailUtils(helpers.TestGL):
         yield self.test_model_count(models.Mail, 1)
         mailutils.extract_exception_traceback_and_schedule_email(Failure(Exception()))
         yield self.test_model_count(models.Mail, 2)
+
+
+class FakeSMTPClientPool(mailutils.SMTPClientPool):
+    connections = 0
+
+    def connect(self):
+        self.connections += 1
+        self.sessions += 1
+
+
+class TestSMTPClientPool(helpers.TestGL):
+    def get_pool(self, **kwargs):
+        return FakeSMTPClientPool(1, u'username', u'password', u'smtp.example.org', 587, u'TLS',
+                                  u'GlobaLeaks', u'notification@example.org', False, **kwargs)
+
+    @inlineCallbacks
+    def test_sessions_are_reused(self):
+        pool = self.get_pool(concurrency=2)
+
+        deferreds = [pool.sendmail(u'receiver%d@example.org' % i, u'subject', u'body') for i in range(5)]
+        self.assertEqual(pool.connections, 2)
+
+        # the two sessions deliver all the queued mails
+        for i in range(5):
+            mail = pool.get_mail()
+            if i == 2:
+                pool.mail_failed(mail, Exception())
+            else:
+                pool.mail_sent(mail)
+
+        self.assertIsNone(pool.get_mail())
+
+        pool.session_closed(None, None)
+        pool.session_closed(None, None)
+
+        results = yield deferreds[0]
+        self.assertTrue(results)
+
+        results = yield deferreds[2]
+        self.assertFalse(results)
+
+        self.assertEqual(pool.connections, 2)
+        self.assertEqual(pool.sessions, 0)
+
+    @inlineCallbacks
+    def test_session_failure(self):
+        pool = self.get_pool(concurrency=1)
+
+        deferreds = [pool.sendmail(u'receiver%d@example.org' % i, u'subject', u'body') for i in range(3)]
+
+        mail = pool.get_mail()
+        pool.session_closed(mail, Exception())
+
+        for d in deferreds:
+            result = yield d
+            self.assertFalse(result)
+
+    def test_rate_limit(self):
+        pool = self.get_pool(rate_limit=60)
+        pool.sendmail(u'receiver@example.org', u'subject', u'body')
+
+        self.assertEqual(pool.get_delay(), 0)
+        self.assertGreater(pool.get_delay(), 0)
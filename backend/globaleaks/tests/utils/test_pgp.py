@@ -1,10 +1,15 @@
 # -*- coding: utf-8
 import os
+import shutil
 from datetime import datetime
 
-from globaleaks.utils.pgp import PGPContext
+from globaleaks.utils import openpgp
+from globaleaks.utils.pgp import NativePGPBackend, PGPContext, PGPKeyring
 from globaleaks.tests import helpers
 
+# the armor headers may include any UTF-8 text
+UNICODE_PGP_KEY1_PUB = helpers.PGPKEYS['VALID_PGP_KEY1_PUB'].replace(u'-----\n', u'-----\nComment: \u00e0\u00e8\u00ec\n', 1)
+
 
 class TestPGP(helpers.TestGL):
     secret_content = helpers.PGPKEYS['VALID_PGP_KEY1_PRV']
@@ -55,3 +60,130 @@ class TestPGP(helpers.TestGL):
 
         self.assertEqual(pgpctx.load_key(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB'])['expiration'],
                          datetime.utcfromtimestamp(1391012793))
+
+
+class TestPGPKeyring(helpers.TestGL):
+    secret_content = helpers.PGPKEYS['VALID_PGP_KEY1_PRV']
+
+    def test_encrypt_message(self):
+        keyring = PGPKeyring()
+
+        encrypted_body = keyring.encrypt_message(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'], self.secret_content)
+
+        self.assertEqual(str(keyring.get_context().gnupg.decrypt(encrypted_body)), self.secret_content)
+
+    def test_keys_are_imported_once(self):
+        keyring = PGPKeyring()
+
+        fingerprint = keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        self.assertEqual(fingerprint, u'BFB3C82D1B5F6A94BDAC55C6E70460ABF9A4C8C1')
+
+        keyring.context.load_key = None
+        self.assertEqual(keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']), fingerprint)
+
+    def test_invalidate(self):
+        keyring = PGPKeyring()
+
+        fingerprint = keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        keyring.invalidate(fingerprint)
+
+        self.assertEqual(keyring.keys, {})
+        self.assertEqual(keyring.digests, {})
+        self.assertEqual(keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']), fingerprint)
+
+    def test_keyring_removed(self):
+        keyring = PGPKeyring()
+
+        fingerprint = keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        shutil.rmtree(keyring.context.gnupg.gnupghome)
+
+        # the key is imported in the new keyring returned together with the fingerprint
+        context, new_fingerprint = keyring.get_context_and_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        self.assertEqual(new_fingerprint, fingerprint)
+        self.assertIs(context, keyring.context)
+        self.assertTrue(os.path.exists(context.gnupg.gnupghome))
+
+    def test_unicode_armor(self):
+        keyring = PGPKeyring()
+
+        self.assertEqual(keyring.get_fingerprint(UNICODE_PGP_KEY1_PUB),
+                         keyring.get_fingerprint(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']))
+
+    def test_evict_expired(self):
+        keyring = PGPKeyring()
+
+        keyring.get_fingerprint(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB'])
+        keyring.evict_expired()
+
+        self.assertEqual(keyring.keys, {})
+
+
+class TestNativePGPBackend(helpers.TestGL):
+    secret_content = helpers.PGPKEYS['VALID_PGP_KEY1_PRV']
+
+    def test_encrypt_message(self):
+        backend = NativePGPBackend(PGPKeyring())
+
+        encrypted_body = backend.encrypt_message(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], self.secret_content)
+
+        pgpctx = PGPContext()
+        pgpctx.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+        self.assertEqual(str(pgpctx.gnupg.decrypt(encrypted_body)), self.secret_content)
+
+    def test_encrypt_file(self):
+        file_src = os.path.join(os.getcwd(), 'test_plaintext_file.txt')
+        file_dst = os.path.join(os.getcwd(), 'test_encrypted_file.txt')
+
+        backend = NativePGPBackend(PGPKeyring())
+
+        with open(file_src, 'w+') as f:
+            f.write(self.secret_content)
+            f.seek(0)
+
+            backend.encrypt_file(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], f, file_dst)
+
+        pgpctx = PGPContext()
+        pgpctx.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+        with open(file_dst, 'r') as f:
+            self.assertEqual(str(pgpctx.gnupg.decrypt_file(f)), self.secret_content)
+
+    def test_fallback(self):
+        backend = NativePGPBackend(PGPKeyring())
+
+        self.assertIsNotNone(backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']))
+        self.assertIsNone(backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY1_PRV']))
+        self.assertIsNone(backend.get_key(helpers.PGPKEYS['EXPIRED_PGP_KEY_PUB']))
+
+    def test_unicode_armor(self):
+        backend = NativePGPBackend(PGPKeyring())
+
+        self.assertEqual(backend.get_key(UNICODE_PGP_KEY1_PUB).fingerprint,
+                         backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']).fingerprint)
+
+    def test_third_party_certification(self):
+        # the key expires after one day and is certified by another key
+        key = openpgp.Key(helpers.PGPKEYS['EXPIRED_CERTIFIED_PGP_KEY_PUB'])
+        now = key.primary.creation + 3 * 86400
+
+        self.assertEqual(key.primary.expiration, 86400)
+        self.assertTrue(key.primary.is_expired(now))
+        self.assertRaises(openpgp.OpenPGPError, key.get_encryption_key, now)
+
+    def test_malformed_key(self):
+        backend = NativePGPBackend(PGPKeyring())
+
+        def parse(key):
+            raise IndexError
+
+        # the errors of the parser are handled falling back to gpg
+        self.patch(openpgp, 'Key', parse)
+        self.assertIsNone(backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB']))
+
+    def test_keys_cache_is_bounded(self):
+        backend = NativePGPBackend(PGPKeyring())
+        backend.max_keys = 1
+
+        backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'])
+        backend.get_key(helpers.PGPKEYS['VALID_PGP_KEY2_PUB'])
+
+        self.assertEqual(len(backend.keys), 1)
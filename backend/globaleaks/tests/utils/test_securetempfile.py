@@ -18,3 +18,32 @@ class TestSecureTemporaryFiles(helpers.TestGL):
         with a.open('r') as f:
             for x in range(1000):
                 self.assertTrue(antani == f.read(10))
+
+    def test_copy_to(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        antani = "0123456789" * 1000
+        with a.open('w') as f:
+            f.write(antani)
+            f.finalize_write()
+
+        with a.open('r') as f:
+            self.assertEqual(''.join(str(chunk) for chunk in f.iter_decrypted(1000)), antani)
+
+        destination = os.path.join(Settings.tmp_path, 'antani')
+        with a.open('r') as f, open(destination, 'w') as output:
+            f.copy_to(output, 1000)
+
+        with open(destination, 'r') as f:
+            self.assertEqual(f.read(), antani)
+
+    def test_write_at(self):
+        a = SecureTemporaryFile(Settings.tmp_path)
+        antani = "0123456789" * 1000
+
+        # chunks not aligned to the AES block size written in reverse order
+        offsets = range(0, len(antani), 1001)
+        for offset in reversed(offsets):
+            a.write_at(offset, antani[offset:offset + 1001])
+
+        with a.open('r') as f:
+            self.assertEqual(f.read(), antani)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.storage import Storage, is_blob
+
+
+class TestStorage(helpers.TestGL):
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGL.setUp(self)
+        Storage.pins.clear()
+
+    def store(self, content):
+        writer = Storage.writer()
+        writer.write(content)
+        return writer.close()
+
+    def test_write_and_read(self):
+        content = "antani" * 1000
+
+        path = self.store(content)
+        self.assertTrue(is_blob(path))
+        self.assertEqual(os.path.dirname(path), Settings.attachments_path)
+
+        with open(path, 'rb') as f:
+            self.assertNotIn(content, f.read())
+
+        with Storage.open(path) as f:
+            self.assertEqual(f.size, len(content))
+            self.assertEqual(f.read(), content)
+
+    def test_seek(self):
+        content = "0123456789" * 1000
+
+        with Storage.open(self.store(content)) as f:
+            for offset in [5000, 17, 9999, 0]:
+                f.seek(offset)
+                self.assertEqual(f.read(100), content[offset:offset + 100])
+
+    def test_deduplication(self):
+        path1 = self.store("antani")
+        path2 = self.store("antani")
+        path3 = self.store("sblinda")
+
+        self.assertEqual(path1, path2)
+        self.assertNotEqual(path1, path3)
+        self.assertEqual(len(os.listdir(Settings.attachments_path)), 2)
+
+    def test_abort(self):
+        writer = Storage.writer()
+        writer.write("antani")
+        writer.abort()
+
+        self.assertEqual(os.listdir(Settings.attachments_path), [])
+
+    def test_missing_key(self):
+        self.store("antani")
+
+        os.remove(Storage.get_key_path())
+
+        self.assertRaises(errors.InternalServerError, Storage.get_keys)
+
+    def test_pinned_blob_is_not_removed(self):
+        path = self.store("antani")
+
+        self.assertIsNone(Storage.remove_unreferenced(path, lambda p: 0, os.remove))
+        self.assertTrue(os.path.exists(path))
+
+        Storage.unpin(path)
+
+        self.assertFalse(Storage.remove_unreferenced(path, lambda p: 1, os.remove))
+        self.assertTrue(os.path.exists(path))
+
+        self.assertTrue(Storage.remove_unreferenced(path, lambda p: 0, os.remove))
+        self.assertFalse(os.path.exists(path))
+
+    def test_deduplicated_blob_is_pinned(self):
+        path = self.store("antani")
+        Storage.unpin(path)
+
+        self.assertEqual(self.store("antani"), path)
+        self.assertIsNone(Storage.remove_unreferenced(path, lambda p: 0, os.remove))
+
+        Storage.unpin(path)
+
+        self.assertTrue(Storage.remove_unreferenced(path, lambda p: 0, os.remove))
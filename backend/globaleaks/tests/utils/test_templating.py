@@ -3,7 +3,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks.handlers import admin, rtip
 from globaleaks.jobs.delivery import Delivery
 from globaleaks.tests import helpers
-from globaleaks.utils.templating import Templating, supported_template_types
+from globaleaks.utils.templating import Templating, compiled_templates, supported_template_types
 
 
 class notifTemplateTest(helpers.TestGLWithPopulatedDB):
@@ -39,3 +39,35 @@ class notifTemplateTest(helpers.TestGLWithPopulatedDB):
             data['type'] = key
             template = ''.join(supported_template_types[key].keyword_list)
             Templating().format_template(template, data)
+
+        events = []
+        for key in ['tip', 'comment', 'message', 'file']:
+            event = dict(data)
+            event['type'] = key
+            events.append(event)
+
+        digest = {
+            'type': 'digest',
+            'user': data['user'],
+            'node': data['node'],
+            'notification': data['notification'],
+            'events': events
+        }
+
+        subject, body = Templating().get_mail_subject_and_body(digest)
+        self.assertIn('4', subject)
+        self.assertEqual(body.count(data['notification']['comment_mail_title']), 1)
+
+    def test_compiled_templates(self):
+        data = {
+            'type': 'admin_test',
+            'node': {'name': u'{RecipientName}'},
+            'notification': {},
+            'user': {'name': u'Recipient'}
+        }
+
+        template = u'{NodeName} {RecipientName} {TipNum} {Unknown}\n{Blank}'
+
+        self.assertEqual(Templating().format_template(template, data), u'Recipient Recipient {TipNum} {Unknown}')
+        self.assertIn(template, compiled_templates)
+
@@ -0,0 +1,107 @@
+# -*- coding: utf-8
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+from twisted.web.test.requesthelper import DummyChannel
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.tests import helpers
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.upload import MultipartParser, UploadRequest, UploadSession
+from globaleaks.utils.utility import timedLogFormatter
+
+
+class TestUploadSession(helpers.TestGL):
+    def test_out_of_order_chunks(self):
+        antani = "0123456789" * 100
+        session = UploadSession(Settings.tmp_path, len(antani), 300, 4)
+
+        for number in [3, 1, 4, 1, 2]:
+            self.assertFalse(session.is_complete())
+            offset = (number - 1) * 300
+            session.write_chunk(number, antani[offset:offset + 300])
+            self.assertTrue(session.has_chunk(number))
+
+        self.assertTrue(session.is_complete())
+
+        with session.file.open('r') as f:
+            self.assertEqual(f.read(), antani)
+
+    def test_invalid_chunks(self):
+        session = UploadSession(Settings.tmp_path, 1000, 300, 4)
+
+        self.assertRaises(errors.InputValidationError, session.write_chunk, 0, "a" * 300)
+        self.assertRaises(errors.InputValidationError, session.write_chunk, 5, "a" * 300)
+        self.assertRaises(errors.InputValidationError, session.write_chunk, 1, "a" * 299)
+        self.assertRaises(errors.InputValidationError, session.write_chunk, 4, "a" * 300)
+
+        self.assertRaises(errors.InputValidationError, UploadSession, Settings.tmp_path, 100, 300, 4)
+
+    def test_streamed_chunk(self):
+        antani = "0123456789" * 100
+
+        chunk = SecureTemporaryFile(Settings.tmp_path)
+        with chunk.open('w') as f:
+            f.write(antani)
+            f.finalize_write()
+
+        session = UploadSession(Settings.tmp_path, len(antani), len(antani), 1)
+        session.write_chunk(1, chunk)
+
+        with session.file.open('r') as f:
+            self.assertEqual(f.read(), antani)
+
+
+class TestMultipartParser(helpers.TestGL):
+    body = ('--XyZ\r\n'
+            'Content-Disposition: form-data; name="flowChunkNumber"\r\n'
+            '\r\n'
+            '1\r\n'
+            '--XyZ\r\n'
+            'Content-Disposition: form-data; name="file"; filename="blob"\r\n'
+            'Content-Type: application/octet-stream\r\n'
+            '\r\n'
+            '%s\r\n'
+            '--XyZ--\r\n')
+
+    def test_parse(self):
+        antani = "0123456789\r\n--Xy" * 1000
+        body = self.body % antani
+
+        for step in [1, 7, 1000, len(body)]:
+            parser = MultipartParser('XyZ', Settings.tmp_path)
+            for i in range(0, len(body), step):
+                parser.feed(body[i:i + step])
+
+            args = parser.close()
+
+            self.assertEqual(args['flowChunkNumber'], ['1'])
+            self.assertEqual(args['file'][0].size, len(antani))
+
+            with args['file'][0].open('r') as f:
+                self.assertEqual(f.read(), antani)
+
+    def test_truncated_body(self):
+        parser = MultipartParser('XyZ', Settings.tmp_path)
+        parser.feed((self.body % 'antani')[:-10])
+
+        self.assertRaises(errors.InputValidationError, parser.close)
+
+
+class TestUploadRequest(helpers.TestGL):
+    def test_malformed_body(self):
+        channel = DummyChannel()
+        channel.site = Site(Resource())
+        channel.site.resource.is_upload_path = lambda path: True
+        channel._command = b'POST'
+        channel._path = b'/wbtip/rfile'
+
+        request = UploadRequest(channel, False)
+        request.requestHeaders.setRawHeaders(b'content-type', [b'multipart/form-data; boundary=XyZ'])
+        request.gotLength(None)
+        request.handleContentChunk(b'--XyZ\r\n\r\nantani\r\n--XyZ--\r\n')
+        request.process()
+
+        self.assertEqual(request.code, 400)
+        self.assertTrue(request.finished)
+        self.assertIn(u'[None] 400', timedLogFormatter(None, request))
@@ -4,7 +4,8 @@ import os
 from zipfile import ZipFile
 
 from globaleaks.tests import helpers
-from globaleaks.utils.zipstream import ZipStream
+from globaleaks.utils import zipstream
+from globaleaks.utils.zipstream import ZipStream, ZIP_STORED
 from twisted.internet.defer import inlineCallbacks
 
 
@@ -34,6 +35,45 @@ class TestZipStream(helpers.TestGL):
             self.assertTrue(len(infolist), 2)
             for ff in infolist:
                 if ff.filename == self.unicode_seq:
-                    self.assertTrue(ff.file_size == len(self.unicode_seq))
+                    self.assertTrue(ff.file_size == len(self.unicode_seq.encode('utf-8')))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_get_size(self):
+        files = self.files + [{'name': 'image.jpg', 'path': os.path.abspath(__file__)}]
+
+        zip_stream = ZipStream(files, compression=ZIP_STORED)
+        size = zip_stream.get_size()
+
+        self.assertEqual(size, len(''.join(zip_stream)))
+
+    def test_stored_extensions(self):
+        output = StringIO.StringIO()
+
+        for data in ZipStream([{'name': 'image.jpg', 'path': os.path.abspath(__file__)}]):
+            output.write(data)
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual(f.infolist()[0].compress_type, ZIP_STORED)
+
+    def test_zip64(self):
+        # the Zip64 extensions are used for all the entries and the end records
+        self.patch(zipstream, 'ZIP64_LIMIT', 0)
+
+        files = self.files + [{'name': 'image.jpg', 'path': os.path.abspath(__file__)}]
+
+        zip_stream = ZipStream(files, compression=ZIP_STORED)
+        size = zip_stream.get_size()
+
+        output = StringIO.StringIO()
+        for data in zip_stream:
+            output.write(data)
+
+        self.assertEqual(size, len(output.getvalue()))
+        self.assertIn(zipstream.stringEndArchive64, output.getvalue())
+
+        with ZipFile(output, 'r') as f:
+            self.assertIsNone(f.testzip())
+            self.assertEqual([ff.file_size for ff in f.infolist()],
+                             [len(self.unicode_seq.encode('utf-8'))] + [os.stat(os.path.abspath(__file__)).st_size] * 2)
@@ -6,18 +6,19 @@ from globaleaks import models
 from globaleaks.orm import transact
 
 
-def db_schedule_email(session, tid, address, subject, body):
+def db_schedule_email(session, tid, address, subject, body, priority=models.Mail.PRIORITY_SYSTEM):
     return models.db_forge_obj(session, models.Mail,
                                {
                                    'address': address,
                                    'subject': subject,
                                    'body': body,
                                    'tid': tid,
+                                   'priority': priority
                                })
 
 @transact
-def schedule_email(session, tid, address, subject, body):
-    return db_schedule_email(session, tid, address, subject, body)
+def schedule_email(session, tid, address, subject, body, priority=models.Mail.PRIORITY_SYSTEM):
+    return db_schedule_email(session, tid, address, subject, body, priority)
 
 
 @transact
@@ -26,92 +26,116 @@ class BodyStreamer(protocol.Protocol):
 
 
 class BodyProducer(object):
+    """
+    Producer forwarding the body of a request while it is received
+    """
     implements(IBodyProducer)
 
-    BUF_MAX_SIZE = 64 * 1024 # TODO Use the hardcoded value for buf max size
-    length = 0
-    bytes_written = 0
-
-    deferred = None
-    inp_buf = None
-    rf_buf_fn = None
-    consumer = None
-
-    def __init__(self, inp_buf, rf_buf_fn, length):
-        self.inp_buf = inp_buf
-        self.rf_buf_fn = rf_buf_fn
+    def __init__(self, transport, length):
+        self.transport = transport
         self.length = length
+        self.consumer = None
+        self.buf = []
+        self.finished = False
         self.deferred = defer.Deferred()
 
     def startProducing(self, consumer):
         self.consumer = consumer
-        return self.resumeProducing()
 
-    def resumeProducing(self):
-        chunk = self.inp_buf.read()
-        n = len(chunk)
-        if n != 0:
-            self.consumer.write(chunk)
-            self.bytes_written += n
-            if self.bytes_written > self.BUF_MAX_SIZE:
-                self.inp_buf = self.rf_buf_fn()
-                self.bytes_written = 0
-        else:
+        for data in self.buf:
+            consumer.write(data)
+
+        self.buf = []
+        self.resumeProducing()
+
+        if self.finished:
             self.deferred.callback(None)
 
         return self.deferred
 
+    def write(self, data):
+        if self.deferred is None:
+            return
+
+        if self.consumer is None:
+            # the body received before the connection to the backend is
+            # established is buffered while the client is throttled
+            self.buf.append(data)
+            self.pauseProducing()
+        else:
+            self.consumer.write(data)
+
+    def finish(self):
+        self.finished = True
+
+        if self.consumer is not None and self.deferred is not None:
+            self.deferred.callback(None)
+
+    def resumeProducing(self):
+        self.transport.resumeProducing()
+
+    def pauseProducing(self):
+        self.transport.pauseProducing()
+
     def stopProducing(self):
         self.deferred = None
-        self.inp_buf.close()
-        self.rf_buf_fn = None
+        self.buf = []
         self.consumer = None
-
-    def pauseProducing(self):
-        pass
+        self.resumeProducing()
 
 
 class HTTPStreamProxyRequest(http.Request):
-    def __init__(self, *args, **kwargs):
-        http.Request.__init__(self, *args, **kwargs)
-
-    def reset_buffer(self):
-        self.content.seek(0, 0)
-        self.content.truncate(0)
-        return self.content
+    """
+    Request forwarding its body to the backend while it is received so
+    that the memory used does not depend on the size of the body
+    """
+    producer = None
+    proxy_d = None
 
     def gotLength(self, length):
-        http.Request.gotLength(self, length)
-        if isinstance(self.content, file):
-            self.content.close()
-            self.content = io.BytesIO()
-            self.reset_buffer()
+        self.content = io.BytesIO()
 
-    def process(self):
-        proxy_url = bytes(urlparse.urljoin(self.channel.proxy_url, self.uri))
+        if self.requestHeaders.hasHeader('Content-Length'):
+            # the method and the path are set on the request only once the body is received
+            self.producer = BodyProducer(self.channel.transport, length)
+            self.proxy_d = self.forward(self.channel._command, self.channel._path, self.producer)
+
+    def handleContentChunk(self, data):
+        if self.producer is not None:
+            self.producer.write(data)
+
+    def forward(self, method, uri, producer):
+        proxy_url = bytes(urlparse.urljoin(self.channel.proxy_url, uri))
 
         hdrs = self.requestHeaders
-        hdrs.setRawHeaders('GL-Forwarded-For', [self.getClientIP()])
+        hdrs.setRawHeaders('GL-Forwarded-For', [self.channel.transport.getPeer().host])
+        hdrs.removeHeader('Content-Length')
 
-        prod = None
-        content_length = self.getHeader('Content-Length')
-        if content_length is not None:
-            hdrs.removeHeader('Content-Length')
-            prod = BodyProducer(self.content, self.reset_buffer, int(content_length))
-            self.registerProducer(prod, streaming=True)
+        return self.channel.http_agent.request(method=method,
+                                               uri=proxy_url,
+                                               headers=hdrs,
+                                               bodyProducer=producer)
 
-        proxy_d = self.channel.http_agent.request(method=self.method,
-                                                  uri=proxy_url,
-                                                  headers=hdrs,
-                                                  bodyProducer=prod)
-        if prod is not None:
-            proxy_d.addBoth(self.proxyUnregister)
+    def process(self):
+        if self.producer is not None:
+            self.producer.finish()
+        else:
+            self.proxy_d = self.forward(self.method, self.uri, None)
 
-        proxy_d.addCallback(self.proxySuccess)
-        proxy_d.addErrback(self.proxyError)
+        # the response is written only after the whole request is received
+        self.proxy_d.addCallback(self.proxySuccess)
+        self.proxy_d.addErrback(self.proxyError)
 
         return NOT_DONE_YET
 
+    def connectionLost(self, reason):
+        http.Request.connectionLost(self, reason)
+
+        if self.producer is not None and not self.producer.finished:
+            # the client disconnected while sending the body
+            self.proxy_d.addErrback(lambda _: None)
+            self.proxy_d.cancel()
+
     def proxySuccess(self, response):
         self.responseHeaders = response.headers
 
@@ -131,10 +155,6 @@ class HTTPStreamProxyRequest(http.Request):
         self.setResponseCode(502)
         self.forwardClose()
 
-    def proxyUnregister(self, o):
-        self.unregisterProducer()
-        return o
-
     def forwardClose(self, *args):
         self.content.close()
         self.finish()
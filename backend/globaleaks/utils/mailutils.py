@@ -9,15 +9,16 @@ import StringIO
 import re
 import sys
 import traceback
+from collections import deque
 from email import utils, Charset  # pylint: disable=no-name-in-module
 from email.header import Header
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from txsocksx.client import SOCKS5ClientEndpoint
 
-from twisted.internet import reactor, defer
+from twisted.internet import reactor, defer, protocol
 from twisted.internet.endpoints import TCP4ClientEndpoint
-from twisted.mail.smtp import ESMTPSenderFactory, SMTPError
+from twisted.mail.smtp import DNSNAME, SUCCESS, ESMTPSender, SMTPClient, SMTPDeliveryError, SMTPError
 from twisted.protocols import tls
 from twisted.python.failure import Failure
 
@@ -51,6 +52,250 @@ def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, title, mail_body):
     return StringIO.StringIO(multipart.as_string())
 
 
+class SMTPMail(object):
+    __slots__ = ('to_address', 'message', 'deferred')
+
+    def __init__(self, to_address, message):
+        self.to_address = to_address
+        self.message = message
+        self.deferred = defer.Deferred()
+
+
+class SMTPPoolSender(ESMTPSender):
+    """
+    ESMTP session delivering the mails queued in a SMTPClientPool
+
+    The session sends the queued mails one after the other on the same
+    authenticated connection and quits when the queue is empty.
+    """
+    mail = None
+    error = None
+    delayedCall = None
+
+    def getMailFrom(self):
+        self.mail = self.factory.pool.get_mail()
+        if self.mail is None:
+            return None
+
+        return str(self.factory.pool.from_address)
+
+    def getMailTo(self):
+        return [self.mail.to_address]
+
+    def getMailData(self):
+        return self.mail.message
+
+    def smtpState_from(self, code, resp):
+        delay = self.factory.pool.get_delay()
+        if delay > 0:
+            # the server timeout does not apply while waiting for the rate limit
+            self.setTimeout(None)
+            self.delayedCall = reactor.callLater(delay, self.resumeSession, code, resp)
+        else:
+            ESMTPSender.smtpState_from(self, code, resp)
+
+    def resumeSession(self, code, resp):
+        self.delayedCall = None
+        self.setTimeout(self.timeout)
+        self.smtpState_from(code, resp)
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        mail, self.mail = self.mail, None
+
+        if code in SUCCESS:
+            self.factory.pool.mail_sent(mail)
+        else:
+            self.factory.pool.mail_failed(mail, SMTPDeliveryError(code, resp, log.str(), addresses))
+
+    def sendError(self, exc):
+        self.error = exc
+        SMTPClient.sendError(self, exc)
+
+    def connectionLost(self, reason=protocol.connectionDone):
+        ESMTPSender.connectionLost(self, reason)
+
+        if self.delayedCall is not None and self.delayedCall.active():
+            self.delayedCall.cancel()
+
+        error = self.error
+        if error is None and self.mail is not None:
+            error = reason.value
+
+        self.factory.pool.session_closed(self.mail, error)
+        self.mail = None
+
+
+class SMTPPoolSenderFactory(protocol.ClientFactory):
+    protocol = SMTPPoolSender
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def buildProtocol(self, addr):
+        p = self.protocol(self.pool.username.encode('utf-8'),
+                          self.pool.password.encode('utf-8'),
+                          self.pool.context_factory,
+                          DNSNAME)
+        p.heloFallback = False
+        p.requireAuthentication = True
+        p.requireTransportSecurity = self.pool.security != 'SSL'
+        p.factory = self
+        p.timeout = self.pool.timeout
+        return p
+
+
+class SMTPClientPool(object):
+    """
+    Pool of the ESMTP sessions toward an SMTP server
+
+    The mails are queued and delivered by up to `concurrency` sessions
+    reusing the same authenticated connection for multiple transactions;
+    `rate_limit` is the maximum number of mails sent per minute (0 for no limit).
+    """
+    timeout = 30
+
+    def __init__(self, tid, username, password, smtp_host, smtp_port, security, from_name, from_address, anonymize=True, socks_host='127.0.0.1', socks_port=9050, concurrency=1, rate_limit=0):
+        self.tid = tid
+        self.username = username
+        self.password = password
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.security = security
+        self.from_name = from_name
+        self.from_address = from_address
+        self.anonymize = anonymize
+        self.socks_host = socks_host
+        self.socks_port = socks_port
+        self.concurrency = max(concurrency, 1)
+        self.rate_limit = rate_limit
+
+        self.context_factory = TLSClientContextFactory()
+
+        self.queue = deque()
+        self.sessions = 0
+        self.next_send_time = 0
+
+    def sendmail(self, to_address, subject, body):
+        """
+        Queue an email for the delivery
+
+        @param to_address: the 'To:' field of the email
+        @param subject: the mail subject
+        @param body: the mail body
+
+        @return: a {Deferred} that returns a success {bool} if the message was passed
+                 to the server.
+        """
+        try:
+            message = MIME_mail_build(self.from_name,
+                                      self.from_address,
+                                      to_address,
+                                      to_address,
+                                      subject,
+                                      body)
+        except Exception as excep:
+            # avoids raising an exception inside email logic to avoid chained errors
+            log.err("Unexpected exception in sendmail: %s", str(excep), tid=self.tid)
+            return defer.succeed(False)
+
+        mail = SMTPMail(to_address, message)
+        self.queue.append(mail)
+
+        if self.sessions < self.concurrency and self.sessions < len(self.queue):
+            self.connect()
+
+        return mail.deferred
+
+    def connect(self):
+        log.debug('Connecting to SMTP server [%s:%d] [%s]',
+                  self.smtp_host,
+                  self.smtp_port,
+                  self.security,
+                  tid=self.tid)
+
+        self.sessions += 1
+
+        try:
+            factory = SMTPPoolSenderFactory(self)
+
+            if self.security == "SSL":
+                factory = tls.TLSMemoryBIOFactory(self.context_factory, True, factory)
+
+            if self.anonymize:
+                socksProxy = TCP4ClientEndpoint(reactor, self.socks_host, self.socks_port, timeout=self.timeout)
+                endpoint = SOCKS5ClientEndpoint(self.smtp_host.encode('utf-8'), self.smtp_port, socksProxy)
+            else:
+                endpoint = TCP4ClientEndpoint(reactor, self.smtp_host.encode('utf-8'), self.smtp_port, timeout=self.timeout)
+
+            d = endpoint.connect(factory)
+        except Exception:
+            d = defer.fail()
+
+        d.addErrback(self.connection_failed)
+
+    def connection_failed(self, failure):
+        log.err("SMTP connection failed (Exception: %s)", failure.value, tid=self.tid)
+        log.debug(failure)
+
+        self.sessions -= 1
+        if not self.sessions:
+            self.fail_queue(failure.value)
+
+    def session_closed(self, mail, error):
+        self.sessions -= 1
+
+        if mail is not None:
+            self.mail_failed(mail, error)
+
+        if self.queue and not self.sessions:
+            if error is None:
+                # the mails have been queued while the session was quitting
+                self.connect()
+            else:
+                self.fail_queue(error)
+
+    def fail_queue(self, error):
+        while self.queue:
+            self.mail_failed(self.queue.popleft(), error)
+
+    def get_mail(self):
+        return self.queue.popleft() if self.queue else None
+
+    def get_delay(self):
+        """
+        Return the seconds to wait before sending the next mail
+        """
+        if not self.rate_limit or not self.queue:
+            return 0
+
+        now = reactor.seconds()
+        if self.next_send_time > now:
+            return self.next_send_time - now
+
+        self.next_send_time = now + 60.0 / self.rate_limit
+        return 0
+
+    def mail_sent(self, mail):
+        log.debug('Sent email to %s using SMTP server [%s:%d] [%s]',
+                  mail.to_address,
+                  self.smtp_host,
+                  self.smtp_port,
+                  self.security,
+                  tid=self.tid)
+
+        mail.deferred.callback(True)
+
+    def mail_failed(self, mail, error):
+        log.err("Failed to send email to %s using SMTP server [%s:%d] (Exception: %s)",
+                mail.to_address,
+                self.smtp_host,
+                self.smtp_port,
+                error,
+                tid=self.tid)
+
+        mail.deferred.callback(False)
+
+
 def sendmail(tid, username, password, smtp_host, smtp_port, security, from_name, from_address, to_address, subject, body, anonymize=True, socks_host='127.0.0.1', socks_port=9050):
     """
     Send an email using SMTPS/SMTP+TLS and maybe torify the connection.
@@ -62,76 +307,10 @@ def sendmail(tid, username, password, smtp_host, smtp_port, security, from_name,
     @return: a {Deferred} that returns a success {bool} if the message was passed
              to the server.
     """
-    try:
-        timeout = 30
-
-        message = MIME_mail_build(from_name,
-                                  from_address,
-                                  to_address,
-                                  to_address,
-                                  subject,
-                                  body)
-
-        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]',
-                  to_address,
-                  smtp_host,
-                  smtp_port,
-                  security,
-                  tid=tid)
-
-        context_factory = TLSClientContextFactory()
-
-        smtp_deferred = defer.Deferred()
-
-        factory = ESMTPSenderFactory(
-            username.encode('utf-8'),
-            password.encode('utf-8'),
-            from_address,
-            to_address,
-            message,
-            smtp_deferred,
-            contextFactory=context_factory,
-            requireAuthentication=True,
-            requireTransportSecurity=(security != 'SSL'),
-            retries=0,
-            timeout=timeout)
-
-        if security == "SSL":
-            factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
-
-        if anonymize:
-            socksProxy = TCP4ClientEndpoint(reactor, socks_host, socks_port, timeout=timeout)
-            endpoint = SOCKS5ClientEndpoint(smtp_host.encode('utf-8'), smtp_port, socksProxy)
-        else:
-            endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=timeout)
-
-        conn_deferred = endpoint.connect(factory)
-
-        final = defer.DeferredList([conn_deferred, smtp_deferred], fireOnOneErrback=True, consumeErrors=True)
-
-        def failure_cb(failure):
-            """
-            @param failure {Failure {twisted.internet.FirstError {Failure}}}
-            """
-            log.err("SMTP connection failed (Exception: %s)", failure.value.subFailure.value, tid=tid)
-            log.debug(failure)
-            return False
-
-        def success_cb(results):
-            """
-            @param results {list of (success, return_val) tuples}
-            """
-            return True
-
-        final.addCallback(success_cb)
-        final.addErrback(failure_cb)
-
-        return final
+    pool = SMTPClientPool(tid, username, password, smtp_host, smtp_port, security,
+                          from_name, from_address, anonymize, socks_host, socks_port)
 
-    except Exception as excep:
-        # avoids raising an exception inside email logic to avoid chained errors
-        log.err("Unexpected exception in sendmail: %s", str(excep), tid=tid)
-        return defer.succeed(False)
+    return pool.sendmail(to_address, subject, body)
 
 
 def mail_exception_handler(etype, value, tback):
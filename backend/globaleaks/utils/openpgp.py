@@ -0,0 +1,572 @@
+# -*- coding: utf-8 -*-
+# Implementation of the subset of OpenPGP (RFC 4880, RFC 6637) needed to
+# encrypt messages and files to a public key without spawning gpg.
+#
+# The keys are expected to be already validated by gpg when they are
+# loaded by the users, so that the signatures of the key are not verified;
+# only the signatures declaring the primary key as issuer are considered.
+import base64
+import binascii
+import hashlib
+import os
+import struct
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, keywrap
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import x25519
+except ImportError:
+    x25519 = None
+
+crypto_backend = default_backend()
+
+PUBKEY_ALGO_RSA = (1, 2)
+PUBKEY_ALGO_ECDH = 18
+
+SYMKEY_ALGO_AES256 = 9
+
+CURVES = {
+    b'\x2a\x86\x48\xce\x3d\x03\x01\x07': ec.SECP256R1,
+    b'\x2b\x81\x04\x00\x22': ec.SECP384R1,
+    b'\x2b\x81\x04\x00\x23': ec.SECP521R1,
+}
+
+CURVE25519_OID = b'\x2b\x06\x01\x04\x01\x97\x55\x01\x05\x01'
+
+KDF_HASHES = {
+    8: hashes.SHA256,
+    9: hashes.SHA384,
+    10: hashes.SHA512,
+}
+
+KEK_SIZES = {
+    7: 16,
+    8: 24,
+    9: 32,
+}
+
+# the size of the partial body chunks in which the data packets are streamed
+PARTIAL_CHUNK_EXP = 16
+PARTIAL_CHUNK_SIZE = 1 << PARTIAL_CHUNK_EXP
+
+
+class OpenPGPError(Exception):
+    pass
+
+
+class UnsupportedKeyError(OpenPGPError):
+    """
+    Raised for the keys whose algorithms are not implemented
+    """
+    pass
+
+
+def byte(n):
+    return struct.pack('B', n)
+
+
+def crc24(data):
+    crc = 0xB704CE
+    for b in bytearray(data):
+        crc ^= b << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+
+    return crc & 0xFFFFFF
+
+
+def dearmor(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    lines = [l.strip() for l in data.splitlines()]
+
+    try:
+        start = next(i for i, l in enumerate(lines) if l.startswith(b'-----BEGIN PGP'))
+    except StopIteration:
+        # binary key
+        return data
+
+    i = start + 1
+    while i < len(lines) and lines[i]:
+        # skip the armor headers
+        i += 1
+
+    body = []
+    for l in lines[i + 1:]:
+        if l.startswith(b'-----END') or l.startswith(b'='):
+            break
+
+        body.append(l)
+
+    return base64.b64decode(b''.join(body))
+
+
+def armor(data, kind=b'MESSAGE'):
+    b64 = base64.b64encode(data)
+
+    lines = [b'-----BEGIN PGP ' + kind + b'-----', b'']
+    lines.extend(b64[i:i + 64] for i in range(0, len(b64), 64))
+    lines.append(b'=' + base64.b64encode(struct.pack('>I', crc24(data))[1:]))
+    lines.append(b'-----END PGP ' + kind + b'-----')
+
+    return b'\n'.join(lines) + b'\n'
+
+
+def read_mpi(data, offset):
+    bits = struct.unpack('>H', bytes(data[offset:offset + 2]))[0]
+    size = (bits + 7) // 8
+    return bytes(data[offset + 2:offset + 2 + size]), offset + 2 + size
+
+
+def bytes_to_int(data):
+    return int(binascii.hexlify(bytes(data)), 16)
+
+
+def int_to_bytes(n, size=None):
+    h = '%x' % n
+    if len(h) % 2:
+        h = '0' + h
+
+    data = binascii.unhexlify(h)
+    if size is not None:
+        data = b'\x00' * (size - len(data)) + data
+
+    return data
+
+
+def mpi(data):
+    data = data.lstrip(b'\x00')
+    bits = (len(data) - 1) * 8 + bytearray(data[:1])[0].bit_length() if data else 0
+    return struct.pack('>H', bits) + data
+
+
+def iter_packets(data):
+    """
+    Iterate over the (tag, body) of the packets of a binary key
+    """
+    data = bytearray(data)
+    offset = 0
+
+    while offset < len(data):
+        ctb = data[offset]
+        if not ctb & 0x80:
+            raise OpenPGPError("Invalid packet header")
+
+        if ctb & 0x40:
+            tag = ctb & 0x3F
+            o1 = data[offset + 1]
+            if o1 < 192:
+                length, offset = o1, offset + 2
+            elif o1 < 224:
+                length, offset = ((o1 - 192) << 8) + data[offset + 2] + 192, offset + 3
+            elif o1 == 255:
+                length, offset = struct.unpack('>I', bytes(data[offset + 2:offset + 6]))[0], offset + 6
+            else:
+                raise OpenPGPError("Unexpected partial length in key")
+        else:
+            tag = (ctb >> 2) & 0x0F
+            length_type = ctb & 0x03
+            if length_type == 0:
+                length, offset = data[offset + 1], offset + 2
+            elif length_type == 1:
+                length, offset = struct.unpack('>H', bytes(data[offset + 1:offset + 3]))[0], offset + 3
+            elif length_type == 2:
+                length, offset = struct.unpack('>I', bytes(data[offset + 1:offset + 5]))[0], offset + 5
+            else:
+                length, offset = len(data) - offset - 1, offset + 1
+
+        yield tag, data[offset:offset + length]
+
+        offset += length
+
+
+def iter_subpackets(subpackets):
+    """
+    Iterate over the (type, value) of the subpackets of a signature
+    """
+    offset = 0
+    while offset < len(subpackets):
+        o1 = subpackets[offset]
+        if o1 < 192:
+            size, offset = o1, offset + 1
+        elif o1 < 255:
+            size, offset = ((o1 - 192) << 8) + subpackets[offset + 1] + 192, offset + 2
+        else:
+            size, offset = struct.unpack('>I', bytes(subpackets[offset + 1:offset + 5]))[0], offset + 5
+
+        yield subpackets[offset] & 0x7F, subpackets[offset + 1:offset + size]
+
+        offset += size
+
+
+def parse_signature_subpackets(body):
+    """
+    Return the creation time, the key expiration and the key flags
+    recorded in the hashed subpackets of a v4 signature and its issuer
+    """
+    info = {'creation': 0, 'expiration': 0, 'flags': None, 'issuer': None, 'issuer_fingerprint': None}
+
+    if body[0] != 4:
+        info['issuer'] = bytes(body[7:15])
+        return body[2], info
+
+    sigtype = body[1]
+    length = struct.unpack('>H', bytes(body[4:6]))[0]
+    hashed = body[6:6 + length]
+
+    offset = 6 + length
+    length = struct.unpack('>H', bytes(body[offset:offset + 2]))[0]
+    unhashed = body[offset + 2:offset + 2 + length]
+
+    for kind, value in iter_subpackets(hashed):
+        if kind == 2:
+            info['creation'] = struct.unpack('>I', bytes(value))[0]
+        elif kind == 9:
+            info['expiration'] = struct.unpack('>I', bytes(value))[0]
+        elif kind == 27 and value:
+            info['flags'] = value[0]
+
+    # the issuer is recorded also in the unhashed subpackets by many implementations
+    for kind, value in list(iter_subpackets(hashed)) + list(iter_subpackets(unhashed)):
+        if kind == 16:
+            info['issuer'] = bytes(value)
+        elif kind == 33 and value and value[0] == 4:
+            info['issuer_fingerprint'] = binascii.hexlify(bytes(value[1:])).decode('ascii').upper()
+
+    return sigtype, info
+
+
+class PublicKey(object):
+    """
+    A primary key or subkey parsed from a public key packet
+    """
+    def __init__(self, body):
+        body = bytearray(body)
+
+        if body[0] != 4:
+            raise UnsupportedKeyError("Unsupported key version %d" % body[0])
+
+        self.creation = struct.unpack('>I', bytes(body[1:5]))[0]
+        self.algo = body[5]
+        self.fingerprint = hashlib.sha1(b'\x99' + struct.pack('>H', len(body)) + bytes(body)).hexdigest().upper()
+        self.keyid = binascii.unhexlify(self.fingerprint[-16:])
+        self.expiration = 0
+        self.flags = None
+        self.revoked = False
+        self.signature_time = -1
+
+        if self.algo in PUBKEY_ALGO_RSA:
+            n, offset = read_mpi(body, 6)
+            e, offset = read_mpi(body, offset)
+            self.rsa_n, self.rsa_e = bytes_to_int(n), bytes_to_int(e)
+        elif self.algo == PUBKEY_ALGO_ECDH:
+            oid_length = body[6]
+            self.curve_oid = bytes(body[7:7 + oid_length])
+            self.point, offset = read_mpi(body, 7 + oid_length)
+            kdf = body[offset + 1:offset + 1 + body[offset]]
+            self.kdf_hash, self.kek_algo = kdf[1], kdf[2]
+
+    def is_issuer(self, info):
+        """
+        Return True if the signature was issued by the key
+        """
+        if info['issuer_fingerprint'] is not None:
+            return info['issuer_fingerprint'] == self.fingerprint
+
+        return info['issuer'] == self.keyid
+
+    def update(self, sigtype, info):
+        if sigtype in (0x20, 0x28):
+            self.revoked = True
+        elif info['creation'] >= self.signature_time:
+            # the most recent self signature is the valid one
+            self.signature_time = info['creation']
+            self.expiration = info['expiration']
+            self.flags = info['flags']
+
+    def is_expired(self, now):
+        return self.expiration != 0 and self.creation + self.expiration < now
+
+    def can_encrypt(self, now):
+        return not self.revoked and \
+               not self.is_expired(now) and \
+               (self.flags is None or self.flags & 0x0C != 0)
+
+    def is_supported(self):
+        if self.algo in PUBKEY_ALGO_RSA:
+            return True
+
+        if self.algo == PUBKEY_ALGO_ECDH:
+            if self.curve_oid == CURVE25519_OID:
+                return x25519 is not None and self.kdf_hash in KDF_HASHES and self.kek_algo in KEK_SIZES
+
+            return self.curve_oid in CURVES and self.kdf_hash in KDF_HASHES and self.kek_algo in KEK_SIZES
+
+        return False
+
+
+class Key(object):
+    """
+    An OpenPGP public key with its subkeys
+    """
+    def __init__(self, data):
+        self.primary = None
+        self.subkeys = []
+
+        current = None
+
+        for tag, body in iter_packets(dearmor(data)):
+            if tag == 6:
+                if self.primary is not None:
+                    # only the first key of the block is considered
+                    break
+
+                self.primary = current = PublicKey(body)
+            elif tag == 14:
+                try:
+                    current = PublicKey(body)
+                except UnsupportedKeyError:
+                    current = None
+                    continue
+
+                self.subkeys.append(current)
+            elif tag == 13:
+                current = self.primary
+            elif tag == 2 and current is not None:
+                sigtype, info = parse_signature_subpackets(body)
+                if not self.primary.is_issuer(info):
+                    # e.g. the certifications of the key by third parties
+                    continue
+
+                if current is self.primary and (0x10 <= sigtype <= 0x13 or sigtype in (0x1F, 0x20)):
+                    current.update(sigtype, info)
+                elif current is not self.primary and sigtype in (0x18, 0x28):
+                    current.update(sigtype, info)
+
+        if self.primary is None:
+            # e.g. a private key block
+            raise UnsupportedKeyError("No public key found")
+
+        self.fingerprint = self.primary.fingerprint
+
+    def get_encryption_key(self, now=None):
+        """
+        Return the key to be used for the encryption
+        """
+        if now is None:
+            now = time.time()
+
+        if self.primary.revoked or self.primary.is_expired(now):
+            raise OpenPGPError("The key is expired or revoked")
+
+        candidates = [k for k in self.subkeys if k.can_encrypt(now)]
+        if not candidates and self.primary.can_encrypt(now):
+            candidates = [self.primary]
+
+        candidates = [k for k in candidates if k.algo in PUBKEY_ALGO_RSA or k.algo == PUBKEY_ALGO_ECDH]
+        if not candidates:
+            raise UnsupportedKeyError("No supported encryption key")
+
+        key = max(candidates, key=lambda k: k.creation)
+        if not key.is_supported():
+            raise UnsupportedKeyError("Unsupported encryption key")
+
+        return key
+
+
+def session_key_material(session_key):
+    checksum = sum(bytearray(session_key)) & 0xFFFF
+    return byte(SYMKEY_ALGO_AES256) + session_key + struct.pack('>H', checksum)
+
+
+def ecdh_kdf(key, shared):
+    param = byte(len(key.curve_oid)) + key.curve_oid + byte(PUBKEY_ALGO_ECDH) + \
+            b'\x03\x01' + byte(key.kdf_hash) + byte(key.kek_algo) + \
+            b'Anonymous Sender    ' + binascii.unhexlify(key.fingerprint)
+
+    h = hashes.Hash(KDF_HASHES[key.kdf_hash](), backend=crypto_backend)
+    h.update(b'\x00\x00\x00\x01' + shared + param)
+
+    return h.finalize()[:KEK_SIZES[key.kek_algo]]
+
+
+def ecdh_encrypt(key, m):
+    if key.curve_oid == CURVE25519_OID:
+        public = x25519.X25519PublicKey.from_public_bytes(key.point[1:])
+        ephemeral = x25519.X25519PrivateKey.generate()
+        shared = ephemeral.exchange(public)
+
+        try:
+            ephemeral_point = ephemeral.public_key().public_bytes(serialization.Encoding.Raw,
+                                                                  serialization.PublicFormat.Raw)
+        except (AttributeError, TypeError):
+            ephemeral_point = ephemeral.public_key().public_bytes()
+
+        ephemeral_point = b'\x40' + ephemeral_point
+    else:
+        curve = CURVES[key.curve_oid]()
+        size = (curve.key_size + 7) // 8
+        x, y = bytes_to_int(key.point[1:1 + size]), bytes_to_int(key.point[1 + size:])
+        public = ec.EllipticCurvePublicNumbers(x, y, curve).public_key(crypto_backend)
+
+        ephemeral = ec.generate_private_key(curve, crypto_backend)
+        shared = ephemeral.exchange(ec.ECDH(), public)
+
+        numbers = ephemeral.public_key().public_numbers()
+        ephemeral_point = b'\x04' + int_to_bytes(numbers.x, size) + int_to_bytes(numbers.y, size)
+
+    # PKCS#5 padding to a multiple of 8 bytes
+    pad = 8 - len(m) % 8
+    m += byte(pad) * pad
+
+    wrapped = keywrap.aes_key_wrap(ecdh_kdf(key, shared), m, crypto_backend)
+
+    return mpi(ephemeral_point) + byte(len(wrapped)) + wrapped
+
+
+def pkesk_packet(key, session_key):
+    """
+    Public-Key Encrypted Session Key packet
+    """
+    m = session_key_material(session_key)
+
+    if key.algo in PUBKEY_ALGO_RSA:
+        public = rsa.RSAPublicNumbers(key.rsa_e, key.rsa_n).public_key(crypto_backend)
+        encrypted = mpi(public.encrypt(m, padding.PKCS1v15()))
+    else:
+        encrypted = ecdh_encrypt(key, m)
+
+    body = b'\x03' + key.keyid + byte(key.algo) + encrypted
+
+    return packet_header(1, len(body)) + body
+
+
+def packet_header(tag, length):
+    if length < 192:
+        return byte(0xC0 | tag) + byte(length)
+    elif length < 8384:
+        length -= 192
+        return byte(0xC0 | tag) + byte((length >> 8) + 192) + byte(length & 0xFF)
+
+    return byte(0xC0 | tag) + b'\xff' + struct.pack('>I', length)
+
+
+class PartialPacketWriter(object):
+    """
+    Writes a packet of unknown length with partial body lengths
+    """
+    def __init__(self, output, tag):
+        self.output = output
+        self.buffer = bytearray()
+        self.header = byte(0xC0 | tag)
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) > PARTIAL_CHUNK_SIZE:
+            self.output.write(self.header + byte(0xE0 | PARTIAL_CHUNK_EXP))
+            self.output.write(bytes(self.buffer[:PARTIAL_CHUNK_SIZE]))
+            del self.buffer[:PARTIAL_CHUNK_SIZE]
+            self.header = b''
+
+    def close(self):
+        length = packet_header(0, len(self.buffer))[1:]
+        self.output.write(self.header + length + bytes(self.buffer))
+
+
+class EncryptedDataWriter(object):
+    """
+    Symmetrically Encrypted Integrity Protected Data packet containing
+    the literal data packet of the plaintext written to it.
+    """
+    def __init__(self, output, session_key):
+        self.packet = PartialPacketWriter(output, 18)
+        self.packet.write(b'\x01')
+
+        self.encryptor = Cipher(algorithms.AES(session_key),
+                                modes.CFB(b'\x00' * 16),
+                                backend=crypto_backend).encryptor()
+
+        self.mdc = hashlib.sha1()
+
+        prefix = os.urandom(16)
+        self.write_encrypted(prefix + prefix[-2:])
+
+        self.literal = PartialPacketWriter(self, 11)
+        self.literal.write(b'b\x00\x00\x00\x00\x00')
+
+    def write_encrypted(self, data):
+        self.mdc.update(data)
+        self.packet.write(self.encryptor.update(data))
+
+    # used by the literal data packet writer
+    write = write_encrypted
+
+    def write_plaintext(self, data):
+        self.literal.write(data)
+
+    def close(self):
+        self.literal.close()
+        self.mdc.update(b'\xd3\x14')
+        self.packet.write(self.encryptor.update(b'\xd3\x14' + self.mdc.digest()))
+        self.packet.write(self.encryptor.finalize())
+        self.packet.close()
+
+
+def encrypt_stream(key, input_file, output, chunk_size=PARTIAL_CHUNK_SIZE):
+    """
+    Encrypt for the key the data read from input_file writing
+    the binary OpenPGP message to output
+    """
+    session_key = os.urandom(32)
+
+    output.write(pkesk_packet(key.get_encryption_key(), session_key))
+
+    writer = EncryptedDataWriter(output, session_key)
+
+    while True:
+        chunk = input_file.read(chunk_size)
+        if not chunk:
+            break
+
+        writer.write_plaintext(chunk)
+
+    writer.close()
+
+
+class BytesOutput(object):
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+
+def encrypt_message(key, plaintext):
+    """
+    Encrypt a message returning it ascii armored
+    """
+    if not isinstance(plaintext, bytes):
+        plaintext = plaintext.encode('utf-8')
+
+    session_key = os.urandom(32)
+
+    output = BytesOutput()
+    output.write(pkesk_packet(key.get_encryption_key(), session_key))
+
+    writer = EncryptedDataWriter(output, session_key)
+    writer.write_plaintext(plaintext)
+    writer.close()
+
+    return armor(output.getvalue())
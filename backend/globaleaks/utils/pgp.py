@@ -2,15 +2,30 @@
 import os
 import shutil
 import tempfile
+import threading
 
+from collections import OrderedDict
 from datetime import datetime
 
 from gnupg import GPG
 
 from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.utils import openpgp
+from globaleaks.utils.security import sha256
 from globaleaks.utils.utility import log
 
 
+def key_digest(key):
+    """
+    Return the digest identifying the material of an armored key
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+
+    return sha256(key)
+
+
 class PGPContext(object):
     """
     PGP does not have a dedicated class, because one of the function is called inside a transact.
@@ -102,3 +117,216 @@ class PGPContext(object):
             shutil.rmtree(self.gnupg.gnupghome)
         except Exception as excep:
             log.err("Unable to clean temporary PGP environment: %s: %s", self.gnupg.gnupghome, excep)
+
+
+class PGPBackend(object):
+    """
+    Interface of the backends used to encrypt with the users keys
+    """
+    def encrypt_file(self, key, input_file, output_path):
+        """
+        Encrypt a file with the specified PGP key
+
+        return the result of the encryption and the size of the encrypted file
+        """
+        raise NotImplementedError
+
+    def encrypt_message(self, key, plaintext):
+        """
+        Encrypt a text message with the specified PGP key
+        """
+        raise NotImplementedError
+
+    def invalidate(self, fingerprint):
+        """
+        Remove a key that is not used anymore or that has been replaced
+        """
+        raise NotImplementedError
+
+
+class PGPKeyring(PGPBackend):
+    """
+    Long-lived gpg keyring shared by all the encryption operations.
+
+    The keys are imported once and indexed by fingerprint together with the
+    digest of the key material so that a new version of a user key is
+    detected and imported; the expired keys are evicted.
+    """
+    def __init__(self):
+        self.context = None
+        self.keys = {}
+        self.digests = {}
+        self.lock = threading.RLock()
+
+    def get_context(self):
+        # the keyring is created again if its directory has been removed
+        # e.g. by the cleaning of the temporary directory
+        with self.lock:
+            if self.context is None or not os.path.exists(self.context.gnupg.gnupghome):
+                self.context = PGPContext(Settings.tmp_path)
+                self.keys.clear()
+                self.digests.clear()
+
+            return self.context
+
+    def get_fingerprint(self, key):
+        """
+        Return the fingerprint of a key importing it if needed
+        """
+        digest = key_digest(key)
+
+        with self.lock:
+            context = self.get_context()
+
+            self.evict_expired()
+
+            fingerprint = self.digests.get(digest)
+            if fingerprint is not None:
+                return fingerprint
+
+            k = context.load_key(key)
+
+            fingerprint = k['fingerprint']
+            if fingerprint in self.keys:
+                # the new version of the key has been merged with the previous one
+                del self.digests[self.keys[fingerprint][0]]
+
+            self.keys[fingerprint] = (digest, k['expiration'])
+            self.digests[digest] = fingerprint
+
+            return fingerprint
+
+    def invalidate(self, fingerprint):
+        with self.lock:
+            if fingerprint not in self.keys:
+                return
+
+            digest, _ = self.keys.pop(fingerprint)
+            del self.digests[digest]
+
+            try:
+                self.context.gnupg.delete_keys(fingerprint)
+            except Exception as excep:
+                log.err("Error in PGP delete_keys: %s", excep)
+
+    def evict_expired(self):
+        now = datetime.utcnow()
+        never = datetime.utcfromtimestamp(0)
+
+        with self.lock:
+            for fingerprint, (_, expiration) in list(self.keys.items()):
+                if never < expiration < now:
+                    self.invalidate(fingerprint)
+
+    def get_context_and_fingerprint(self, key):
+        """
+        Return the keyring together with the fingerprint of a key imported in it
+        """
+        with self.lock:
+            fingerprint = self.get_fingerprint(key)
+            return self.get_context(), fingerprint
+
+    def encrypt_file(self, key, input_file, output_path):
+        context, fingerprint = self.get_context_and_fingerprint(key)
+        return context.encrypt_file(fingerprint, input_file, output_path)
+
+    def encrypt_message(self, key, plaintext):
+        context, fingerprint = self.get_context_and_fingerprint(key)
+        return context.encrypt_message(fingerprint, plaintext)
+
+
+class NativePGPBackend(PGPBackend):
+    """
+    In-process OpenPGP encryption avoiding to spawn gpg for each operation.
+
+    The keys whose algorithms are not implemented, or that are expired, are
+    handled by the fallback backend.  Files are written as binary OpenPGP
+    messages while messages are ascii armored.
+    """
+    # maximum number of parsed keys kept in memory
+    max_keys = 1024
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_key(self, key):
+        """
+        Return the parsed key or None if it has to be handled by the fallback
+        """
+        digest = key_digest(key)
+
+        with self.lock:
+            if digest in self.keys:
+                # reinsert the key in order to mark it as the most recently used
+                k = self.keys.pop(digest)
+            else:
+                # any error in the parsing of the key material is left to gpg
+                try:
+                    k = openpgp.Key(key)
+                except Exception as excep:
+                    log.debug("Unable to parse the PGP key natively: %s", excep)
+                    k = None
+
+                while len(self.keys) >= self.max_keys:
+                    self.keys.popitem(last=False)
+
+            self.keys[digest] = k
+
+        try:
+            if k is not None:
+                k.get_encryption_key()
+        except Exception:
+            return None
+
+        return k
+
+    def encrypt_file(self, key, input_file, output_path):
+        k = self.get_key(key)
+        if k is None:
+            return self.fallback.encrypt_file(key, input_file, output_path)
+
+        with open(output_path, 'wb') as output:
+            openpgp.encrypt_stream(k, input_file, output, Settings.file_chunk_size)
+
+        return None, os.stat(output_path).st_size
+
+    def encrypt_message(self, key, plaintext):
+        k = self.get_key(key)
+        if k is None:
+            return self.fallback.encrypt_message(key, plaintext)
+
+        return openpgp.encrypt_message(k, plaintext)
+
+    def invalidate(self, fingerprint):
+        with self.lock:
+            for digest, k in list(self.keys.items()):
+                if k is not None and k.fingerprint == fingerprint:
+                    del self.keys[digest]
+
+
+class PGPEngine(PGPBackend):
+    """
+    Dispatches the encryption to the backend selected by Settings.pgp_backend
+    """
+    def __init__(self):
+        self.gnupg = PGPKeyring()
+        self.native = NativePGPBackend(self.gnupg)
+
+    def get_backend(self):
+        return self.native if Settings.pgp_backend == 'native' else self.gnupg
+
+    def encrypt_file(self, key, input_file, output_path):
+        return self.get_backend().encrypt_file(key, input_file, output_path)
+
+    def encrypt_message(self, key, plaintext):
+        return self.get_backend().encrypt_message(key, plaintext)
+
+    def invalidate(self, fingerprint):
+        self.gnupg.invalidate(fingerprint)
+        self.native.invalidate(fingerprint)
+
+
+# Keyring is a singleton shared by all the threads
+Keyring = PGPEngine()
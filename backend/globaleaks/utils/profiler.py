@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Opt-in profiler recording, for each API request, the queries executed by its
+# transactions, the time spent waiting for the ORM thread pool and the time
+# spent in the serialization of the answer.
+import heapq
+import threading
+import time
+
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+
+from globaleaks.utils.utility import datetime_to_ISO8601, datetime_now
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+
+    values = sorted(values)
+
+    return values[min(int(len(values) * p / 100.0), len(values) - 1)]
+
+
+class RequestProfile(object):
+    def __init__(self, name, method, path):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.date = datetime_now()
+        self.start = time.time()
+        self.total_time = 0
+        self.queries = []
+        self.sql_time = 0
+        self.queue_wait = 0
+        self.serialization_time = 0
+        self.lock = threading.Lock()
+
+    def add_query(self, statement, duration):
+        with self.lock:
+            self.queries.append((statement, duration))
+            self.sql_time += duration
+
+    def add_queue_wait(self, duration):
+        with self.lock:
+            self.queue_wait += duration
+
+    def serialize(self, with_queries=False):
+        ret = {
+            'handler': self.name,
+            'method': self.method,
+            'path': self.path,
+            'date': datetime_to_ISO8601(self.date),
+            'total_time': self.total_time,
+            'query_count': len(self.queries),
+            'sql_time': self.sql_time,
+            'queue_wait': self.queue_wait,
+            'serialization_time': self.serialization_time
+        }
+
+        if with_queries:
+            ret['queries'] = [{'statement': s, 'time': t} for s, t in self.queries]
+
+        return ret
+
+
+class Profiler(object):
+    """
+    The profile of the request being handled is kept in current while the
+    handler code runs in the reactor thread and it is propagated to the
+    transactions started by the handler and to the callbacks fired by them;
+    inside the ORM threads the profile of the transaction is kept thread local.
+    """
+    metrics = ['total_time', 'query_count', 'sql_time', 'queue_wait', 'serialization_time']
+
+    def __init__(self, samples=1000, slowest=20):
+        self.samples = samples
+        self.slowest_size = slowest
+        self.current = None
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.handlers = {}
+        self.slowest = []
+
+    def install(self):
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def uninstall(self):
+        event.remove(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_start', []).append(time.time())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['profiler_start'].pop()
+
+        profile = getattr(self.local, 'profile', None)
+        if profile is not None:
+            profile.add_query(statement, time.time() - start)
+
+    def start_request(self, handler, method):
+        self.current = RequestProfile(handler.name, method, handler.request.path)
+        return self.current
+
+    def stop_request(self, profile):
+        profile.total_time = time.time() - profile.start
+
+        key = '%s.%s' % (profile.name, profile.method)
+        if key not in self.handlers:
+            self.handlers[key] = {m: deque(maxlen=self.samples) for m in self.metrics}
+
+        for m, value in profile.serialize().items():
+            if m in self.metrics:
+                self.handlers[key][m].append(value)
+
+        if len(self.slowest) < self.slowest_size:
+            heapq.heappush(self.slowest, (profile.total_time, profile))
+        elif profile.total_time > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (profile.total_time, profile))
+
+    def run_transaction(self, thread_pool, function, *args, **kwargs):
+        profile = self.current
+        if profile is None:
+            return deferToThreadPool(reactor, thread_pool, function, *args, **kwargs)
+
+        queued = time.time()
+
+        def wrapper():
+            profile.add_queue_wait(time.time() - queued)
+
+            self.local.profile = profile
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.profile = None
+
+        d = defer.Deferred()
+
+        def fire(result):
+            previous, self.current = self.current, profile
+            try:
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+            finally:
+                self.current = previous
+
+        deferToThreadPool(reactor, thread_pool, wrapper).addBoth(fire)
+
+        return d
+
+    def get_stats(self):
+        handlers = []
+        for key in sorted(self.handlers):
+            stats = {'handler': key, 'count': len(self.handlers[key]['total_time'])}
+            for m in self.metrics:
+                values = self.handlers[key][m]
+                stats[m] = {'p50': percentile(values, 50),
+                            'p90': percentile(values, 90),
+                            'p99': percentile(values, 99),
+                            'max': max(values) if values else 0}
+
+            handlers.append(stats)
+
+        slowest = [profile.serialize(with_queries=True)
+                   for _, profile in sorted(self.slowest, key=lambda x: x[0], reverse=True)]
+
+        return {
+            'handlers': handlers,
+            'slowest': slowest
+        }
@@ -5,7 +5,17 @@ import time
 
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from globaleaks.rest import errors
-from globaleaks.utils.security import crypto_backend, generateRandomKey
+from globaleaks.utils.security import aes_ctr_at, crypto_backend, generateRandomKey
+
+# size of the chunks in which the files are decrypted by the pipeline
+CHUNK_SIZE = 1024 * 1024
+
+try:
+    # Python 2: file.write() supports only the old buffer protocol
+    view = buffer
+except NameError:
+    def view(obj, offset, size):
+        return memoryview(obj)[offset:offset + size]
 
 
 class SecureTemporaryFile(object):
@@ -20,6 +30,7 @@ class SecureTemporaryFile(object):
         self.key_counter_nonce = os.urandom(16)
         self.cipher = Cipher(algorithms.AES(self.key), modes.CTR(self.key_counter_nonce), backend=crypto_backend)
         self.filepath = os.path.join(filesdir, "%s.aes" % self.key_id)
+        self.size = 0
 
     def open(self, mode):
         if self.file is None:
@@ -37,6 +48,27 @@ class SecureTemporaryFile(object):
             data = data.encode('utf-8')
 
         self.file.write(self.encdec.update(data))
+        self.size += len(data)
+
+    def write_at(self, offset, data):
+        """
+        Encrypt data and write it at the given offset of the plaintext.
+
+        The CTR mode allows to seek the keystream and so to write the chunks
+        of an upload in any order.
+        """
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        data = aes_ctr_at(self.key, self.key_counter_nonce, offset).update(data)
+
+        fd = os.open(self.filepath, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
 
     def finalize_write(self):
         self.file.write(self.encdec.finalize())
@@ -52,6 +84,44 @@ class SecureTemporaryFile(object):
 
         return self.encdec.finalize()
 
+    def iter_decrypted(self, chunk_size=CHUNK_SIZE):
+        """
+        Iterate over the decrypted content of the file.
+
+        When supported by the cryptography library the chunks are views on
+        reusable buffers that are valid only until the next iteration.
+        """
+        if not hasattr(self.encdec, 'update_into'):
+            while True:
+                data = self.file.read(chunk_size)
+                if not data:
+                    break
+
+                yield self.encdec.update(data)
+
+            return
+
+        # update_into requires space for an additional block
+        inbuf = bytearray(chunk_size)
+        outbuf = bytearray(chunk_size + 15)
+        inview = memoryview(inbuf)
+
+        while True:
+            n = self.file.readinto(inbuf)
+            if not n:
+                break
+
+            n = self.encdec.update_into(inview[:n], outbuf)
+
+            yield view(outbuf, 0, n)
+
+    def copy_to(self, fileobj, chunk_size=CHUNK_SIZE):
+        """
+        Write the decrypted content of the file to fileobj
+        """
+        for chunk in self.iter_decrypted(chunk_size):
+            fileobj.write(chunk)
+
     def close(self):
         self.file.close()
         self.file = None
@@ -31,6 +31,22 @@ def sha512(data):
     return binascii.b2a_hex(h.finalize())
 
 
+def aes_ctr_at(key, nonce, offset):
+    """
+    Return an AES-CTR context positioned at the given offset of the keystream;
+    with CTR the same context is used to encrypt and to decrypt
+    """
+    counter = (int(binascii.b2a_hex(nonce), 16) + offset // 16) % (1 << 128)
+    nonce = binascii.a2b_hex('%032x' % counter)
+
+    ctx = Cipher(algorithms.AES(key), modes.CTR(nonce), backend=crypto_backend).encryptor()
+
+    # discard the keystream preceding the offset inside the block
+    ctx.update(b'\x00' * (offset % 16))
+
+    return ctx
+
+
 def generateRandomReceipt():
     """
     Return a random receipt of 16 digits
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Content addressed store of the attachments kept in plaintext form.
+#
+# Each blob is encrypted with AES-CTR with a random nonce under a key
+# stored outside of Settings.attachments_path and is named by the HMAC of
+# its plaintext, so that the same content is written on disk only once.
+# The blobs are referenced by the file_path of InternalFile, ReceiverFile
+# and WhistleblowerFile and are removed when no reference is left.
+#
+# A blob returned by a writer is pinned until the reference to it is
+# committed so that the cleaning, which counts the references holding the
+# lock of the store, never removes a blob that is going to be referenced.
+import binascii
+import os
+import threading
+
+from cryptography.hazmat.primitives import hashes, hmac
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.utils.security import aes_ctr_at, crypto_backend, generateRandomKey
+from globaleaks.utils.utility import log
+
+BLOB_SUFFIX = '.blob'
+NONCE_SIZE = 16
+
+
+def derive_key(key, label):
+    h = hmac.HMAC(key, hashes.SHA256(), backend=crypto_backend)
+    h.update(label)
+    return h.finalize()
+
+
+def is_blob(path):
+    return path.endswith(BLOB_SUFFIX)
+
+
+class BlobWriter(object):
+    """
+    Writes a blob to a temporary file moved to its content address on close
+    """
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self.path = None
+
+        encryption_key, mac_key = store.get_keys()
+
+        nonce = os.urandom(NONCE_SIZE)
+        self.encryptor = Cipher(algorithms.AES(encryption_key), modes.CTR(nonce), backend=crypto_backend).encryptor()
+        self.mac = hmac.HMAC(mac_key, hashes.SHA256(), backend=crypto_backend)
+
+        self.tmp_path = os.path.join(Settings.attachments_path, "blob-%s.tmp" % generateRandomKey(16))
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(nonce)
+
+    def write(self, data):
+        data = bytes(data)
+        self.mac.update(data)
+        self.file.write(self.encryptor.update(data))
+        self.size += len(data)
+
+    def close(self):
+        """
+        Return the path of the blob; the blob is pinned until Storage.unpin() is called
+        """
+        self.file.write(self.encryptor.finalize())
+        self.file.close()
+
+        self.path = os.path.join(Settings.attachments_path, binascii.b2a_hex(self.mac.finalize()) + BLOB_SUFFIX)
+
+        with self.store.lock:
+            self.store.pins[self.path] = self.store.pins.get(self.path, 0) + 1
+
+            if os.path.exists(self.path):
+                log.debug("Deduplicated attachment %s", self.path)
+                os.remove(self.tmp_path)
+            else:
+                os.rename(self.tmp_path, self.path)
+
+        return self.path
+
+    def abort(self):
+        self.file.close()
+
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class BlobReader(object):
+    """
+    File-like object returning the plaintext of a blob
+    """
+    def __init__(self, store, path):
+        self.key, _ = store.get_keys()
+
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size - NONCE_SIZE
+
+        self.nonce = self.file.read(NONCE_SIZE)
+        self.decryptor = Cipher(algorithms.AES(self.key), modes.CTR(self.nonce), backend=crypto_backend).decryptor()
+
+    def read(self, size=-1):
+        return self.decryptor.update(self.file.read(size))
+
+    def seek(self, offset):
+        self.file.seek(NONCE_SIZE + offset)
+        self.decryptor = aes_ctr_at(self.key, self.nonce, offset)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AttachmentStore(object):
+    def __init__(self):
+        self.keys = {}
+        self.pins = {}
+        self.lock = threading.Lock()
+
+    def get_key_path(self):
+        return os.path.join(Settings.working_path, 'attachments.key')
+
+    def get_keys(self):
+        """
+        Return the encryption and the hashing keys, generating the master key if no blob exists yet
+        """
+        key_path = self.get_key_path()
+
+        with self.lock:
+            if not os.path.exists(key_path):
+                # a new key would make all the existing blobs unreadable
+                if any(is_blob(f) for f in os.listdir(Settings.attachments_path)):
+                    raise errors.InternalServerError("Missing key of the attachments storage %s" % key_path)
+
+                fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(os.urandom(32))
+
+                self.keys.pop(key_path, None)
+
+            if key_path not in self.keys:
+                with open(key_path, 'rb') as f:
+                    key = f.read()
+
+                self.keys[key_path] = (derive_key(key, b'encryption'), derive_key(key, b'hashing'))
+
+            return self.keys[key_path]
+
+    def writer(self):
+        return BlobWriter(self)
+
+    def unpin(self, path):
+        """
+        Release a blob returned by a writer once the reference to it is committed
+        """
+        with self.lock:
+            count = self.pins.get(path, 0) - 1
+            if count > 0:
+                self.pins[path] = count
+            else:
+                self.pins.pop(path, None)
+
+    def remove_unreferenced(self, path, count_references, remove):
+        """
+        Remove a blob unless it is pinned or referenced
+
+        @param count_references: the function returning the references to the blob
+        @param remove: the function removing the blob
+        @return: True if removed, False if referenced and None if pinned
+        """
+        with self.lock:
+            if path in self.pins:
+                return None
+
+            if count_references(path):
+                return False
+
+            remove(path)
+
+            return True
+
+    def open(self, path):
+        """
+        Open a file for reading decrypting it if it is a blob
+        """
+        if is_blob(path):
+            return BlobReader(self, path)
+
+        return open(path, 'rb')
+
+
+# Storage is a singleton shared by all the threads
+Storage = AttachmentStore()
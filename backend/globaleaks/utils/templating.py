@@ -50,6 +50,13 @@ file_keywords = [
     '{FileSize}'
 ]
 
+digest_keywords = [
+    '{EventCount}',
+    '{EventList}',
+    '{TorUrl}',
+    '{HTTPSUrl}'
+]
+
 export_message_keywords = [
     '{Content}'
 ]
@@ -121,6 +128,13 @@ class Keyword(object):
 
         self.data = data
 
+    @classmethod
+    def get_keyword_set(cls):
+        if '_keyword_set' not in cls.__dict__:
+            cls._keyword_set = frozenset(cls.keyword_list)
+
+        return cls._keyword_set
+
 
 class NodeKeyword(Keyword):
     keyword_list = node_keywords
@@ -340,6 +354,37 @@ class FileKeyword(TipKeyword):
         return str(self.data['file']['size'])
 
 
+class DigestKeyword(UserNodeKeyword):
+    keyword_list = UserNodeKeyword.keyword_list + digest_keywords
+    data_keys =  UserNodeKeyword.data_keys + ['events']
+
+    def EventCount(self):
+        return str(len(self.data['events']))
+
+    def EventList(self):
+        ret = []
+
+        for event in self.data['events']:
+            # each event is summarized using the subject of its own notification
+            event = dict(event, node=self.data['node'], notification=self.data['notification'])
+
+            line = '{TipNum} '
+            if event['tip']['label']:
+                line += '[{TipLabel}] '
+
+            line += self.data['notification'][event['type'] + '_mail_title'] + ' - {EventTime}'
+
+            ret.append(indent(1) + Templating().format_template(line, event))
+
+        return '\n'.join(ret)
+
+    def _TorUrl(self):
+        return 'http://' + self.data['node']['onionservice'] + '/#/receiver/tips'
+
+    def _HTTPSUrl(self):
+        return 'https://' + self.data['node']['hostname'] + '/#/receiver/tips'
+
+
 class ExportMessageKeyword(TipKeyword):
     keyword_list = TipKeyword.keyword_list + export_message_keywords
     data_keys =  TipKeyword.data_keys + ['message']
@@ -484,6 +529,7 @@ supported_template_types = {
     u'comment': CommentKeyword,
     u'message': MessageKeyword,
     u'file': FileKeyword,
+    u'digest': DigestKeyword,
     u'tip_expiration_summary': ExpirationSummaryKeyword,
     u'pgp_alert': PGPAlertKeyword,
     u'admin_pgp_alert': AdminPGPAlertKeyword,
@@ -499,33 +545,66 @@ supported_template_types = {
 }
 
 
+# matches the {Keyword} tokens; the odd items of the split are the tokens
+TOKEN_REGEXP = re.compile(r'(\{[A-Za-z]+\})')
+
+# the templates are cached by content so that the edits of the templates
+# do not need any invalidation; the cache is flushed if it grows too much
+MAX_COMPILED_TEMPLATES = 1024
+
+compiled_templates = {}
+
+
+def compile_template(raw_template):
+    """
+    Parse a template into the list of its literal texts alternated to its tokens
+    """
+    tokens = compiled_templates.get(raw_template)
+    if tokens is None:
+        if len(compiled_templates) >= MAX_COMPILED_TEMPLATES:
+            compiled_templates.clear()
+
+        tokens = compiled_templates[raw_template] = TOKEN_REGEXP.split(raw_template)
+
+    return tokens
+
+
 class Templating(object):
-    def format_template(self, raw_template, data):
-        keyword_converter = supported_template_types[data['type']](data)
-        for _ in range(3):
-            count = 0
+    def render(self, tokens, keyword_converter, values, depth=0):
+        keywords = keyword_converter.get_keyword_set()
+
+        output = []
+        for i, token in enumerate(tokens):
+            if i % 2 == 0 or token not in keywords:
+                output.append(token)
+                continue
 
-            for kw in keyword_converter.keyword_list:
-                if raw_template.count(kw):
-                    # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
-                    variable_content = getattr(keyword_converter, kw[1:-1])()
-                    raw_template = raw_template.replace(kw, variable_content)
+            # the keywords are resolved only if present and only once
+            if token not in values:
+                value = getattr(keyword_converter, token[1:-1])()
 
-                    count += 1
+                # the content of a keyword could include other keywords
+                if depth < 2 and '{' in value:
+                    value = self.render(TOKEN_REGEXP.split(value), keyword_converter, values, depth + 1)
 
-            # remobe lines with only {Blank}
-            raw_template = raw_template.replace('\n{Blank}\n', '\n')
+                values[token] = value
+
+            output.append(values[token])
+
+        return ''.join(output)
+
+    def format_template(self, raw_template, data):
+        keyword_converter = supported_template_types[data['type']](data)
 
-            # remove remaining $Blank% tokens
-            raw_template = raw_template.replace('\n{Blank}', '')
+        raw_template = self.render(compile_template(raw_template), keyword_converter, {})
 
-            raw_template = raw_template.rstrip()
+        # remove lines with only {Blank}
+        raw_template = raw_template.replace('\n{Blank}\n', '\n')
 
-            if count == 0:
-                # finally!
-                break
+        # remove remaining {Blank} tokens
+        raw_template = raw_template.replace('\n{Blank}', '')
 
-        return raw_template
+        return raw_template.rstrip()
 
     def get_mail_subject_and_body(self, data):
         subject_template = ''
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+# Sessions of the chunked uploads performed by flow.js.
+#
+# The chunks are written at their offset in the encrypted temporary file
+# as soon as they are received so that they can be uploaded in parallel,
+# in any order, and retried after a connection drop.
+#
+# The bodies of the upload requests are parsed while they are received and
+# the uploaded chunks are encrypted straight into temporary files, so that
+# the memory used by an upload does not depend on the size of the chunks.
+import cgi
+from io import BytesIO
+
+from twisted.web import http, server
+
+from globaleaks.rest import errors
+from globaleaks.settings import Settings
+from globaleaks.utils.securetempfile import SecureTemporaryFile
+from globaleaks.utils.utility import log
+
+# maximum size of the headers and of the value of a form field
+MAX_HEADERS_SIZE = 8 * 1024
+MAX_FIELD_SIZE = 64 * 1024
+
+
+def get_chunk_size(data):
+    if isinstance(data, SecureTemporaryFile):
+        return data.size
+
+    return len(data)
+
+
+class UploadSession(object):
+    expireCall = None
+
+    def __init__(self, filesdir, total_size, chunk_size, total_chunks):
+        if total_size < 0 or chunk_size <= 0 or total_chunks <= 0 or \
+           (total_chunks - 1) * chunk_size > total_size:
+            raise errors.InputValidationError("Invalid upload parameters")
+
+        self.file = SecureTemporaryFile(filesdir)
+        self.filepath = self.file.filepath
+        self.total_size = total_size
+        self.chunk_size = chunk_size
+        self.total_chunks = total_chunks
+        self.chunks = set()
+
+    def match(self, total_size, chunk_size, total_chunks):
+        return self.total_size == total_size and \
+               self.chunk_size == chunk_size and \
+               self.total_chunks == total_chunks
+
+    def has_chunk(self, number):
+        return number in self.chunks
+
+    def write_chunk(self, number, data):
+        """
+        Write the chunk at its offset; the last chunk extends to the end of the file
+
+        @param data: the chunk as a string or as a SecureTemporaryFile
+        """
+        if number < 1 or number > self.total_chunks:
+            raise errors.InputValidationError("Invalid chunk number")
+
+        offset = (number - 1) * self.chunk_size
+
+        if number < self.total_chunks:
+            expected = self.chunk_size
+        else:
+            expected = self.total_size - offset
+
+        if get_chunk_size(data) != expected:
+            raise errors.InputValidationError("Invalid chunk size")
+
+        if number in self.chunks:
+            return
+
+        if isinstance(data, SecureTemporaryFile):
+            with data.open('r') as f:
+                for block in f.iter_decrypted():
+                    block = bytes(block)
+                    self.file.write_at(offset, block)
+                    offset += len(block)
+        else:
+            self.file.write_at(offset, data)
+
+        self.chunks.add(number)
+
+    def is_complete(self):
+        return len(self.chunks) == self.total_chunks
+
+
+class MultipartParser(object):
+    """
+    Incremental parser of multipart/form-data bodies
+
+    The values of the fields are collected in memory up to MAX_FIELD_SIZE
+    while the files are written to SecureTemporaryFile instances.
+    """
+    def __init__(self, boundary, filesdir):
+        self.delimiter = b'--' + boundary
+        self.filesdir = filesdir
+        self.args = {}
+        self.buf = b''
+        self.state = 'preamble'
+        self.part = None
+        self.error = None
+
+    def feed(self, data):
+        if self.error is not None or self.state == 'end':
+            return
+
+        self.buf += data
+
+        try:
+            while self.parse():
+                pass
+        except errors.InputValidationError as e:
+            self.error = e
+            self.buf = b''
+            self.abort_part()
+
+    def parse(self):
+        """
+        Consume the buffer; return True while progress can be made
+        """
+        if self.state == 'preamble':
+            i = self.buf.find(self.delimiter)
+            if i == -1:
+                self.buf = self.buf[-len(self.delimiter) + 1:]
+                return False
+
+            self.buf = self.buf[i:]
+            self.state = 'delimiter'
+            return True
+
+        if self.state == 'delimiter':
+            n = len(self.delimiter) + 2
+            if len(self.buf) < n:
+                return False
+
+            suffix = self.buf[len(self.delimiter):n]
+            self.buf = self.buf[n:]
+
+            if suffix == b'--':
+                self.state = 'end'
+                self.buf = b''
+                return False
+
+            if suffix != b'\r\n':
+                raise errors.InputValidationError("Invalid multipart body")
+
+            self.state = 'headers'
+            return True
+
+        if self.state == 'headers':
+            # the headers are terminated by an empty line
+            i = (b'\r\n' + self.buf).find(b'\r\n\r\n')
+            if i == -1:
+                if len(self.buf) > MAX_HEADERS_SIZE:
+                    raise errors.InputValidationError("Invalid multipart body")
+
+                return False
+
+            headers = self.buf[:max(i - 2, 0)]
+            self.buf = self.buf[i + 2:]
+            self.start_part(headers)
+            self.state = 'body'
+            return True
+
+        if self.state == 'body':
+            i = self.buf.find(b'\r\n' + self.delimiter)
+            if i == -1:
+                # keep what could be the beginning of the delimiter
+                n = len(self.buf) - len(self.delimiter) - 1
+                if n > 0:
+                    self.write_part(self.buf[:n])
+                    self.buf = self.buf[n:]
+
+                return False
+
+            self.write_part(self.buf[:i])
+            self.buf = self.buf[i + 2:]
+            self.end_part()
+            self.state = 'delimiter'
+            return True
+
+        return False
+
+    def start_part(self, headers):
+        name, filename = None, None
+
+        for line in headers.split(b'\r\n'):
+            key, _, value = line.partition(b':')
+            if key.strip().lower() == b'content-disposition':
+                _, params = cgi.parse_header(value.strip())
+                name = params.get('name')
+                filename = params.get('filename')
+
+        if name is None:
+            raise errors.InputValidationError("Invalid multipart body")
+
+        if filename is not None:
+            body = SecureTemporaryFile(self.filesdir).open('w')
+        else:
+            body = BytesIO()
+
+        self.part = (name, body)
+
+    def write_part(self, data):
+        _, body = self.part
+
+        if isinstance(body, BytesIO) and body.tell() + len(data) > MAX_FIELD_SIZE:
+            raise errors.InputValidationError("Form field too long")
+
+        body.write(data)
+
+    def end_part(self):
+        name, body = self.part
+        self.part = None
+
+        if isinstance(body, SecureTemporaryFile):
+            body.finalize_write()
+            body.close()
+        else:
+            body = body.getvalue()
+
+        self.args.setdefault(name, []).append(body)
+
+    def abort_part(self):
+        if self.part is not None and isinstance(self.part[1], SecureTemporaryFile):
+            self.part[1].close()
+
+        self.part = None
+
+    def close(self):
+        """
+        Return the parsed arguments
+        """
+        if self.error is None and self.state != 'end':
+            self.error = errors.InputValidationError("Truncated multipart body")
+            self.abort_part()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.args
+
+
+class UploadRequest(server.Request):
+    """
+    Request parsing the body of the uploads while it is received
+    """
+    multipart = None
+
+    def __init__(self, *args, **kwargs):
+        server.Request.__init__(self, *args, **kwargs)
+        # read by the log formatter also for the requests rejected before being rendered
+        self.tid = None
+
+    def is_upload(self):
+        command = getattr(self.channel, '_command', None)
+        path = getattr(self.channel, '_path', None)
+        site = getattr(self.channel, 'site', None)
+
+        if command != b'POST' or path is None or site is None:
+            return False
+
+        is_upload_path = getattr(site.resource, 'is_upload_path', None)
+
+        return is_upload_path is not None and is_upload_path(path.split(b'?', 1)[0])
+
+    def gotLength(self, length):
+        ctype = self.requestHeaders.getRawHeaders(b'content-type')
+
+        if ctype is not None and self.is_upload():
+            key, pdict = cgi.parse_header(ctype[0])
+            if key == b'multipart/form-data' and pdict.get('boundary'):
+                self.multipart = MultipartParser(pdict['boundary'], Settings.tmp_path)
+                # the body is not accumulated; the empty content is parsed to no arguments
+                self.content = BytesIO()
+                return
+
+        server.Request.gotLength(self, length)
+
+    def handleContentChunk(self, data):
+        if self.multipart is not None:
+            self.multipart.feed(data)
+        else:
+            server.Request.handleContentChunk(self, data)
+
+    def process(self):
+        if self.multipart is not None:
+            try:
+                self.args.update(self.multipart.close())
+            except errors.InputValidationError as e:
+                log.debug("Rejected upload: %s", e.reason)
+                self.setResponseCode(http.BAD_REQUEST)
+                self.finish()
+                return
+
+        server.Request.process(self)
@@ -6,6 +6,10 @@
 # ZipStream Utility is derived from https://github.com/SpiderOak/ZipStream
 # that is initially derived from zipfile.py and then changed heavily for
 # our purpose (that's the reason why is not in third party)
+#
+# The archive is described as a sequence of ZipChunk; the compression of
+# the chunks of data is independent so that it could be performed in
+# parallel by the consumer while the chunks are processed in order.
 
 import binascii
 import os
@@ -19,60 +23,60 @@ except ImportError:
 
 __all__ = ["ZIP_STORED", "ZIP_DEFLATED", "ZipStream"]
 
-ZIP64_LIMIT= (1 << 31) - 1
+# the values exceeding the limit are stored with the Zip64 extension;
+# the limit is the one of the signed fields used by some implementations
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
 
 # constants for Zip file compression methods
 ZIP_STORED = 0
 ZIP_DEFLATED = 8
 # Other ZIP compression methods not supported
 
+# the files of these types are already compressed and are stored as they are
+STORED_EXTENSIONS = frozenset([
+    '7z', 'apk', 'avi', 'bz2', 'docx', 'epub', 'flac', 'gif', 'gpg', 'gz',
+    'jar', 'jpeg', 'jpg', 'm4a', 'm4v', 'mkv', 'mov', 'mp3', 'mp4', 'odp',
+    'ods', 'odt', 'ogg', 'pgp', 'png', 'pptx', 'rar', 'tgz', 'webm', 'webp',
+    'xlsx', 'xz', 'zip'
+])
+
 # Here are some struct module formats for reading headers
-structEndArchive = "<4s4H2lH"     # 9 items, end of archive, 22 bytes
+structEndArchive = "<4s4H2LH"     # 9 items, end of archive, 22 bytes
 stringEndArchive = "PK\005\006"   # magic number for end of archive record
-structCentralDir = "<4s4B4HlLL5HLl"# 19 items, central directory, 46 bytes
+structCentralDir = "<4s4B4HL2L5H2L"# 19 items, central directory, 46 bytes
 stringCentralDir = "PK\001\002"   # magic number for central directory
-structFileHeader = "<4s2B4HlLL2H"  # 12 items, file header record, 30 bytes
+structFileHeader = "<4s2B4HL2L2H"  # 12 items, file header record, 30 bytes
 stringFileHeader = "PK\003\004"   # magic number for file header
-structEndArchive64Locator = "<4slql" # 4 items, locate Zip64 header, 20 bytes
+structEndArchive64Locator = "<4sLQL" # 4 items, locate Zip64 header, 20 bytes
 stringEndArchive64Locator = "PK\x06\x07" # magic token for locator header
-structEndArchive64 = "<4sqhhllqqqq" # 10 items, end of archive (Zip64), 56 bytes
+structEndArchive64 = "<4sQ2H2L4Q" # 10 items, end of archive (Zip64), 56 bytes
 stringEndArchive64 = "PK\x06\x06" # magic token for Zip64 header
 stringDataDescriptor = "PK\x07\x08" # magic number for data descriptor
 
-# indexes of entries in the central directory structure
-_CD_SIGNATURE = 0
-_CD_CREATE_VERSION = 1
-_CD_CREATE_SYSTEM = 2
-_CD_EXTRACT_VERSION = 3
-_CD_EXTRACT_SYSTEM = 4
-_CD_FLAG_BITS = 5
-_CD_COMPRESS_TYPE = 6
-_CD_TIME = 7
-_CD_DATE = 8
-_CD_CRC = 9
-_CD_COMPRESSED_SIZE = 10
-_CD_UNCOMPRESSED_SIZE = 11
-_CD_FILENAME_LENGTH = 12
-_CD_EXTRA_FIELD_LENGTH = 13
-_CD_COMMENT_LENGTH = 14
-_CD_DISK_NUMBER_START = 15
-_CD_INTERNAL_FILE_ATTRIBUTES = 16
-_CD_EXTERNAL_FILE_ATTRIBUTES = 17
-_CD_LOCAL_HEADER_OFFSET = 18
-
-# indexes of entries in the local file header structure
-_FH_SIGNATURE = 0
-_FH_EXTRACT_VERSION = 1
-_FH_EXTRACT_SYSTEM = 2
-_FH_GENERAL_PURPOSE_FLAG_BITS = 3
-_FH_COMPRESSION_METHOD = 4
-_FH_LAST_MOD_TIME = 5
-_FH_LAST_MOD_DATE = 6
-_FH_CRC = 7
-_FH_COMPRESSED_SIZE = 8
-_FH_UNCOMPRESSED_SIZE = 9
-_FH_FILENAME_LENGTH = 10
-_FH_EXTRA_FIELD_LENGTH = 11
+
+def get_compression(filename, compression):
+    """
+    Return the compression method to be used for a file
+    """
+    if compression == ZIP_DEFLATED:
+        ext = os.path.splitext(filename)[1][1:].lower()
+        if ext in STORED_EXTENSIONS:
+            return ZIP_STORED
+
+    return compression
+
+
+def compress_chunk(data, last):
+    """
+    Compress a chunk of data as a piece of a raw deflate stream.
+
+    The pieces not being the last are terminated by a sync flush so that
+    the concatenation of the pieces compressed independently is a valid
+    deflate stream.
+    """
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return cmpr.compress(data) + cmpr.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
 
 
 class ZipInfo(object):
@@ -97,6 +101,11 @@ class ZipInfo(object):
             'CRC',
             'compress_size',
             'file_size',
+            'zip64',
+            'path',
+            'data',
+            'expected_file_size',
+            'expected_compress_size'
         )
 
     def __init__(self, filename="NoName", date_time=(1980,1,1,0,0,0), compression=ZIP_DEFLATED):
@@ -139,13 +148,19 @@ class ZipInfo(object):
         self.volume = 0                  # Volume number of file header
         self.internal_attr = 0           # Internal attributes
 
-        self.external_attr = 0600 << 16  # Security: Forced File Attributes
+        self.external_attr = 0o600 << 16 # Security: Forced File Attributes
 
-        # Other attributes set by class ZipFile:
+        # Other attributes set by class ZipStream:
         self.header_offset = 0           # Byte offset to the file header
         self.CRC = 0
         self.compress_size = 0
         self.file_size = 0
+        self.zip64 = False               # The sizes are stored with the Zip64 extension
+
+        self.path = None                 # The path of the file
+        self.data = None                 # The compressed data of a buffer
+        self.expected_file_size = None
+        self.expected_compress_size = None
 
     def _encodeFilenameFlags(self):
         if isinstance(self.filename, unicode):
@@ -156,51 +171,110 @@ class ZipInfo(object):
         else:
             return self.filename, self.flag_bits
 
+    def _dosDateTime(self):
+        dt = self.date_time
+        dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+        dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
+        return dosdate, dostime
+
     def DataDescriptor(self):
-        if self.compress_size > ZIP64_LIMIT or self.file_size > ZIP64_LIMIT:
-            fmt = "<4slQQ"
+        if self.zip64:
+            fmt = "<4sLQQ"
         else:
-            fmt = "<4slLL"
+            fmt = "<4sLLL"
         return struct.pack(fmt, stringDataDescriptor, self.CRC, self.compress_size, self.file_size)
 
     def FileHeader(self):
         """Return the per-file header as a string."""
-        dt = self.date_time
-        dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
-        dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
-        if self.flag_bits & 0x08:
-            # Set these to zero because we write them after the file data
-            CRC = compress_size = file_size = 0
-        else:
-            CRC = self.CRC
-            compress_size = self.compress_size
-            file_size = self.file_size
+        dosdate, dostime = self._dosDateTime()
+
+        # The CRC and the sizes are written after the file data
+        CRC = compress_size = file_size = 0
 
         extra = self.extra
+        extract_version = self.extract_version
 
-        if file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
-            # File is larger than what fits into a 4 byte integer,
+        if self.zip64:
+            # The sizes do not fit into a 4 byte integer,
             # fall back to the ZIP64 extension
-            fmt = '<hhqq'
-            extra = extra + struct.pack(fmt,
-                    1, struct.calcsize(fmt)-4, file_size, compress_size)
-            file_size = 0xffffffff # -1
-            compress_size = 0xffffffff # -1
-            self.extract_version = max(45, self.extract_version)
-            self.create_version = max(45, self.extract_version)
+            extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size) + extra
+            file_size = compress_size = 0xffffffff
+            extract_version = max(45, extract_version)
 
         filename, flag_bits = self._encodeFilenameFlags()
 
         header = struct.pack(structFileHeader, stringFileHeader,
-                 self.extract_version, self.reserved, flag_bits,
+                 extract_version, self.reserved, flag_bits,
                  self.compress_type, dostime, dosdate, CRC,
                  compress_size, file_size,
                  len(filename), len(extra))
 
         return header + filename + extra
 
+    def CentralDirectory(self):
+        """Return the central directory record of the file as a string."""
+        dosdate, dostime = self._dosDateTime()
+
+        extra = []
+        if self.zip64:
+            extra.append(self.file_size)
+            extra.append(self.compress_size)
+            file_size = compress_size = 0xffffffff
+        else:
+            file_size = self.file_size
+            compress_size = self.compress_size
+
+        if self.header_offset > ZIP64_LIMIT:
+            extra.append(self.header_offset)
+            header_offset = 0xffffffff
+        else:
+            header_offset = self.header_offset
+
+        extra_data = self.extra
+        if extra:
+            # Append a ZIP64 field to the extra's
+            extra_data = struct.pack('<HH' + 'Q'*len(extra), 1, 8*len(extra), *extra) + extra_data
+            extract_version = max(45, self.extract_version)
+            create_version = max(45, self.create_version)
+        else:
+            extract_version = self.extract_version
+            create_version = self.create_version
+
+        filename, flag_bits = self._encodeFilenameFlags()
+
+        centdir = struct.pack(structCentralDir,
+                              stringCentralDir, create_version,
+                              self.create_system, extract_version, self.reserved,
+                              flag_bits, self.compress_type, dostime, dosdate,
+                              self.CRC, compress_size, file_size,
+                              len(filename), len(extra_data), len(self.comment),
+                              0, self.internal_attr, self.external_attr,
+                              header_offset)
+
+        return centdir + filename + extra_data + self.comment
+
+
+class ZipChunk(object):
+    """
+    Piece of the archive
+
+    The data of the chunk is the result of fn(*args), a function that could
+    be executed in a worker thread, and is then passed to process() in the
+    order of the archive; the chunks without fn need no computation.
+    """
+    __slots__ = ('fn', 'args', 'process')
+
+    def __init__(self, process, fn=None, *args):
+        self.process = process
+        self.fn = fn
+        self.args = args
+
+    def run(self):
+        return self.fn(*self.args) if self.fn is not None else None
+
+
 class ZipStream(object):
-    def __init__(self, files, compression=ZIP_DEFLATED):
+    def __init__(self, files, compression=ZIP_DEFLATED, chunk_size=1024 * 8, open_file=None):
         if compression == ZIP_STORED:
             pass
         elif compression == ZIP_DEFLATED:
@@ -209,30 +283,107 @@ class ZipStream(object):
         else:
             raise RuntimeError("That compression method is not supported")
 
-        self.files = files
         self.compression = compression
+        self.chunk_size = chunk_size
+        self.open_file = open_file if open_file is not None else lambda path: open(path, "rb")
 
         self.filelist = []              # List of ZipInfo instances for archive
         self.data_ptr = 0               # Keep track of location inside archive
 
         self.time = time.gmtime()[0:6]  # Security: Forced Time
 
-
-    def __iter__(self):
-        for f in self.files:
+        self.entries = []
+        for f in files:
             if 'path' in f:
-                try:
-                    for data in self.zip_file(f['path'], f['name']):
-                        yield data
-                except (OSError, IOError):
-                    pass
-
+                zinfo = self.prepare_file(f['path'], f['name'])
             elif 'buf' in f:
-                for data in self.zip_buf(f['buf'], f['name']):
-                    yield data
+                zinfo = self.prepare_buf(f['buf'], f['name'])
+            else:
+                zinfo = None
 
-        yield self.archive_footer()
+            if zinfo is not None:
+                self.entries.append(zinfo)
+
+    def prepare_file(self, path, arcname):
+        """
+        Return the ZipInfo of a file or None if the file is not accessible
+        """
+        try:
+            with self.open_file(path) as fp:
+                size = getattr(fp, 'size', None)
+                if size is None:
+                    size = os.fstat(fp.fileno()).st_size
+        except (OSError, IOError):
+            return None
+
+        zinfo = ZipInfo(arcname, self.time, get_compression(arcname, self.compression))
+        zinfo.path = path
+        zinfo.expected_file_size = size
+
+        if zinfo.compress_type == ZIP_STORED:
+            zinfo.expected_compress_size = size
+
+        # the margin accounts for the overhead of the deflate format
+        zinfo.zip64 = size + (size >> 8) + 1024 > ZIP64_LIMIT
+
+        return zinfo
+
+    def prepare_buf(self, filebuf, arcname):
+        """
+        Return the ZipInfo of a buffer that is compressed immediately
+        """
+        if isinstance(filebuf, unicode):
+            filebuf = filebuf.encode('utf-8')
+
+        zinfo = ZipInfo(arcname, self.time, self.compression)
+        zinfo.file_size = len(filebuf)
+        zinfo.CRC = binascii.crc32(filebuf) & 0xffffffff
+
+        if zinfo.compress_type == ZIP_DEFLATED:
+            zinfo.data = compress_chunk(filebuf, True)
+        else:
+            zinfo.data = filebuf
 
+        zinfo.expected_file_size = zinfo.file_size
+        zinfo.expected_compress_size = len(zinfo.data)
+        zinfo.zip64 = len(zinfo.data) > ZIP64_LIMIT or zinfo.file_size > ZIP64_LIMIT
+
+        return zinfo
+
+    def get_size(self):
+        """
+        Return the size of the archive or None if it depends on the compression
+        """
+        if any(zinfo.expected_compress_size is None for zinfo in self.entries):
+            return None
+
+        size = 0
+        central_directory_size = 0
+        for zinfo in self.entries:
+            zinfo.header_offset = size
+            zinfo.compress_size = zinfo.expected_compress_size
+            zinfo.file_size = zinfo.expected_file_size
+
+            size += len(zinfo.FileHeader()) + zinfo.compress_size + len(zinfo.DataDescriptor())
+            central_directory_size += len(zinfo.CentralDirectory())
+
+        return size + central_directory_size + len(self.end_records(len(self.entries), size, central_directory_size))
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            data = chunk.process(chunk.run())
+            if data:
+                yield data
+
+    def iter_chunks(self):
+        """
+        Iterate over the chunks of the archive
+        """
+        for zinfo in self.entries:
+            for chunk in self.zip_entry(zinfo):
+                yield chunk
+
+        yield ZipChunk(lambda _: self.update_data_ptr(self.archive_footer()))
 
     def update_data_ptr(self, data):
         """
@@ -246,12 +397,11 @@ class ZipStream(object):
         self.data_ptr += len(data)
         return data
 
-
-    def zip_file(self, filename, arcname):
+    def zip_entry(self, zinfo):
         """
-        Generates data to add the file 'filename' with name 'archname'
+        Generates the chunks to add a file or a buffer to the archive
 
-        This function generates the data corresponding to the fields:
+        This function generates the chunks corresponding to the fields:
 
         [local file header n]
         [file data n]
@@ -260,91 +410,84 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
-        zinfo.header_offset = self.data_ptr
-        yield self.update_data_ptr(zinfo.FileHeader())
+        def file_header(_):
+            zinfo.header_offset = self.data_ptr
+            zinfo.compress_size = 0
+            return self.update_data_ptr(zinfo.FileHeader())
 
-        if zinfo.compress_type == ZIP_DEFLATED:
-            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
-        else:
-            cmpr = None
+        def file_data(data):
+            zinfo.compress_size += len(data)
+            return self.update_data_ptr(data)
 
-        with open(filename, "rb") as fp:
-            while 1:
-                buf = fp.read(1024 * 8)
-                if not buf:
-                    break
-                zinfo.file_size += len(buf)
-                zinfo.CRC = binascii.crc32(buf, zinfo.CRC)
-                if cmpr:
-                    buf = cmpr.compress(buf)
-                    zinfo.compress_size += len(buf)
-                yield self.update_data_ptr(buf)
-
-        if cmpr:
-            buf = cmpr.flush()
-            zinfo.compress_size += len(buf)
-            yield self.update_data_ptr(buf)
-        else:
-            zinfo.compress_size = zinfo.file_size
+        def data_descriptor(_):
+            if zinfo.expected_file_size is not None and zinfo.file_size != zinfo.expected_file_size:
+                raise IOError("The size of %s changed during the creation of the archive" % zinfo.filename)
 
-        yield self.update_data_ptr(zinfo.DataDescriptor())
+            self.filelist.append(zinfo)
+            return self.update_data_ptr(zinfo.DataDescriptor())
 
-        self.filelist.append(zinfo)
-
-
-    def zip_buf(self, filebuf, arcname):
-        """
-        Generates data to add the filebuf 'filebuf' as file with name 'arcname'
+        yield ZipChunk(file_header)
 
-        This function generates the data corresponding to the fields:
+        if zinfo.data is not None:
+            yield ZipChunk(lambda _: file_data(zinfo.data))
+        else:
+            for chunk in self.zip_file(zinfo, file_data):
+                yield chunk
 
-        [local file header n]
-        [file data n]
-        [data descriptor n]
+        yield ZipChunk(data_descriptor)
 
-        as described in section V. of the PKZIP Application Note:
-        http://www.pkware.com/business_and_developers/developer/appnote/
+    def zip_file(self, zinfo, file_data):
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
-        zinfo.header_offset = self.data_ptr
+        Generates the chunks of the data of a file that is read sequentially
+        while the chunks are generated
+        """
+        zinfo.file_size = 0
+        zinfo.CRC = 0
 
-        yield self.update_data_ptr(zinfo.FileHeader())
+        with self.open_file(zinfo.path) as fp:
+            buf = fp.read(self.chunk_size)
+            while buf:
+                zinfo.file_size += len(buf)
+                zinfo.CRC = binascii.crc32(buf, zinfo.CRC) & 0xffffffff
 
-        if zinfo.compress_type == ZIP_DEFLATED:
-            cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
-        else:
-            cmpr = None
+                next_buf = fp.read(self.chunk_size)
 
-        zinfo.file_size = len(filebuf)
-        zinfo.CRC = binascii.crc32(filebuf, zinfo.CRC)
+                if zinfo.compress_type == ZIP_DEFLATED:
+                    yield ZipChunk(file_data, compress_chunk, buf, not next_buf)
+                else:
+                    yield ZipChunk(lambda _, buf=buf: file_data(buf))
 
-        if isinstance(filebuf, unicode):
-            buf = filebuf.encode('utf-8')
-        else:
-            buf = filebuf
+                buf = next_buf
 
-        if cmpr:
-            buf = cmpr.compress(buf)
-            zinfo.compress_size += len(buf)
+        if zinfo.compress_type == ZIP_DEFLATED and not zinfo.file_size:
+            yield ZipChunk(file_data, compress_chunk, b'', True)
 
-        yield self.update_data_ptr(buf)
+    def end_records(self, count, offset, size):
+        """
+        Return the end of central directory records of a central directory
+        of count entries starting at offset and of the specified size
+        """
+        if count > ZIP_FILECOUNT_LIMIT or offset > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            # Need to write the ZIP64 end-of-archive records
+            zip64endrec = struct.pack(structEndArchive64, stringEndArchive64,
+                                      44, 45, 45, 0, 0, count, count, size, offset)
 
-        if cmpr:
-            buf = cmpr.flush()
-            zinfo.compress_size += len(buf)
-            yield self.update_data_ptr(buf)
-        else:
-            zinfo.compress_size = zinfo.file_size
+            zip64locrec = struct.pack(structEndArchive64Locator,
+                                      stringEndArchive64Locator, 0, offset + size, 1)
+
+            endrec = struct.pack(structEndArchive, stringEndArchive,
+                                 0, 0, min(count, 0xffff), min(count, 0xffff),
+                                 min(size, 0xffffffff), min(offset, 0xffffffff), 0)
 
-        yield self.update_data_ptr(zinfo.DataDescriptor())
+            return zip64endrec + zip64locrec + endrec
 
-        self.filelist.append(zinfo)
+        return struct.pack(structEndArchive, stringEndArchive,
+                           0, 0, count, count, size, offset, 0)
 
     def archive_footer(self):
         """
         Returns data to finish off an archive based on the files already
-        added via zip_file(...).  The data returned corresponds to the fields:
+        added via zip_entry(...).  The data returned corresponds to the fields:
 
         [archive decryption header]
         [archive extra data record]
@@ -356,75 +499,6 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        data = []
-        count = 0
-        pos1 = self.data_ptr
-        for zinfo in self.filelist:         # write central directory
-            count += 1
-            dt = zinfo.date_time
-            dosdate = (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
-            dostime = dt[3] << 11 | dt[4] << 5 | (dt[5] // 2)
-            extra = []
-            if zinfo.file_size > ZIP64_LIMIT or zinfo.compress_size > ZIP64_LIMIT:
-                extra.append(zinfo.file_size)
-                extra.append(zinfo.compress_size)
-                file_size = 0xffffffff     #-1
-                compress_size = 0xffffffff #-1
-            else:
-                file_size = zinfo.file_size
-                compress_size = zinfo.compress_size
-
-            if zinfo.header_offset > ZIP64_LIMIT:
-                extra.append(zinfo.header_offset)
-                header_offset = -1  # struct "l" format:  32 one bits
-            else:
-                header_offset = zinfo.header_offset
-
-            extra_data = zinfo.extra
-            if extra:
-                # Append a ZIP64 field to the extra's
-                extra_data = struct.pack('<hh' + 'q'*len(extra),1, 8*len(extra), *extra) + extra_data
-                extract_version = max(45, zinfo.extract_version)
-                create_version = max(45, zinfo.create_version)
-            else:
-                extract_version = zinfo.extract_version
-                create_version = zinfo.create_version
-
-            filename, flag_bits = zinfo._encodeFilenameFlags()
-
-            centdir = struct.pack(structCentralDir,
-                                  stringCentralDir, create_version,
-                                  zinfo.create_system, extract_version, zinfo.reserved,
-                                  flag_bits, zinfo.compress_type, dostime, dosdate,
-                                  zinfo.CRC, compress_size, file_size,
-                                  len(filename), len(extra_data), len(zinfo.comment),
-                                  0, zinfo.internal_attr, zinfo.external_attr,
-                                  header_offset)
-
-            data.append(self.update_data_ptr(centdir))
-            data.append(self.update_data_ptr(filename))
-            data.append(self.update_data_ptr(extra_data))
-            data.append(self.update_data_ptr(zinfo.comment))
-
-        pos2 = self.data_ptr
-        # Write end-of-zip-archive record
-        if pos1 > ZIP64_LIMIT:
-            # Need to write the ZIP64 end-of-archive records
-            zip64endrec = struct.pack(structEndArchive64, stringEndArchive64,
-                                      44, 45, 45, 0, 0, count, count, pos2 - pos1, pos1)
-            data.append( self.update_data_ptr(zip64endrec))
-
-            zip64locrec = struct.pack(structEndArchive64Locator,
-                                      stringEndArchive64Locator, 0, pos2, 1)
-            data.append( self.update_data_ptr(zip64locrec))
-
-            endrec = struct.pack(structEndArchive, stringEndArchive,
-                                 0, 0, count, count, pos2 - pos1, -1, 0)
-            data.append( self.update_data_ptr(endrec))
-
-        else:
-            endrec = struct.pack(structEndArchive, stringEndArchive,
-                                 0, 0, count, count, pos2 - pos1, pos1, 0)
-            data.append( self.update_data_ptr(endrec))
+        central_directory = ''.join(zinfo.CentralDirectory() for zinfo in self.filelist)
 
-        return ''.join(data)
+        return central_directory + self.end_records(len(self.filelist), self.data_ptr, len(central_directory))